@@ -17,6 +17,30 @@ init_model          = None
 train_config             = config_dir + 'al_train/retinanet_26e.py'
 uncertainty_infer_config = config_dir + 'al_inference/retinanet_uncertainty.py'
 diversity_infer_config   = config_dir + 'al_inference/retinanet_diversity.py'
+fused_infer_config       = config_dir + 'al_inference/retinanet_fused.py'
+# Centre heatmap head (PunctaCenterHead): al_train/puncta_center_26e.py with al_inference/puncta_center_uncertainty.py
+# and al_inference/puncta_center_fused.py, diversity then needs fused_inference = True
+
+# Single inference pass for uncertainty and diversity (uses fused_infer_config)
+fused_inference = False
+
+# Persistent per-image cache of unlabeled inference, keyed by checkpoint and inference config hash,
+# e.g. dict(root=work_dir + 'al_inference_cache', max_size_mb=8192)
+inference_cache = None
+
+# Format of unlabeled inference results: 'json' (COCO .bbox.json) or 'npz' (columnar .bbox.npz)
+result_format = 'json'
+
+# Format of the per-round label sets: 'json' (full COCO json files) or 'subset' (.subset.npz image
+# bitmaps over oracle_path, see mmdet.ppal.utils.coco_index.save_index_subset)
+annotation_format = 'json'
+
+# Rounds after the first start from the latest.pth of the previous round with a short schedule
+# (see mmdet.ppal.utils.warm_start.warm_start_config) instead of training from the pretrained backbone,
+# e.g. dict(max_epochs=6, warmup_iters=100, resume_optimizer=True, resume_ema=True, new_image_repeat=3)
+warm_start = None
+# output_dir of a cold start run with the same labeled sets, to log the time saved per round
+cold_start_dir = None
 
 # Active learning setting
 round_num             = 4
@@ -33,10 +57,19 @@ uncertainty_sampler_config = dict(
     class_weight_ub=0.2,
     class_weight_alpha=0.3, #0.1 
     dataset_type='coco')
+# reuse image pair distances across rounds; policy='frozen' when the diversity embeddings
+# come from a frozen extractor, 'recompute' to only refresh the cache
+# e.g. dict(path=work_dir + 'image_distance_cache.npz', policy='frozen')
+distance_cache = None
 diversity_sampler_config = dict(
     type='DiversitySampler',
     n_sample_images=5,
     oracle_annotation_path=oracle_path,
-    dataset_type='coco')
+    dataset_type='coco',
+    score_thr=0.03,
+    # 'exact' (dense kmeans), or 'fasterpam' / 'clara' for large pools; with fused_inference
+    # the scalable backends compute distances blockwise instead of building the dense matrix
+    clustering='exact',
+    distance_cache=distance_cache)
 
 output_dir  = work_dir + 'active_learning_results_labelled1'
\ No newline at end of file
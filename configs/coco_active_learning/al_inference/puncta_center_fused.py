@@ -0,0 +1,13 @@
+_base_ = "./puncta_center_uncertainty.py"
+
+# One pass over the unlabeled set: per-box uncertainties for DCUSSampler and
+# cached embeddings for DiversitySampler (see PunctaCenterHeadUncertaintyFeat)
+model = dict(
+    bbox_head=dict(
+        type='PunctaCenterHeadUncertaintyFeat',
+        total_images=1811,
+        max_det=100,
+        feat_dim=256,
+        output_path=''
+    ),
+)
@@ -0,0 +1,20 @@
+_base_ = "../al_train/puncta_center_26e.py"
+
+model = dict(
+    type='ALRetinaNet',
+    bbox_head=dict(type='PunctaCenterHeadUncertainty'),
+    test_cfg=dict(topk=200, max_per_img=200)
+)
+data_root = 'data_puncta/puncta/'
+data = dict(
+    test=dict(
+        # images are all 128x128, so inference stacks many of them per forward pass
+        samples_per_gpu=32,
+        type='ALPunctaDataset',
+        ann_file='/home/djones/puncta_det/data_puncta/puncta/annotations/instances_train.json',
+        img_prefix=data_root + 'train/',
+        # keeps the dataset image ids in the img_metas, the file names are not the ids
+        pipeline={{_base_.al_test_pipeline}},
+    )
+)
+unlabeled_data = '/home/djones/puncta_det/data_puncta/active_learning/coco_600_unlabeled_1.json'
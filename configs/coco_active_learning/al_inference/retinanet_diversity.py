@@ -4,6 +4,7 @@ model = dict(
     type='ALRetinaNet',
     bbox_head=dict(
         type='RetinaHeadFeat',
+        batched_test=True,
         total_images=1811,  
         max_det=100,
         feat_dim=256,
@@ -4,6 +4,7 @@ model = dict(
     type='ALRetinaNet',
     bbox_head=dict(
         type='RetinaHeadUncertainty',
+        batched_test=True,
     ),
     test_cfg=dict(
         nms_pre=1000,
@@ -0,0 +1,34 @@
+_base_ = "./retinanet_26e.py"
+
+# Centre heatmap head on the stride 4 output of the FPN (PunctaCenterHead) instead of
+# 9 anchors on 5 levels; tools/analysis_tools/benchmark_center_head.py compares the two
+model = dict(
+    _delete_=True,
+    type='RetinaNet',
+    backbone=dict(
+        type='ResNet',
+        depth=50,
+        num_stages=4,
+        out_indices=(0, 1, 2, 3),
+        frozen_stages=1,
+        norm_cfg=dict(type='BN', requires_grad=False),
+        norm_eval=True,
+        style='pytorch',
+        init_cfg=dict(type='Pretrained', checkpoint='/home/djones/puncta_det/data_puncta/resnet50-19c8e357.pth')),
+    neck=dict(
+        type='FPN',
+        in_channels=[256, 512, 1024, 2048],
+        out_channels=256,
+        start_level=0,
+        num_outs=4),
+    bbox_head=dict(
+        type='PunctaCenterHead',
+        num_classes=1,
+        in_channel=256,
+        feat_channel=64,
+        in_index=0,
+        loss_center_heatmap=dict(type='GaussianFocalLoss', loss_weight=1.0),
+        loss_wh=dict(type='L1Loss', loss_weight=0.1),
+        loss_offset=dict(type='L1Loss', loss_weight=1.0)),
+    train_cfg=None,
+    test_cfg=dict(topk=100, local_maximum_kernel=3, score_thr=0.01, max_per_img=100))
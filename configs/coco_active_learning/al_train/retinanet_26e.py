@@ -19,7 +19,7 @@ data = dict(
     ),
 )
 
-evaluation=dict(interval=1, metric='bbox') #changed from 99999
+evaluation=dict(interval=1, metric='bbox_fast') #changed from 99999, full COCOeval runs once per round
 optimizer = dict(type="SGD", lr=0.001, momentum=0.9, weight_decay=0.0005) #changed for puncta 0.001 0.00001
 optimizer_config = dict(_delete_=True, grad_clip=dict(max_norm=10, norm_type=2)) #changed for puncta
 
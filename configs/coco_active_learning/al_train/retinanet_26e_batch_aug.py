@@ -0,0 +1,24 @@
+_base_ = "retinanet_26e.py"
+
+# Flip, rotate, jitter and normalize whole training batches on the device (BatchAugRetinaNet),
+# the data workers then only decode, pad and collate uint8 images. Same augmentations as the
+# per-image train_pipeline of the base; the inference configs keep the plain ALRetinaNet
+model = dict(
+    type='BatchAugRetinaNet',
+    batch_augments=dict(
+        img_norm_cfg={{_base_.img_norm_cfg}},
+        flip_ratio=0.5,
+        rotate_level=15,
+        rotate_prob=0.5,
+        color_jitter=dict(brightness=0.2, contrast=0.2, saturation=0.2, hue=0.2)))
+
+train_pipeline = [
+    {{_base_.load_image}},
+    dict(type='LoadAnnotations', with_bbox=True),
+    dict(type='Pad', size_divisor=32),
+    dict(type='DefaultFormatBundle'),
+    # flip, flip_direction and img_norm_cfg are set by BatchAugment
+    dict(type='Collect', keys=['img', 'gt_bboxes', 'gt_labels'],
+         meta_keys=('filename', 'ori_filename', 'ori_shape', 'img_shape', 'pad_shape', 'scale_factor')),
+]
+data = dict(train=dict(pipeline=train_pipeline))
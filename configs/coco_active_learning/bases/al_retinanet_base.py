@@ -8,9 +8,15 @@ _base_ = [
 dataset_type = 'ALPunctaDataset'
 data_root = '/home/djones/puncta_det/data_puncta/puncta/'
 
+# Packed image stores read instead of decoding the .bmp files, built with
+# tools/dataset_converters/build_image_store.py, e.g. [data_root + 'train_store', data_root + 'val_store']
+image_stores = None
+load_image = dict(type='LoadImageFromFile') if image_stores is None else \
+    dict(type='LoadImageFromStore', store=image_stores)
+
 img_norm_cfg = dict(mean=[123.675, 116.28, 103.53], std=[58.395, 57.12, 57.375], to_rgb=True)
 train_pipeline = [
-    dict(type='LoadImageFromFile'),
+    load_image,
     dict(type='LoadAnnotations', with_bbox=True),
     dict(type='RandomFlip', flip_ratio=0.5),
     dict(type='RandomRotate', level=15, prob=0.5),  # Rotate images
@@ -22,7 +28,7 @@ train_pipeline = [
 ]
 
 test_pipeline = [
-    dict(type='LoadImageFromFile'),
+    load_image,
     dict(
         type='MultiScaleFlipAug',
         img_scale=(128, 128), 
@@ -36,6 +42,26 @@ test_pipeline = [
             dict(type='Collect', keys=['img']),
         ])
 ]
+# AL inference pipeline (used by al_retinanet_inference_base.py), keeps the dataset image id in the
+# img_metas for the feature heads, images fed without a dataset get DefaultImageId's -1
+al_test_pipeline = [
+    load_image,
+    dict(type='DefaultImageId'),
+    dict(
+        type='MultiScaleFlipAug',
+        img_scale=(128, 128),
+        flip=False,
+        transforms=[
+            dict(type='Resize', keep_ratio=True),
+            dict(type='RandomFlip'),
+            dict(type='Normalize', **img_norm_cfg),
+            dict(type='Pad', size_divisor=32),
+            dict(type='ImageToTensor', keys=['img']),
+            dict(type='Collect', keys=['img'],
+                 meta_keys=('filename', 'ori_filename', 'ori_shape', 'img_shape', 'pad_shape',
+                            'scale_factor', 'flip', 'flip_direction', 'img_norm_cfg', 'img_id')),
+        ])
+]
 
 data = dict(
     samples_per_gpu=1,
@@ -57,6 +83,16 @@ data = dict(
         pipeline=test_pipeline))
 
 
+# training time to each validation result, see mmdet.ppal.utils.running_checks.display_time_to_accuracy;
+# best.pth is kept and a round stops once bbox_mAP has not improved for `patience` evaluations
+# after epoch `start`, the AL loop then uses best.pth. Priority 80 runs both after the EvalHook
+# and before the logger hooks clear the results
+early_stopping = dict(monitor='bbox_mAP', patience=4, start=13)
+custom_hooks = [
+    dict(type='NumClassCheckHook'),
+    dict(type='TimeToAccuracyHook', priority=80),
+] + ([] if early_stopping is None else [dict(type='EarlyStoppingHook', priority=80, **early_stopping)])
+
 log_config = dict(
     interval=10, #changes for puncta
     hooks=[
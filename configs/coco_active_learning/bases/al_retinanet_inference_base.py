@@ -2,8 +2,11 @@ _base_ = "al_retinanet_base.py"
 data_root = 'data_puncta/puncta/'
 data = dict(
     test=dict(
+        # images are all 128x128, so inference stacks many of them per forward pass
+        samples_per_gpu=32,
         type='ALPunctaDataset',
         img_prefix=data_root + 'train/',
+        pipeline={{_base_.al_test_pipeline}},
     )
 )
 
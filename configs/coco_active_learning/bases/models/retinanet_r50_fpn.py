@@ -17,7 +17,8 @@ model = dict(
         out_channels=256,
         start_level=1,
         add_extra_convs='on_input',
-        num_outs=5),
+        num_outs=5,
+        active_levels=[0, 1, 2]),  # P6 / P7 (2x2 / 1x1 at 128x128) are too coarse for puncta
     bbox_head=dict(
         type='RetinaHead',
         num_classes=1, #change for puncta dataset
@@ -29,7 +30,10 @@ model = dict(
             octave_base_scale=3,
             scales_per_octave=3,
             ratios=[0.5, 1.0, 2.0],
-            strides=[8, 16, 32, 64, 128]),
+            strides=[8, 16, 32, 64, 128],
+            cache_size=8),  # priors and valid flags of the fixed 128x128 inputs are built once
+        active_levels=[0, 1, 2],  # anchors of strides 8 / 16 / 32 only
+        batched_targets=True,  # assign the anchors of all images of a batch at once
         bbox_coder=dict(
             type='DeltaXYWHBBoxCoder',
             target_means=[.0, .0, .0, .0],
@@ -2,11 +2,13 @@
 from .inference import (async_inference_detector, inference_detector,
                         init_detector, show_result_pyplot)
 from .test import multi_gpu_test, single_gpu_test
+from .tiled_inference import inference_detector_tiled, iter_tiles
 from .train import (get_root_logger, init_random_seed, set_random_seed,
                     train_detector)
 
 __all__ = [
     'get_root_logger', 'set_random_seed', 'train_detector', 'init_detector',
     'async_inference_detector', 'inference_detector', 'show_result_pyplot',
-    'multi_gpu_test', 'single_gpu_test', 'init_random_seed'
+    'multi_gpu_test', 'single_gpu_test', 'init_random_seed',
+    'inference_detector_tiled', 'iter_tiles'
 ]
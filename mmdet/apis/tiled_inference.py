@@ -0,0 +1,150 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import mmcv
+import numpy as np
+import torch
+from mmcv.ops import batched_nms
+
+from .inference import inference_detector
+
+
+def tile_grid(length, tile, overlap):
+    """Tile starts along one axis and the range each tile owns.
+
+    Tiles of size ``tile`` are placed every ``tile - overlap`` pixels, the
+    last one flush with the border. Each tile owns the pixels up to the
+    middle of its overlaps with its neighbours, so the owned ranges
+    partition ``[0, length)``.
+
+    Args:
+        length (int): Image size along the axis.
+        tile (int): Tile size along the axis.
+        overlap (int): Minimum overlap of neighbouring tiles.
+
+    Returns:
+        tuple[ndarray]: ``starts``, and ``owned_lo`` / ``owned_hi`` bounds
+            of the owned ranges.
+    """
+    tile = min(tile, length)
+    stride = tile - min(overlap, tile - 1)
+    starts = np.arange(0, max(length - tile, 0) + 1, stride)
+    if starts[-1] + tile < length:
+        starts = np.append(starts, length - tile)
+    seams = (starts[1:] + starts[:-1] + tile) / 2
+    owned_lo = np.concatenate([[-np.inf], seams])
+    owned_hi = np.concatenate([seams, [np.inf]])
+    return starts, owned_lo, owned_hi
+
+
+def iter_tiles(img, tile_size=(128, 128), overlap=(32, 32)):
+    """Overlapping tiles of an image, row by row.
+
+    Tiles are views of ``img``, nothing is copied; for a ``np.memmap`` only
+    the rows of a tile are read when the tile is used.
+
+    Args:
+        img (ndarray): ``[H, W]`` or ``[H, W, C]`` image.
+        tile_size (tuple[int]): ``(h, w)`` of the tiles.
+        overlap (tuple[int]): ``(h, w)`` overlap of neighbouring tiles.
+
+    Yields:
+        tuple: ``tile``, its top-left ``(x, y)`` and the ``(x1, y1, x2, y2)``
+            region it owns (see :func:`tile_grid`).
+    """
+    height, width = img.shape[:2]
+    ys, y_lo, y_hi = tile_grid(height, tile_size[0], overlap[0])
+    xs, x_lo, x_hi = tile_grid(width, tile_size[1], overlap[1])
+    tile_h, tile_w = min(tile_size[0], height), min(tile_size[1], width)
+    for i, y in enumerate(ys):
+        for j, x in enumerate(xs):
+            yield img[y:y + tile_h, x:x + tile_w], (x, y), \
+                (x_lo[j], y_lo[i], x_hi[j], y_hi[i])
+
+
+def inference_detector_tiled(model,
+                             img,
+                             tile_size=(128, 128),
+                             overlap=(32, 32),
+                             batch_size=32,
+                             merge='nms',
+                             nms_cfg=None):
+    """Inference a large image with the detector, tile by tile.
+
+    The image is cut into overlapping tiles of the size the model was
+    trained on (:func:`iter_tiles`), which go through the model in batches
+    of ``batch_size`` with :func:`inference_detector`. Only one batch of
+    tiles is in memory at a time, so a large image can be passed as a
+    ``np.memmap`` (e.g. ``np.load(path, mmap_mode='r')``) and is read
+    batch by batch. The boxes are shifted to image coordinates and the
+    duplicates of the objects at tile seams are merged with:
+
+    - ``'nms'``: one class-aware NMS over all boxes of the image.
+    - ``'centroid'``: each tile keeps the boxes whose centres fall in the
+      region it owns. It needs an overlap of at least the object size,
+      so that every object is whole in the tile that owns its centre.
+
+    Args:
+        model (nn.Module): The loaded detector.
+        img (str | ndarray): Image file or loaded image.
+        tile_size (tuple[int]): ``(h, w)`` of the tiles.
+        overlap (tuple[int]): ``(h, w)`` overlap of neighbouring tiles.
+        batch_size (int): Tiles per forward pass.
+        merge (str): ``'nms'`` or ``'centroid'``.
+        nms_cfg (dict, optional): NMS of ``merge='nms'``. Defaults to the
+            ``nms`` of the model ``test_cfg``, or an IoU 0.5 NMS when the
+            ``test_cfg`` has none.
+
+    Returns:
+        list[ndarray]: Detections of each class in image coordinates, as
+            :func:`inference_detector`.
+    """
+    assert merge in ('nms', 'centroid'), f'unknown merge {merge}'
+    if isinstance(img, str):
+        img = mmcv.imread(img)
+
+    results = []
+
+    def run(batch):
+        tile_results = inference_detector(model,
+                                          [tile for tile, _, _ in batch])
+        for (_, (x, y), owned), tile_result in zip(batch, tile_results):
+            shifted = []
+            for dets in tile_result:
+                dets = dets.copy()
+                dets[:, [0, 2]] += x
+                dets[:, [1, 3]] += y
+                if merge == 'centroid':
+                    cx = (dets[:, 0] + dets[:, 2]) / 2
+                    cy = (dets[:, 1] + dets[:, 3]) / 2
+                    dets = dets[(cx >= owned[0]) & (cy >= owned[1]) &
+                                (cx < owned[2]) & (cy < owned[3])]
+                shifted.append(dets)
+            results.append(shifted)
+
+    batch = []
+    for tile in iter_tiles(img, tile_size, overlap):
+        batch.append(tile)
+        if len(batch) == batch_size:
+            run(batch)
+            batch = []
+    if len(batch) > 0:
+        run(batch)
+
+    dets = [np.concatenate(cls_dets) for cls_dets in zip(*results)]
+    if merge == 'nms':
+        if nms_cfg is None:
+            # heads without box NMS (e.g. PunctaCenterHead) have no test_cfg
+            # nms, their duplicates at the seams get the default one
+            test_cfg = model.cfg.model.get('test_cfg') or dict()
+            nms_cfg = test_cfg.get('nms', dict(type='nms', iou_threshold=0.5))
+        labels = np.concatenate(
+            [np.full(len(cls_dets), i) for i, cls_dets in enumerate(dets)])
+        all_dets = np.concatenate(dets)
+        if len(all_dets) > 0:
+            _, keep = batched_nms(
+                torch.from_numpy(all_dets[:, :4]).float(),
+                torch.from_numpy(all_dets[:, 4]).float(),
+                torch.from_numpy(labels), nms_cfg)
+            keep = keep.numpy()
+            all_dets, labels = all_dets[keep], labels[keep]
+        dets = [all_dets[labels == i] for i in range(len(dets))]
+    return dets
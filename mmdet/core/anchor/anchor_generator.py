@@ -1,5 +1,6 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 import warnings
+from collections import OrderedDict
 
 import mmcv
 import numpy as np
@@ -38,6 +39,11 @@ class AnchorGenerator:
             float is given, they will be used to shift the centers of anchors.
         center_offset (float): The offset of center in proportion to anchors'
             width and height. By default it is 0 in V2.0.
+        cache_size (int): Number of results of :meth:`grid_priors` and
+            :meth:`valid_flags` kept in a least recently used cache, keyed by
+            the feature map sizes, pad shape, dtype and device. The cached
+            tensors are shared by all callers, which must not modify them
+            in place. Default: 0, which means no cache.
 
     Examples:
         >>> from mmdet.core import AnchorGenerator
@@ -58,6 +64,11 @@ class AnchorGenerator:
         tensor([[-9., -9., 9., 9.]])]
     """
 
+    # generators that do not call `AnchorGenerator.__init__` have no cache
+    cache_size = 0
+    cache_hits = 0
+    cache_misses = 0
+
     def __init__(self,
                  strides,
                  ratios,
@@ -67,7 +78,8 @@ class AnchorGenerator:
                  octave_base_scale=None,
                  scales_per_octave=None,
                  centers=None,
-                 center_offset=0.):
+                 center_offset=0.,
+                 cache_size=0):
         # check center and center_offset
         if center_offset != 0:
             assert centers is None, 'center cannot be set when center_offset' \
@@ -111,6 +123,37 @@ class AnchorGenerator:
         self.centers = centers
         self.center_offset = center_offset
         self.base_anchors = self.gen_base_anchors()
+        self.cache_size = cache_size
+        self._prior_cache = OrderedDict()
+
+    def _cached(self, key, generate):
+        """Multi-level tensors of ``generate()``, memoized under ``key``."""
+        if self.cache_size <= 0:
+            return generate()
+        if key in self._prior_cache:
+            self.cache_hits += 1
+            self._prior_cache.move_to_end(key)
+        else:
+            self.cache_misses += 1
+            self._prior_cache[key] = generate()
+            if len(self._prior_cache) > self.cache_size:
+                self._prior_cache.popitem(last=False)
+        return list(self._prior_cache[key])
+
+    def cache_info(self):
+        """dict: Hits, misses and current and maximum size of the cache."""
+        return dict(
+            hits=self.cache_hits,
+            misses=self.cache_misses,
+            size=len(self._prior_cache) if self.cache_size > 0 else 0,
+            maxsize=self.cache_size)
+
+    def clear_cache(self):
+        """Empty the cache and reset its counters."""
+        if self.cache_size > 0:
+            self._prior_cache.clear()
+        self.cache_hits = 0
+        self.cache_misses = 0
 
     @property
     def num_base_anchors(self):
@@ -231,12 +274,18 @@ class AnchorGenerator:
                 num_base_anchors is the number of anchors for that level.
         """
         assert self.num_levels == len(featmap_sizes)
-        multi_level_anchors = []
-        for i in range(self.num_levels):
-            anchors = self.single_level_grid_priors(
-                featmap_sizes[i], level_idx=i, dtype=dtype, device=device)
-            multi_level_anchors.append(anchors)
-        return multi_level_anchors
+
+        def generate():
+            multi_level_anchors = []
+            for i in range(self.num_levels):
+                anchors = self.single_level_grid_priors(
+                    featmap_sizes[i], level_idx=i, dtype=dtype, device=device)
+                multi_level_anchors.append(anchors)
+            return multi_level_anchors
+
+        key = ('priors', tuple(tuple(size) for size in featmap_sizes), dtype,
+               torch.device(device))
+        return self._cached(key, generate)
 
     def single_level_grid_priors(self,
                                  featmap_size,
@@ -402,19 +451,25 @@ class AnchorGenerator:
             list(torch.Tensor): Valid flags of anchors in multiple levels.
         """
         assert self.num_levels == len(featmap_sizes)
-        multi_level_flags = []
-        for i in range(self.num_levels):
-            anchor_stride = self.strides[i]
-            feat_h, feat_w = featmap_sizes[i]
-            h, w = pad_shape[:2]
-            valid_feat_h = min(int(np.ceil(h / anchor_stride[1])), feat_h)
-            valid_feat_w = min(int(np.ceil(w / anchor_stride[0])), feat_w)
-            flags = self.single_level_valid_flags((feat_h, feat_w),
-                                                  (valid_feat_h, valid_feat_w),
-                                                  self.num_base_anchors[i],
-                                                  device=device)
-            multi_level_flags.append(flags)
-        return multi_level_flags
+
+        def generate():
+            multi_level_flags = []
+            for i in range(self.num_levels):
+                anchor_stride = self.strides[i]
+                feat_h, feat_w = featmap_sizes[i]
+                h, w = pad_shape[:2]
+                valid_feat_h = min(int(np.ceil(h / anchor_stride[1])), feat_h)
+                valid_feat_w = min(int(np.ceil(w / anchor_stride[0])), feat_w)
+                flags = self.single_level_valid_flags(
+                    (feat_h, feat_w), (valid_feat_h, valid_feat_w),
+                    self.num_base_anchors[i],
+                    device=device)
+                multi_level_flags.append(flags)
+            return multi_level_flags
+
+        key = ('flags', tuple(tuple(size) for size in featmap_sizes),
+               tuple(pad_shape[:2]), torch.device(device))
+        return self._cached(key, generate)
 
     def single_level_valid_flags(self,
                                  featmap_size,
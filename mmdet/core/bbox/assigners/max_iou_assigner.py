@@ -211,3 +211,144 @@ class MaxIoUAssigner(BaseAssigner):
 
         return AssignResult(
             num_gts, assigned_gt_inds, max_overlaps, labels=assigned_labels)
+
+    def assign_batched(self,
+                       bboxes,
+                       gt_bboxes,
+                       gt_valid,
+                       bbox_valid=None,
+                       gt_bboxes_ignore=None,
+                       ignore_valid=None,
+                       gt_labels=None):
+        """Assign gt to the bboxes of a batch of images at once.
+
+        Same assignment as :meth:`assign` image by image, on the overlaps of
+        all images in one (B, k, n) tensor. The gts of each image are padded
+        to the same number ``k``; the padding rows and the bboxes out of
+        ``bbox_valid`` are masked out of every maximum. If an image has more
+        than ``gpu_assign_thr`` gts, the whole batch is assigned on CPU.
+
+        Args:
+            bboxes (Tensor): Bounding boxes of each image, shape (B, n, 4).
+            gt_bboxes (Tensor): Groundtruth boxes of each image, padded to
+                the same number, shape (B, k, 4) with k >= 1.
+            gt_valid (Tensor): Whether each of ``gt_bboxes`` is a gt and not
+                padding, shape (B, k).
+            bbox_valid (Tensor, optional): The bboxes to assign, shape (B, n).
+                The others are assigned as if they were not in ``bboxes``,
+                and get -1.
+            gt_bboxes_ignore (Tensor, optional): Padded bboxes labelled as
+                `ignored`, shape (B, m, 4).
+            ignore_valid (Tensor, optional): Whether each of
+                ``gt_bboxes_ignore`` is not padding, shape (B, m).
+            gt_labels (Tensor, optional): Padded labels of gt_bboxes,
+                shape (B, k).
+
+        Returns:
+            tuple[Tensor]: ``gt_inds``, ``max_overlaps`` and ``labels`` (None
+                without ``gt_labels``) of each bbox as in
+                :obj:`AssignResult`, shape (B, n).
+        """
+        num_imgs, num_bboxes = bboxes.shape[:2]
+        num_gts = gt_valid.sum(dim=1)
+        assign_on_cpu = (self.gpu_assign_thr > 0) and (
+            num_gts.max().item() > self.gpu_assign_thr)
+        if assign_on_cpu:
+            device = bboxes.device
+            bboxes, gt_bboxes, gt_valid, num_gts = bboxes.cpu(), \
+                gt_bboxes.cpu(), gt_valid.cpu(), num_gts.cpu()
+            if bbox_valid is not None:
+                bbox_valid = bbox_valid.cpu()
+            if gt_bboxes_ignore is not None:
+                gt_bboxes_ignore = gt_bboxes_ignore.cpu()
+                ignore_valid = ignore_valid.cpu()
+            if gt_labels is not None:
+                gt_labels = gt_labels.cpu()
+
+        overlaps = self.iou_calculator(gt_bboxes, bboxes)
+
+        if (self.ignore_iof_thr > 0 and gt_bboxes_ignore is not None
+                and gt_bboxes_ignore.numel() > 0):
+            if self.ignore_wrt_candidates:
+                ignore_overlaps = self.iou_calculator(
+                    bboxes, gt_bboxes_ignore, mode='iof')
+                ignore_overlaps.masked_fill_(~ignore_valid[:, None, :],
+                                             -float('inf'))
+                ignore_max_overlaps, _ = ignore_overlaps.max(dim=2)
+            else:
+                ignore_overlaps = self.iou_calculator(
+                    gt_bboxes_ignore, bboxes, mode='iof')
+                ignore_overlaps.masked_fill_(~ignore_valid[:, :, None],
+                                             -float('inf'))
+                ignore_max_overlaps, _ = ignore_overlaps.max(dim=1)
+            ignored = ignore_max_overlaps > self.ignore_iof_thr
+            overlaps.masked_fill_(ignored[:, None, :], -1)
+
+        # padding gts and left out bboxes never reach a maximum
+        overlaps.masked_fill_(~gt_valid[:, :, None], -float('inf'))
+        if bbox_valid is not None:
+            overlaps.masked_fill_(~bbox_valid[:, None, :], -float('inf'))
+
+        # 1. assign -1 by default
+        assigned_gt_inds = overlaps.new_full((num_imgs, num_bboxes),
+                                             -1,
+                                             dtype=torch.long)
+
+        # for each bbox, the max iou of all gts and which gt it is
+        max_overlaps, argmax_overlaps = overlaps.max(dim=1)
+        # for each gt, the max iou of all bboxes and which bbox it is
+        gt_max_overlaps, gt_argmax_overlaps = overlaps.max(dim=2)
+
+        # 2. assign negative: below
+        if isinstance(self.neg_iou_thr, float):
+            assigned_gt_inds[(max_overlaps >= 0)
+                             & (max_overlaps < self.neg_iou_thr)] = 0
+        elif isinstance(self.neg_iou_thr, tuple):
+            assert len(self.neg_iou_thr) == 2
+            assigned_gt_inds[(max_overlaps >= self.neg_iou_thr[0])
+                             & (max_overlaps < self.neg_iou_thr[1])] = 0
+
+        # 3. assign positive: above positive IoU threshold
+        pos_inds = max_overlaps >= self.pos_iou_thr
+        assigned_gt_inds[pos_inds] = argmax_overlaps[pos_inds] + 1
+
+        if self.match_low_quality:
+            # 4. each gt takes its nearest bboxes; as the loop over the gts
+            # of `assign_wrt_overlaps`, the last gt wins a shared bbox
+            matched = gt_valid & (gt_max_overlaps >= self.min_pos_iou)
+            if self.gt_max_assign_all:
+                max_iou_bboxes = overlaps == gt_max_overlaps[:, :, None]
+            else:
+                max_iou_bboxes = torch.arange(
+                    num_bboxes, device=overlaps.device
+                ) == gt_argmax_overlaps[:, :, None]
+            gt_ids = torch.arange(
+                1, overlaps.size(1) + 1, device=overlaps.device)
+            low_quality_inds, _ = (
+                (max_iou_bboxes & matched[:, :, None]) *
+                gt_ids[None, :, None]).max(dim=1)
+            assigned_gt_inds = torch.where(low_quality_inds > 0,
+                                           low_quality_inds, assigned_gt_inds)
+
+        # images without gts: everything to background
+        no_gts = num_gts == 0
+        assigned_gt_inds[no_gts] = 0
+        max_overlaps[no_gts] = 0
+        if bbox_valid is not None:
+            assigned_gt_inds[~bbox_valid] = -1
+            max_overlaps[~bbox_valid] = 0
+
+        if gt_labels is not None:
+            assigned_labels = torch.where(
+                assigned_gt_inds > 0,
+                gt_labels.gather(1, (assigned_gt_inds - 1).clamp(min=0)),
+                assigned_gt_inds.new_tensor(-1))
+        else:
+            assigned_labels = None
+
+        if assign_on_cpu:
+            assigned_gt_inds = assigned_gt_inds.to(device)
+            max_overlaps = max_overlaps.to(device)
+            if assigned_labels is not None:
+                assigned_labels = assigned_labels.to(device)
+        return assigned_gt_inds, max_overlaps, assigned_labels
@@ -0,0 +1,95 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import os.path as osp
+
+import torch
+import torch.distributed as dist
+from mmcv.runner import get_dist_info
+from mmcv.runner.hooks import HOOKS, CheckpointHook, Hook
+
+
+@HOOKS.register_module()
+class EarlyStoppingHook(Hook):
+    """Keep the best checkpoint and stop training once the metric plateaus.
+
+    After every evaluation of ``EvalHook`` the ``monitor`` metric is
+    compared with the best one so far. An improvement saves the model as
+    ``best.pth`` in the work dir; after ``patience`` evaluations without
+    one, training stops at the end of the epoch, which is then saved as
+    if it were the last (``epoch_{}.pth`` and ``latest.pth``).
+
+    It must run after ``EvalHook`` and before the logger hooks, which
+    clear the evaluation results, i.e. with a priority between ``LOW``
+    and ``VERY_LOW``. Only epoch based training is supported.
+
+    Args:
+        monitor (str): Key of the evaluation results. Default: 'bbox_mAP'.
+        rule (str): 'greater' or 'less' is better. Default: 'greater'.
+        patience (int): Evaluations without improvement before stopping.
+            Default: 5.
+        min_delta (float): Smallest change counted as an improvement.
+            Default: 0.
+        start (int): Training does not stop before this epoch.
+            Default: 0.
+        save_best (bool): Whether to save ``best.pth``. Default: True.
+    """
+
+    rule_map = {'greater': lambda x, y: x > y, 'less': lambda x, y: x < y}
+
+    def __init__(self,
+                 monitor='bbox_mAP',
+                 rule='greater',
+                 patience=5,
+                 min_delta=0.,
+                 start=0,
+                 save_best=True):
+        assert rule in self.rule_map, f'rule must be one of {list(self.rule_map)}'
+        self.monitor = monitor
+        self.rule = rule
+        self.patience = patience
+        self.min_delta = min_delta
+        self.start = start
+        self.save_best = save_best
+
+    def before_run(self, runner):
+        self.best_score = None
+        self.best_epoch = None
+        self.wait = 0
+        self.meta = None
+        for hook in runner.hooks:
+            if isinstance(hook, CheckpointHook):
+                self.meta = hook.args.get('meta')
+
+    def _improved(self, score):
+        if self.best_score is None:
+            return True
+        delta = self.min_delta if self.rule == 'greater' else -self.min_delta
+        return self.rule_map[self.rule](score, self.best_score + delta)
+
+    def after_train_epoch(self, runner):
+        rank, world_size = get_dist_info()
+        stop = False
+        if rank == 0 and self.monitor in runner.log_buffer.output:
+            score = float(runner.log_buffer.output[self.monitor])
+            if self._improved(score):
+                self.best_score, self.best_epoch, self.wait = score, runner.epoch + 1, 0
+                if self.save_best:
+                    runner.save_checkpoint(
+                        runner.work_dir, filename_tmpl='best.pth', meta=self.meta, create_symlink=False)
+                runner.logger.info(f'Best {self.monitor} {score:.4f} at epoch {self.best_epoch}, '
+                                   f'saved to {osp.join(runner.work_dir, "best.pth")}')
+            else:
+                self.wait += 1
+            stop = self.wait >= self.patience and runner.epoch + 1 >= self.start
+        if world_size > 1:
+            # only rank 0 gets the evaluation results of DistEvalHook
+            flag = torch.tensor([int(stop)], device='cuda')
+            dist.broadcast(flag, 0)
+            stop = bool(flag.item())
+
+        if stop and runner.epoch + 1 < runner.max_epochs:
+            if rank == 0:
+                runner.logger.info(f'Early stopping at epoch {runner.epoch + 1}: no {self.monitor} improvement '
+                                   f'over {self.best_score:.4f} (epoch {self.best_epoch}) '
+                                   f'for {self.patience} evaluations')
+                runner.save_checkpoint(runner.work_dir, meta=self.meta)
+            runner._max_epochs = runner.epoch + 1
@@ -33,6 +33,19 @@ class AnchorHead(BaseDenseHead, BBoxTestMixin):
         loss_bbox (dict): Config of localization loss.
         train_cfg (dict): Training config of anchor head.
         test_cfg (dict): Testing config of anchor head.
+        active_levels (list[int], optional): Indices of the levels of
+            `anchor_generator` the head runs on. The anchors of the other
+            levels are not generated, so they take no part in the targets,
+            the loss and the post-processing. The head takes the features
+            of all levels, or of the active levels only (e.g. from an
+            `FPN` with the same `active_levels`). Default: None, which
+            means all levels.
+        batched_targets (bool): Whether :meth:`get_targets` assigns and
+            encodes the targets of all images at once
+            (:meth:`_get_targets_batched`) instead of image by image, with
+            the same results. It needs an assigner with `assign_batched`
+            (e.g. `MaxIoUAssigner`) and no sampling, and it does not call
+            :meth:`_get_targets_single`. Default: False.
         init_cfg (dict or list[dict], optional): Initialization config dict.
     """  # noqa: W605
 
@@ -59,6 +72,8 @@ class AnchorHead(BaseDenseHead, BBoxTestMixin):
                      type='SmoothL1Loss', beta=1.0 / 9.0, loss_weight=1.0),
                  train_cfg=None,
                  test_cfg=None,
+                 active_levels=None,
+                 batched_targets=False,
                  init_cfg=dict(type='Normal', layer='Conv2d', std=0.01)):
         super(AnchorHead, self).__init__(init_cfg)
         self.in_channels = in_channels
@@ -101,8 +116,24 @@ class AnchorHead(BaseDenseHead, BBoxTestMixin):
                 self.sampling = False
                 sampler_cfg = dict(type='PseudoSampler')
             self.sampler = build_sampler(sampler_cfg, context=self)
+        self.batched_targets = batched_targets
+        if self.batched_targets and self.train_cfg:
+            assert not self.sampling and hasattr(self.assigner,
+                                                 'assign_batched'), \
+                'batched_targets needs an assigner with `assign_batched` ' \
+                'and no sampling'
         self.fp16_enabled = False
 
+        self.active_levels = active_levels
+        if active_levels is not None:
+            self.active_levels = sorted(active_levels)
+            anchor_generator = anchor_generator.copy()
+            # per level arguments of the anchor generator
+            for key in ('strides', 'base_sizes', 'centers'):
+                if anchor_generator.get(key) is not None:
+                    anchor_generator[key] = [
+                        anchor_generator[key][i] for i in self.active_levels
+                    ]
         self.prior_generator = build_prior_generator(anchor_generator)
 
         # Usually the numbers of anchors for each level are the same
@@ -166,6 +197,9 @@ class AnchorHead(BaseDenseHead, BBoxTestMixin):
                     scale levels, each is a 4D-tensor, the channels number \
                     is num_base_priors * 4.
         """
+        if self.active_levels is not None and \
+                len(feats) > len(self.active_levels):
+            feats = [feats[i] for i in self.active_levels]
         return multi_apply(self.forward_single, feats)
 
     def get_anchors(self, featmap_sizes, img_metas, device='cuda'):
@@ -189,12 +223,16 @@ class AnchorHead(BaseDenseHead, BBoxTestMixin):
             featmap_sizes, device=device)
         anchor_list = [multi_level_anchors for _ in range(num_imgs)]
 
-        # for each image, we compute valid flags of multi level anchors
+        # valid flags of multi level anchors, computed once per pad shape and
+        # shared by the images of that shape
+        flags_per_shape = dict()
         valid_flag_list = []
         for img_id, img_meta in enumerate(img_metas):
-            multi_level_flags = self.prior_generator.valid_flags(
-                featmap_sizes, img_meta['pad_shape'], device)
-            valid_flag_list.append(multi_level_flags)
+            pad_shape = tuple(img_meta['pad_shape'][:2])
+            if pad_shape not in flags_per_shape:
+                flags_per_shape[pad_shape] = self.prior_generator.valid_flags(
+                    featmap_sizes, pad_shape, device)
+            valid_flag_list.append(flags_per_shape[pad_shape])
 
         return anchor_list, valid_flag_list
 
@@ -296,6 +334,141 @@ class AnchorHead(BaseDenseHead, BBoxTestMixin):
         return (labels, label_weights, bbox_targets, bbox_weights, pos_inds,
                 neg_inds, sampling_result)
 
+    def _get_targets_batched(self,
+                             flat_anchors,
+                             valid_flags,
+                             gt_bboxes_list,
+                             img_metas,
+                             num_level_anchors,
+                             gt_bboxes_ignore_list=None,
+                             gt_labels_list=None):
+        """Compute regression and classification targets for anchors in
+        multiple images at once.
+
+        Same targets as :meth:`_get_targets_single` image by image, with
+        `unmap_outputs=True` and no sampling. The gts of the images are
+        padded to the same number and assigned with the `assign_batched`
+        of the assigner, the positive anchors of all images are encoded in
+        one call of the bbox coder.
+
+        Args:
+            flat_anchors (Tensor): Multi-level anchors of each image,
+                concatenated into a tensor of shape (num_imgs, num_anchors, 4).
+            valid_flags (Tensor): Multi level valid flags of each image,
+                shape (num_imgs, num_anchors).
+            gt_bboxes_list (list[Tensor]): Ground truth bboxes of each image.
+            img_metas (list[dict]): Meta info of each image.
+            num_level_anchors (list[int]): Number of anchors of each level.
+            gt_bboxes_ignore_list (list[Tensor]): Ground truth bboxes to be
+                ignored.
+            gt_labels_list (list[Tensor]): Ground truth labels of each box.
+
+        Returns:
+            tuple: The targets of :meth:`get_targets`, or None if an image
+                has no valid anchors.
+        """
+        num_imgs, num_anchors = flat_anchors.shape[:2]
+        allowed_border = self.train_cfg.allowed_border
+        if allowed_border >= 0:
+            img_h, img_w = flat_anchors.new_tensor(
+                [img_meta['img_shape'][:2] for img_meta in img_metas]).t()
+            inside_flags = valid_flags & \
+                (flat_anchors[..., 0] >= -allowed_border) & \
+                (flat_anchors[..., 1] >= -allowed_border) & \
+                (flat_anchors[..., 2] < img_w[:, None] + allowed_border) & \
+                (flat_anchors[..., 3] < img_h[:, None] + allowed_border)
+        else:
+            inside_flags = valid_flags
+        if not inside_flags.any(dim=1).all():
+            return None
+
+        def pad(tensors, size):
+            # the tensors of each image padded to the same number of rows
+            lengths = torch.tensor([len(t) for t in tensors],
+                                   device=flat_anchors.device)
+            valid = torch.arange(
+                size, device=flat_anchors.device)[None] < lengths[:, None]
+            padded = tensors[0].new_zeros((num_imgs, size) +
+                                          tensors[0].shape[1:])
+            padded[valid] = torch.cat(tensors)
+            return padded, valid
+
+        max_gts = max(max(len(gt_bboxes) for gt_bboxes in gt_bboxes_list), 1)
+        gt_bboxes, gt_valid = pad(gt_bboxes_list, max_gts)
+        gt_labels = None
+        if gt_labels_list is not None:
+            gt_labels, _ = pad(gt_labels_list, max_gts)
+        gt_bboxes_ignore = ignore_valid = None
+        if gt_bboxes_ignore_list is not None and any(
+                gt_bboxes_ignore is not None and len(gt_bboxes_ignore) > 0
+                for gt_bboxes_ignore in gt_bboxes_ignore_list):
+            gt_bboxes_ignore_list = [
+                gt_bboxes_ignore if gt_bboxes_ignore is not None else
+                gt_bboxes.new_zeros((0, 4))
+                for gt_bboxes_ignore in gt_bboxes_ignore_list
+            ]
+            gt_bboxes_ignore, ignore_valid = pad(
+                gt_bboxes_ignore_list,
+                max(len(gt_bboxes_ignore)
+                    for gt_bboxes_ignore in gt_bboxes_ignore_list))
+
+        assigned_gt_inds, _, _ = self.assigner.assign_batched(
+            flat_anchors,
+            gt_bboxes,
+            gt_valid,
+            bbox_valid=inside_flags,
+            gt_bboxes_ignore=gt_bboxes_ignore,
+            ignore_valid=ignore_valid,
+            gt_labels=gt_labels)
+
+        bbox_targets = flat_anchors.new_zeros((num_imgs, num_anchors, 4))
+        bbox_weights = flat_anchors.new_zeros((num_imgs, num_anchors, 4))
+        labels = flat_anchors.new_full((num_imgs, num_anchors),
+                                       self.num_classes,
+                                       dtype=torch.long)
+        label_weights = flat_anchors.new_zeros((num_imgs, num_anchors),
+                                               dtype=torch.float)
+
+        pos_mask = assigned_gt_inds > 0
+        neg_mask = assigned_gt_inds == 0
+        pos_img_inds, pos_anchor_inds = torch.nonzero(
+            pos_mask, as_tuple=True)
+        pos_gt_inds = assigned_gt_inds[pos_img_inds, pos_anchor_inds] - 1
+        if len(pos_img_inds) > 0:
+            pos_gt_bboxes = gt_bboxes[pos_img_inds, pos_gt_inds]
+            if not self.reg_decoded_bbox:
+                pos_bbox_targets = self.bbox_coder.encode(
+                    flat_anchors[pos_img_inds, pos_anchor_inds],
+                    pos_gt_bboxes)
+            else:
+                pos_bbox_targets = pos_gt_bboxes
+            bbox_targets[pos_img_inds, pos_anchor_inds] = pos_bbox_targets
+            bbox_weights[pos_img_inds, pos_anchor_inds] = 1.0
+            if gt_labels is None:
+                # Only rpn gives gt_labels as None
+                # Foreground is the first class since v2.5.0
+                labels[pos_img_inds, pos_anchor_inds] = 0
+            else:
+                labels[pos_img_inds, pos_anchor_inds] = gt_labels[
+                    pos_img_inds, pos_gt_inds]
+            if self.train_cfg.pos_weight <= 0:
+                label_weights[pos_mask] = 1.0
+            else:
+                label_weights[pos_mask] = self.train_cfg.pos_weight
+        label_weights[neg_mask] = 1.0
+
+        # sampled anchors of all images
+        num_total_pos = pos_mask.sum(dim=1).clamp(min=1).sum().item()
+        num_total_neg = neg_mask.sum(dim=1).clamp(min=1).sum().item()
+        # split targets to a list w.r.t. multiple levels
+        labels_list = list(labels.split(num_level_anchors, dim=1))
+        label_weights_list = list(
+            label_weights.split(num_level_anchors, dim=1))
+        bbox_targets_list = list(bbox_targets.split(num_level_anchors, dim=1))
+        bbox_weights_list = list(bbox_weights.split(num_level_anchors, dim=1))
+        return (labels_list, label_weights_list, bbox_targets_list,
+                bbox_weights_list, num_total_pos, num_total_neg)
+
     def get_targets(self,
                     anchor_list,
                     valid_flag_list,
@@ -350,13 +523,29 @@ class AnchorHead(BaseDenseHead, BBoxTestMixin):
 
         # anchor number of multi levels
         num_level_anchors = [anchors.size(0) for anchors in anchor_list[0]]
-        # concat all level anchors to a single tensor
+        # concat all level anchors to a single tensor, once for the multi
+        # level lists shared by several images
+        concat_shared = dict()
+
+        def concat(multi_level):
+            if id(multi_level) not in concat_shared:
+                concat_shared[id(multi_level)] = torch.cat(multi_level)
+            return concat_shared[id(multi_level)]
+
         concat_anchor_list = []
         concat_valid_flag_list = []
         for i in range(num_imgs):
             assert len(anchor_list[i]) == len(valid_flag_list[i])
-            concat_anchor_list.append(torch.cat(anchor_list[i]))
-            concat_valid_flag_list.append(torch.cat(valid_flag_list[i]))
+            concat_anchor_list.append(concat(anchor_list[i]))
+            concat_valid_flag_list.append(concat(valid_flag_list[i]))
+
+        if self.batched_targets and unmap_outputs and \
+                not return_sampling_results:
+            return self._get_targets_batched(
+                torch.stack(concat_anchor_list),
+                torch.stack(concat_valid_flag_list), gt_bboxes_list,
+                img_metas, num_level_anchors, gt_bboxes_ignore_list,
+                gt_labels_list)
 
         # compute targets for each image
         if gt_bboxes_ignore_list is None:
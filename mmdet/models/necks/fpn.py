@@ -41,6 +41,11 @@ class FPN(BaseModule):
             Default: None.
         upsample_cfg (dict): Config dict for interpolate layer.
             Default: `dict(mode='nearest')`
+        active_levels (list[int], optional): Indices of the `num_outs`
+            output scales to compute and return, e.g. `[0, 1, 2]` to drop
+            the coarsest levels for small objects. The lateral and fpn convs
+            that no active level depends on are not built and not run.
+            Default: None, which means all output scales.
         init_cfg (dict or list[dict], optional): Initialization config dict.
 
     Example:
@@ -72,6 +77,7 @@ class FPN(BaseModule):
                  norm_cfg=None,
                  act_cfg=None,
                  upsample_cfg=dict(mode='nearest'),
+                 active_levels=None,
                  init_cfg=dict(
                      type='Xavier', layer='Conv2d', distribution='uniform')):
         super(FPN, self).__init__(init_cfg)
@@ -148,6 +154,37 @@ class FPN(BaseModule):
                     inplace=False)
                 self.fpn_convs.append(extra_fpn_conv)
 
+        if active_levels is None:
+            active_levels = range(num_outs)
+        self.active_levels = sorted(active_levels)
+        assert len(self.active_levels) > 0
+        assert 0 <= self.active_levels[0] and self.active_levels[-1] < num_outs
+        self._prune_inactive_levels()
+
+    def _prune_inactive_levels(self):
+        """Replace the convs no active level depends on with None.
+
+        The top-down path needs the laterals from the lowest active level
+        up, the extra levels the ones from the top backbone level up to the
+        highest active level. The indices of the remaining convs, hence
+        their keys in the state dict, are unchanged.
+        """
+        used_backbone_levels = len(self.lateral_convs)
+        lowest, highest = self.active_levels[0], self.active_levels[-1]
+        # extra levels on top of the last lateral / output of the pyramid
+        extra_on_top = highest >= used_backbone_levels and \
+            self.add_extra_convs != 'on_input'
+        for i in range(used_backbone_levels):
+            top = extra_on_top and i == used_backbone_levels - 1
+            if i < lowest and not top:
+                self.lateral_convs[i] = None
+            if i not in self.active_levels and not (
+                    top and self.add_extra_convs != 'on_lateral'):
+                self.fpn_convs[i] = None
+        for i in range(max(highest + 1, used_backbone_levels),
+                       len(self.fpn_convs)):
+            self.fpn_convs[i] = None
+
     @auto_fp16()
     def forward(self, inputs):
         """Forward function."""
@@ -156,12 +193,16 @@ class FPN(BaseModule):
         # build laterals
         laterals = [
             lateral_conv(inputs[i + self.start_level])
+            if lateral_conv is not None else None
             for i, lateral_conv in enumerate(self.lateral_convs)
         ]
 
         # build top-down path
         used_backbone_levels = len(laterals)
         for i in range(used_backbone_levels - 1, 0, -1):
+            if laterals[i - 1] is None:
+                # below the lowest active level
+                break
             # In some cases, fixing `scale factor` (e.g. 2) is preferred, but
             #  it cannot co-exist with `size` in `F.interpolate`.
             if 'scale_factor' in self.upsample_cfg:
@@ -175,14 +216,17 @@ class FPN(BaseModule):
         # build outputs
         # part 1: from original levels
         outs = [
-            self.fpn_convs[i](laterals[i]) for i in range(used_backbone_levels)
+            self.fpn_convs[i](laterals[i])
+            if self.fpn_convs[i] is not None else None
+            for i in range(used_backbone_levels)
         ]
-        # part 2: add extra levels
-        if self.num_outs > len(outs):
+        # part 2: add extra levels up to the highest active one
+        num_outs = self.active_levels[-1] + 1
+        if num_outs > len(outs):
             # use max pool to get more levels on top of outputs
             # (e.g., Faster R-CNN, Mask R-CNN)
             if not self.add_extra_convs:
-                for i in range(self.num_outs - used_backbone_levels):
+                for i in range(num_outs - used_backbone_levels):
                     outs.append(F.max_pool2d(outs[-1], 1, stride=2))
             # add conv layers on top of original feature maps (RetinaNet)
             else:
@@ -195,9 +239,9 @@ class FPN(BaseModule):
                 else:
                     raise NotImplementedError
                 outs.append(self.fpn_convs[used_backbone_levels](extra_source))
-                for i in range(used_backbone_levels + 1, self.num_outs):
+                for i in range(used_backbone_levels + 1, num_outs):
                     if self.relu_before_extra_convs:
                         outs.append(self.fpn_convs[i](F.relu(outs[-1])))
                     else:
                         outs.append(self.fpn_convs[i](outs[-1]))
-        return tuple(outs)
+        return tuple(outs[i] for i in self.active_levels)
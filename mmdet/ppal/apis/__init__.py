@@ -0,0 +1 @@
+from .al_runner import ALRunner
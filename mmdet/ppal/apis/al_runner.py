@@ -0,0 +1,342 @@
+import copy
+import datetime
+import os
+import shutil
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import mmcv
+from mmcv import Config
+from mmcv.parallel import MMDataParallel
+from mmcv.runner import load_checkpoint
+from mmcv.utils import get_git_hash
+
+from mmdet import __version__
+from mmdet.apis import (init_random_seed, set_random_seed, single_gpu_test,
+                        train_detector)
+from mmdet.datasets import (build_dataloader, build_dataset,
+                            replace_ImageToTensor)
+from mmdet.models import build_detector
+
+from mmdet.ppal.builder import builder_al_sampler
+from mmdet.ppal.datasets import *
+from mmdet.ppal.hooks import *
+from mmdet.ppal.models import *
+from mmdet.ppal.sampler import *
+from mmdet.ppal.utils.al_results import dump_al_results, load_al_results
+from mmdet.ppal.utils.coco_index import SUBSET_SUFFIX, convert_to_subset
+from mmdet.ppal.utils.inference_cache import InferenceCache, run_cached_inference
+from mmdet.ppal.utils.running_checks import (display_latest_results,
+                                             display_time_to_accuracy,
+                                             get_round_checkpoint, sys_echo)
+from mmdet.ppal.utils.warm_start import warm_start_config
+
+# EvalHook arguments that dataset.evaluate does not accept
+EVAL_HOOK_KEYS = ('interval', 'tmpdir', 'start', 'gpu_collect', 'save_best',
+                  'rule', 'dynamic_intervals')
+
+
+class ALRunner(object):
+    """Run all active learning rounds of ``tools/run_al_coco.py`` in one process.
+
+    The configs, the oracle index held by the samplers, the validation
+    dataset and the detectors are built once and stay resident; each round
+    only resets the training weights, rebuilds the round-specific datasets
+    and calls ``train_detector`` / ``single_gpu_test`` directly. Wall-clock
+    time of every stage is written to ``<output_dir>/stage_times.json``.
+
+    Only single-process (non-distributed) execution is supported.
+
+    Args:
+        cfg (str | mmcv.Config): Active learning config, e.g.
+            ``al_configs/puncta/ppal_retinanet_ppal.py``.
+        model_type (str): Detector family, ``'fasterrcnn'`` uses ``roi_head``
+            and everything else ``bbox_head``. Default: 'retinanet'.
+        resume (bool): Skip stages whose outputs already exist.
+        gpu_ids (Sequence[int]): Devices used by ``MMDataParallel``.
+        seed (int, optional): Random seed, drawn randomly if None.
+        deterministic (bool): Whether to set deterministic cudnn options.
+    """
+
+    def __init__(self,
+                 cfg,
+                 model_type='retinanet',
+                 resume=False,
+                 gpu_ids=(0, ),
+                 seed=None,
+                 deterministic=False):
+        self.cfg_path = cfg if isinstance(cfg, str) else None
+        self.stage_times = OrderedDict()
+
+        with self.timed('setup', 'Setup'):
+            self.cfg = Config.fromfile(cfg) if isinstance(cfg, str) else cfg
+            self.output_dir = self.cfg.get('output_dir')
+            self.round_num = int(self.cfg.get('round_num'))
+            self.resume = resume
+            self.gpu_ids = list(gpu_ids)
+            self.head = 'roi_head' if model_type == 'fasterrcnn' else 'bbox_head'
+
+            # fused inference scores uncertainty and caches diversity embeddings in one pass
+            self.fused_inference = self.cfg.get('fused_inference', False)
+            self.result_format = self.cfg.get('result_format', 'json')
+            # rounds after the first continue from the previous round, see warm_start_config
+            self.warm_start = self.cfg.get('warm_start', None)
+            # 'subset' keeps the label sets of the rounds as image bitmaps over the oracle json
+            self.ann_suffix = SUBSET_SUFFIX if self.cfg.get('annotation_format', 'json') == 'subset' else '.json'
+            self.train_cfg = Config.fromfile(self.cfg.get('train_config'))
+            if self.fused_inference:
+                self.uncertainty_cfg = Config.fromfile(self.cfg.get('fused_infer_config'))
+            else:
+                self.uncertainty_cfg = Config.fromfile(self.cfg.get('uncertainty_infer_config'))
+                self.diversity_cfg = Config.fromfile(self.cfg.get('diversity_infer_config'))
+
+            self.seed = init_random_seed(seed)
+            set_random_seed(self.seed, deterministic=deterministic)
+
+            self.uncertainty_sampler = builder_al_sampler(self.cfg.uncertainty_sampler_config)
+            cache_cfg = self.cfg.get('inference_cache', None)
+            self.inference_cache = InferenceCache(**cache_cfg) if cache_cfg else None
+            self.diversity_sampler = builder_al_sampler(self.cfg.diversity_sampler_config,
+                                                        dict(fused_inference=self.fused_inference))
+
+            self.model = build_detector(
+                self.train_cfg.model,
+                train_cfg=self.train_cfg.get('train_cfg'),
+                test_cfg=self.train_cfg.get('test_cfg'))
+            self.model.init_weights()
+            # every round trains from the same initialisation
+            self.init_state = {k: v.detach().clone() for k, v in self.model.state_dict().items()}
+
+            self.uncertainty_model = self._build_test_model(self.uncertainty_cfg)
+            if not self.fused_inference:
+                self.diversity_model = self._build_test_model(self.diversity_cfg)
+                if self.cfg.get('distance_cache', None) is not None:
+                    # pair distances reused across rounds, see ImageDistanceCache
+                    getattr(self.diversity_model, self.head).distance_cache = self.cfg.distance_cache
+            self.eval_dataset = self._build_test_dataset(self.train_cfg)
+            self.model.CLASSES = self.eval_dataset.CLASSES
+
+    @contextmanager
+    def timed(self, round_key, stage):
+        tic = time.time()
+        yield
+        elapsed = time.time() - tic
+        self.stage_times.setdefault(round_key, OrderedDict())[stage] = elapsed
+        sys_echo('----> %s time: %s' % (stage, str(datetime.timedelta(seconds=int(elapsed)))))
+
+    def dump_stage_times(self):
+        mmcv.dump(self.stage_times, os.path.join(self.output_dir, 'stage_times.json'), indent=2)
+
+    @staticmethod
+    def _build_test_model(cfg):
+        cfg.model.pretrained = None
+        cfg.model.train_cfg = None
+        return build_detector(cfg.model, test_cfg=cfg.get('test_cfg'))
+
+    @staticmethod
+    def _build_test_dataset(cfg, ann_file=None):
+        test_cfg = copy.deepcopy(cfg.data.test)
+        test_cfg.test_mode = True
+        samples_per_gpu = test_cfg.pop('samples_per_gpu', 1)
+        if samples_per_gpu > 1:
+            test_cfg.pipeline = replace_ImageToTensor(test_cfg.pipeline)
+        if ann_file is not None:
+            test_cfg.ann_file = ann_file
+        dataset = build_dataset(test_cfg)
+        dataset.samples_per_gpu = samples_per_gpu
+        return dataset
+
+    def _test(self, model, cfg, dataset):
+        data_loader = build_dataloader(
+            dataset,
+            samples_per_gpu=dataset.samples_per_gpu,
+            workers_per_gpu=cfg.data.workers_per_gpu,
+            dist=False,
+            shuffle=False)
+        return single_gpu_test(MMDataParallel(model, device_ids=self.gpu_ids), data_loader)
+
+    def _sync_weights(self, model):
+        # inference heads share parameter names with the training head, the
+        # extra buffers on either side (quality EMA, feature queues) are skipped
+        model.load_state_dict(self.model.state_dict(), strict=False)
+        model.CLASSES = self.model.CLASSES
+
+    def get_start_round(self):
+        start_round = 0
+        if self.resume and os.path.isdir(self.output_dir):
+            while start_round < self.round_num:
+                round_work_dir = os.path.join(self.output_dir, 'round%d' % (start_round + 1))
+                if not os.path.isfile(os.path.join(round_work_dir, 'annotations', 'new_labeled' + self.ann_suffix)):
+                    break
+                start_round += 1
+        return start_round
+
+    def train(self, round_idx, round_work_dir, labeled_json, unlabeled_json):
+        if round_idx > 1 and self.warm_start is not None:
+            last_round_work_dir = os.path.join(self.output_dir, 'round%d' % (round_idx - 1))
+            cfg = warm_start_config(
+                self.train_cfg, labeled_json, os.path.join(last_round_work_dir, 'annotations', 'labeled' + self.ann_suffix),
+                get_round_checkpoint(last_round_work_dir), **self.warm_start)
+        else:
+            cfg = copy.deepcopy(self.train_cfg)
+            cfg.data.train.ann_file = labeled_json
+        cfg.work_dir = round_work_dir
+        cfg.gpu_ids = self.gpu_ids
+        cfg.seed = self.seed
+        cfg.labeled_data = labeled_json
+        cfg.unlabeled_data = unlabeled_json
+
+        self.model.load_state_dict(self.init_state)
+        datasets = [build_dataset(cfg.data.train)]
+        if cfg.checkpoint_config is not None:
+            cfg.checkpoint_config.meta = dict(
+                mmdet_version=__version__ + get_git_hash()[:7],
+                CLASSES=datasets[0].CLASSES)
+        self.model.CLASSES = datasets[0].CLASSES
+        timestamp = time.strftime('%Y%m%d_%H%M%S', time.localtime())
+        train_detector(
+            self.model,
+            datasets,
+            cfg,
+            distributed=False,
+            validate=True,
+            timestamp=timestamp,
+            meta=dict(seed=self.seed, exp_name='round%d' % round_idx))
+        if os.path.isfile(os.path.join(round_work_dir, 'best.pth')):
+            # the round continues with the best epoch kept by EarlyStoppingHook
+            load_checkpoint(self.model, os.path.join(round_work_dir, 'best.pth'), map_location='cpu')
+
+    def evaluate(self, round_eval_log):
+        outputs = self._test(self.model, self.train_cfg, self.eval_dataset)
+        eval_kwargs = self.train_cfg.get('evaluation', {}).copy()
+        for key in EVAL_HOOK_KEYS:
+            eval_kwargs.pop(key, None)
+        eval_kwargs.update(dict(metric='bbox', classwise=True))
+        metric = self.eval_dataset.evaluate(outputs, **eval_kwargs)
+        with open(round_eval_log, 'w') as f:
+            f.write('%s\n' % str(metric))
+        return metric
+
+    def infer(self, model, cfg, ann_file, jsonfile_prefix, feat_output_path=None):
+        self._sync_weights(model)
+        dataset = self._build_test_dataset(cfg, ann_file)
+        if feat_output_path is not None:
+            # feature collecting heads write their output once every image is seen
+            getattr(model, self.head).reset_queue(len(dataset), output_path=feat_output_path)
+        outputs = self._test(model, cfg, dataset)
+        dataset.format_results(outputs, jsonfile_prefix=jsonfile_prefix, result_format=self.result_format)
+
+    def run_round(self, round_idx, run_al):
+        key = 'round%d' % round_idx
+        last_round_work_dir = os.path.join(self.output_dir, 'round%d' % (round_idx - 1))
+        round_work_dir = os.path.join(self.output_dir, key)
+        round_checkpoint = os.path.join(round_work_dir, 'latest.pth')
+
+        round_labeled_json = os.path.join(round_work_dir, 'annotations', 'labeled' + self.ann_suffix)
+        round_unlabeled_json = os.path.join(round_work_dir, 'annotations', 'unlabeled' + self.ann_suffix)
+        round_eval_log = os.path.join(round_work_dir, 'eval.txt')
+
+        round_uncertainty_inference_json_prefix = os.path.join(round_work_dir, 'unlabeled_inference_result')
+        result_suffix = '.bbox.npz' if self.result_format == 'npz' else '.bbox.json'
+        round_uncertainty_inference_json = round_uncertainty_inference_json_prefix + result_suffix
+        round_uncertainty_new_labeled_json = os.path.join(round_work_dir, 'annotations', 'uncertainty_new_labeled' + self.ann_suffix)
+        round_uncertainty_new_unlabeled_json = os.path.join(round_work_dir, 'annotations', 'uncertainty_new_unlabeled' + self.ann_suffix)
+
+        round_diversity_image_dis = self.diversity_sampler.image_dis_path(round_work_dir)
+        round_diversity_inference_json_prefix = os.path.join(round_work_dir, 'diversity_inference_result')
+        round_diversity_inference_json = round_diversity_inference_json_prefix + result_suffix
+        round_diversity_new_labeled_json = os.path.join(round_work_dir, 'annotations', 'new_labeled' + self.ann_suffix)
+        round_diversity_new_unlabeled_json = os.path.join(round_work_dir, 'annotations', 'new_unlabeled' + self.ann_suffix)
+        round_fused_feat_cache = os.path.join(round_work_dir, 'unlabeled_feat_cache.npz')
+
+        mmcv.mkdir_or_exist(os.path.join(round_work_dir, 'annotations'))
+        if round_idx == 1:
+            if self.ann_suffix == SUBSET_SUFFIX:
+                convert_to_subset(self.cfg.get('init_label_json'), round_labeled_json, self.cfg.get('oracle_path'))
+                convert_to_subset(self.cfg.get('init_unlabeled_json'), round_unlabeled_json, self.cfg.get('oracle_path'),
+                                  with_annotations=False)
+            else:
+                shutil.copy(self.cfg.get('init_label_json'), round_labeled_json)
+                shutil.copy(self.cfg.get('init_unlabeled_json'), round_unlabeled_json)
+            if self.cfg.get('init_model', None) is not None:
+                shutil.copy(self.cfg.get('init_model'), round_checkpoint)
+                load_checkpoint(self.model, round_checkpoint, map_location='cpu')
+            else:
+                with self.timed(key, 'Training'):
+                    self.train(round_idx, round_work_dir, round_labeled_json, round_unlabeled_json)
+            if self.cfg.get('init_inference_results', None) is not None:
+                dump_al_results(round_uncertainty_inference_json, load_al_results(self.cfg.get('init_inference_results')))
+        elif self.resume and os.path.isfile(round_checkpoint):
+            load_checkpoint(self.model, get_round_checkpoint(round_work_dir), map_location='cpu')
+        else:
+            shutil.copy(os.path.join(last_round_work_dir, 'annotations', 'new_labeled' + self.ann_suffix), round_labeled_json)
+            shutil.copy(os.path.join(last_round_work_dir, 'annotations', 'new_unlabeled' + self.ann_suffix), round_unlabeled_json)
+            with self.timed(key, 'Training'):
+                self.train(round_idx, round_work_dir, round_labeled_json, round_unlabeled_json)
+
+        if not (os.path.isfile(round_eval_log) and self.resume):
+            with self.timed(key, 'Evaluation round %d' % round_idx):
+                self.evaluate(round_eval_log)
+        display_latest_results(self.output_dir, round_idx, os.path.join(self.output_dir, 'eval_results.txt'))
+        display_time_to_accuracy(self.output_dir, round_idx, self.cfg.get('cold_start_dir', None),
+                                 os.path.join(self.output_dir, 'time_to_accuracy.txt'))
+
+        if run_al:
+            unlabeled_infer_done = os.path.isfile(round_uncertainty_inference_json) and \
+                (os.path.isfile(round_fused_feat_cache) or not self.fused_inference)
+            if not (unlabeled_infer_done and self.resume):
+                feat_cache_path = round_fused_feat_cache if self.fused_inference else None
+
+                def unlabeled_infer(ann_file, jsonfile_prefix, feat_output_path=None):
+                    self.infer(self.uncertainty_model, self.uncertainty_cfg, ann_file, jsonfile_prefix,
+                               feat_output_path=feat_output_path)
+
+                with self.timed(key, 'Inference on unlabeled data'):
+                    if self.inference_cache is not None:
+                        cache_key = self.inference_cache.make_key(get_round_checkpoint(round_work_dir), self.uncertainty_cfg)
+                        run_cached_inference(self.inference_cache, cache_key, round_unlabeled_json,
+                                             round_uncertainty_inference_json_prefix, unlabeled_infer, feat_cache_path,
+                                             self.result_format)
+                    else:
+                        unlabeled_infer(round_unlabeled_json, round_uncertainty_inference_json_prefix, feat_cache_path)
+            if not (os.path.isfile(round_uncertainty_new_labeled_json) and self.resume):
+                with self.timed(key, 'Uncertainty sampling'):
+                    self.uncertainty_sampler.al_round(
+                        round_uncertainty_inference_json, round_labeled_json,
+                        round_uncertainty_new_labeled_json, round_uncertainty_new_unlabeled_json)
+
+            if not (os.path.isfile(round_diversity_image_dis) and self.resume):
+                if self.fused_inference:
+                    with self.timed(key, 'Image distances from cache'):
+                        self.diversity_sampler.image_dis_from_cache(
+                            round_fused_feat_cache, round_uncertainty_new_labeled_json, round_diversity_image_dis)
+                else:
+                    with self.timed(key, 'Inference on diversity data'):
+                        self.infer(self.diversity_model, self.diversity_cfg, round_uncertainty_new_labeled_json,
+                                   round_diversity_inference_json_prefix,
+                                   feat_output_path=round_diversity_image_dis)
+            if not (os.path.isfile(round_diversity_new_labeled_json) and self.resume):
+                with self.timed(key, 'Diversity sampling'):
+                    self.diversity_sampler.al_round(
+                        round_uncertainty_inference_json, round_diversity_image_dis, round_labeled_json,
+                        round_diversity_new_labeled_json, round_diversity_new_unlabeled_json)
+
+            # delete inference results because they are too large
+            for path in (round_uncertainty_inference_json, round_diversity_inference_json,
+                         round_diversity_image_dis, round_fused_feat_cache):
+                if os.path.isfile(path):
+                    os.remove(path)
+
+        self.dump_stage_times()
+
+    def run(self):
+        start_round = self.get_start_round()
+        mmcv.mkdir_or_exist(self.output_dir)
+        if self.cfg_path is not None:
+            shutil.copy(self.cfg_path, os.path.join(self.output_dir, os.path.split(self.cfg_path)[-1]))
+        self.uncertainty_sampler.set_round(start_round + 1)
+        self.diversity_sampler.set_round(start_round + 1)
+        for i in range(start_round, self.round_num):
+            self.run_round(i + 1, i != self.round_num - 1)
+        return self.stage_times
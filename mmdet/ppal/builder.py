@@ -14,6 +14,6 @@ def build(cfg, registry, default_args=None):
     else:
         return build_from_cfg(cfg, registry, default_args)
 
-def builder_al_sampler(cfg):
+def builder_al_sampler(cfg, default_args=None):
     """Build distill loss."""
-    return build(cfg, SAMPLER)
+    return build(cfg, SAMPLER, default_args)
@@ -1,2 +1,4 @@
 from .al_puncta import ALPunctaDataset
-from .transforms.custom_transforms import RandomRotate, ColorJitter
\ No newline at end of file
+from .dataset_wrappers import NewImageRepeatDataset
+from .transforms.custom_transforms import RandomRotate, ColorJitter, DefaultImageId
+from .transforms.loading import LoadImageFromStore
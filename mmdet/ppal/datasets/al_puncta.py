@@ -1,5 +1,15 @@
+import os.path as osp
+import tempfile
+from collections import OrderedDict
+
+from mmcv.utils import print_log
+
+from mmdet.datasets.api_wrappers import COCO
 from mmdet.datasets.coco import CocoDataset
 from mmdet.datasets.builder import DATASETS
+from mmdet.ppal.utils.al_results import empty_al_results, save_al_results
+from mmdet.ppal.utils.coco_index import load_coco_index
+from mmdet.ppal.utils.fast_eval import COCO_IOU_THRS, centroid_match, coco_bbox_ap
 import numpy as np
 
 @DATASETS.register_module()
@@ -7,7 +17,9 @@ class ALPunctaDataset(CocoDataset):
     # Define the single class
     CLASSES = ('puncta',)
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, labeled_mask=None, **kwargs):
+        # bool mask (or path of a .npy) over the images of ann_file, only these images are used
+        self.labeled_mask = labeled_mask
         super(ALPunctaDataset, self).__init__(*args, **kwargs)
         
         # Ensure img_infos are populated
@@ -19,7 +31,7 @@ class ALPunctaDataset(CocoDataset):
                     'width': img_info['width'],
                     'height': img_info['height']
                 }
-                for img_info in self.coco.imgs.values()
+                for img_info in self.coco_index.image_dicts()
             ]
             if not self.img_infos:
                 raise AttributeError("The 'img_infos' attribute is still not initialized after attempting to load it. Check the dataset loading.")
@@ -30,6 +42,102 @@ class ALPunctaDataset(CocoDataset):
             if img_info['width'] / img_info['height'] > 1:
                 self.flag[i] = 1
 
+    def load_annotations(self, ann_file):
+        """Load annotation from the columnar index of a COCO style annotation file.
+
+        Same image infos, ``cat_ids`` and ``img_ids`` as the pycocotools
+        index, which is only built if ``coco`` is used (e.g. by
+        ``evaluate``). ``ann_file`` may be a json or a subset file and only
+        the images in ``labeled_mask`` are kept if it is set. See
+        :func:`mmdet.ppal.utils.coco_index.load_coco_index`.
+        """
+        self.coco_index = load_coco_index(ann_file)
+        if self.labeled_mask is not None:
+            mask = np.load(self.labeled_mask) if isinstance(self.labeled_mask, str) else self.labeled_mask
+            img_rows = np.flatnonzero(np.asarray(mask, dtype=bool))
+            self.coco_index = self.coco_index.subset(img_rows, self.coco_index.ann_inds(img_rows))
+        self.cat_ids = self.coco_index.cat_ids(self.CLASSES)
+        self.cat2label = {cat_id: i for i, cat_id in enumerate(self.cat_ids)}
+        self.img_ids = self.coco_index.img_ids.tolist()
+        data_infos = self.coco_index.image_dicts()
+        for info in data_infos:
+            info['filename'] = info['file_name']
+        assert len(np.unique(self.coco_index.ann_ids)) == self.coco_index.n_anns, \
+            f"Annotation ids in '{ann_file}' are not unique!"
+        return data_infos
+
+    @property
+    def coco(self):
+        if getattr(self, '_coco', None) is None:
+            # from the index rather than ann_file, which may be a subset file or be masked
+            index = self.coco_index
+            self._coco = COCO()
+            self._coco.dataset = dict(
+                images=index.image_dicts(), annotations=index.ann_dicts(range(index.n_anns)), categories=index.categories)
+            self._coco.createIndex()
+            self._coco.img_ann_map, self._coco.cat_img_map = self._coco.imgToAnns, self._coco.catToImgs
+        return self._coco
+
+    @coco.setter
+    def coco(self, coco):
+        self._coco = coco
+
+    def _ann_rows(self, idx):
+        row = self.coco_index.image_inds(self.data_infos[idx]['id'])
+        return np.arange(self.coco_index.ann_offsets[row], self.coco_index.ann_offsets[row + 1])
+
+    def get_ann_info(self, idx):
+        """Get COCO annotation by index, parsed as ``_parse_ann_info`` from the index columns."""
+        if idx >= len(self.data_infos) or idx < 0:
+            raise IndexError(f"Index {idx} is out of range for dataset with {len(self.data_infos)} images.")
+
+        img_info = self.data_infos[idx]
+        rows = self._ann_rows(idx)
+        index = self.coco_index
+        x1, y1, w, h = index.ann_bboxes[rows].T
+        inter_w = np.maximum(0, np.minimum(x1 + w, img_info['width']) - np.maximum(x1, 0))
+        inter_h = np.maximum(0, np.minimum(y1 + h, img_info['height']) - np.maximum(y1, 0))
+        cat_ids = index.ann_category_ids[rows]
+        keep = ~index.ann_ignore[rows] & (inter_w * inter_h != 0) & (index.ann_areas[rows] > 0) & (w >= 1) & (h >= 1) & \
+            np.isin(cat_ids, self.cat_ids)
+        bboxes = np.stack((x1, y1, x1 + w, y1 + h), axis=1).astype(np.float32)
+        crowd = index.ann_iscrowd[rows]
+        gt = keep & ~crowd
+
+        seg_map = img_info['filename'].replace('jpg', 'png')
+        return dict(
+            bboxes=bboxes[gt].reshape(-1, 4),
+            labels=np.array([self.cat2label[cat_id] for cat_id in cat_ids[gt].tolist()], dtype=np.int64),
+            bboxes_ignore=bboxes[keep & crowd].reshape(-1, 4),
+            masks=[ann.get('segmentation', None) for ann in index.ann_dicts(rows[gt])],
+            seg_map=seg_map)
+
+    def get_cat_ids(self, idx):
+        """Get COCO category ids by index."""
+        return self.coco_index.ann_category_ids[self._ann_rows(idx)].tolist()
+
+    def _filter_imgs(self, min_size=32):
+        """Filter images too small or without ground truths."""
+        index = self.coco_index
+        in_cat = np.isin(index.ann_category_ids, self.cat_ids)
+        has_gt = np.bincount(index.ann_img_inds[in_cat], minlength=len(index)) > 0
+        has_gt = has_gt[index.image_inds(self.img_ids)]
+        valid_inds = []
+        valid_img_ids = []
+        for i, img_info in enumerate(self.data_infos):
+            if self.filter_empty_gt and not has_gt[i]:
+                continue
+            if min(img_info['width'], img_info['height']) >= min_size:
+                valid_inds.append(i)
+                valid_img_ids.append(self.img_ids[i])
+        self.img_ids = valid_img_ids
+        return valid_inds
+
+    def pre_pipeline(self, results):
+        super(ALPunctaDataset, self).pre_pipeline(results)
+        # kept in img_metas by the AL test pipelines, feature heads read it instead of parsing file names
+        results['img_id'] = results['img_info']['id']
+
     def _det2json(self, results):
         """Convert detection results to COCO json style."""
         json_results = []
@@ -49,3 +157,182 @@ class ALPunctaDataset(CocoDataset):
                     data['category_id'] = self.cat_ids[label]
                     json_results.append(data)
         return json_results
+
+    def _det2columns(self, results):
+        """Convert detection results to AL result columns, one row per box.
+
+        ``bbox`` is kept in float64 ``xywh`` computed as in ``xyxy2xywh`` so
+        the values match those written to ``.bbox.json``.
+        """
+        image_ids, labels, dets = [], [], []
+        for idx in range(len(self)):
+            result = results[idx]
+            for label in range(len(result)):
+                bboxes = result[label]
+                if bboxes.shape[0] == 0:
+                    continue
+                dets.append(bboxes if bboxes.shape[1] > 5 else np.pad(bboxes, ((0, 0), (0, 2))))
+                image_ids.append(np.full(bboxes.shape[0], self.img_ids[idx], dtype=np.int64))
+                labels.append(np.full(bboxes.shape[0], self.cat_ids[label], dtype=np.int64))
+        if len(dets) == 0:
+            return empty_al_results()
+
+        dets = np.concatenate(dets, axis=0)
+        xyxy = dets[:, :4].astype(np.float64)
+        return dict(
+            image_id=np.concatenate(image_ids),
+            bbox=np.concatenate((xyxy[:, :2], xyxy[:, 2:] - xyxy[:, :2]), axis=1),
+            score=dets[:, 4].astype(np.float32),
+            category_id=np.concatenate(labels),
+            cls_uncertainty=dets[:, 5].astype(np.float32),
+            box_uncertainty=dets[:, 6].astype(np.float32))
+
+    def format_results(self, results, jsonfile_prefix=None, result_format='json', **kwargs):
+        """Format the results to json and/or a columnar ``.npz``.
+
+        Args:
+            results (list[list[numpy.ndarray]]): Testing results of the
+                dataset.
+            jsonfile_prefix (str | None): The prefix of output files. If not
+                specified, a temp file will be created. Default: None.
+            result_format (str): ``'json'`` for the COCO ``.bbox.json``,
+                ``'npz'`` for the AL result columns in ``.bbox.npz`` (see
+                :func:`mmdet.ppal.utils.al_results.load_al_results`) or
+                ``'both'``. Default: 'json'.
+
+        Returns:
+            tuple: (result_files, tmp_dir), ``result_files['bbox']`` is the
+                ``.bbox.npz`` path unless ``result_format`` is ``'json'``.
+        """
+        assert result_format in ('json', 'npz', 'both'), \
+            'result_format must be json, npz or both, got %s' % result_format
+        if result_format == 'json':
+            return super(ALPunctaDataset, self).format_results(results, jsonfile_prefix, **kwargs)
+
+        assert isinstance(results, list), 'results must be a list'
+        assert len(results) == len(self), (
+            'The length of results is not equal to the dataset len: {} != {}'.
+            format(len(results), len(self)))
+        if jsonfile_prefix is None:
+            tmp_dir = tempfile.TemporaryDirectory()
+            jsonfile_prefix = osp.join(tmp_dir.name, 'results')
+        else:
+            tmp_dir = None
+
+        result_files = dict()
+        if result_format == 'both':
+            result_files.update(self.results2json(results, jsonfile_prefix))
+            result_files['bbox_json'] = result_files['bbox']
+        result_files['bbox'] = f'{jsonfile_prefix}.bbox.npz'
+        save_al_results(result_files['bbox'], self._det2columns(results))
+        return result_files, tmp_dir
+
+    def evaluate(self, results, metric='bbox', logger=None, iou_thrs=None, proposal_nums=(100, 300, 1000),
+                 radius=3., score_thr=0.5, **kwargs):
+        """Evaluation in COCO protocol, or with the in-memory ``'bbox_fast'`` and ``'point'``.
+
+        ``'bbox_fast'`` gives the ``bbox_mAP`` and ``bbox_mAP_50`` of
+        ``'bbox'`` from the result arrays and the annotation index (see
+        :func:`mmdet.ppal.utils.fast_eval.coco_bbox_ap`), without writing
+        the results to json or running ``COCOeval``. It is meant for the
+        validation during training, the other COCO metrics need ``'bbox'``.
+        ``'point'`` matches the box centres to the ground truth centroids
+        within ``radius`` pixels instead of by IoU (see :meth:`point_evaluate`).
+        """
+        metrics = metric if isinstance(metric, list) else [metric]
+        if 'bbox_fast' not in metrics and 'point' not in metrics:
+            return super(ALPunctaDataset, self).evaluate(
+                results, metric=metric, logger=logger, iou_thrs=iou_thrs, proposal_nums=proposal_nums, **kwargs)
+        assert 'bbox' not in metrics or 'bbox_fast' not in metrics, "'bbox' and 'bbox_fast' give the same metrics"
+
+        eval_results = OrderedDict()
+        coco_metrics = [m for m in metrics if m not in ('bbox_fast', 'point')]
+        if len(coco_metrics) > 0:
+            eval_results.update(super(ALPunctaDataset, self).evaluate(
+                results, metric=coco_metrics, logger=logger, iou_thrs=iou_thrs, proposal_nums=proposal_nums, **kwargs))
+        if 'bbox_fast' in metrics:
+            eval_results.update(self.fast_evaluate(results, iou_thrs=iou_thrs, max_dets=proposal_nums[-1], logger=logger))
+        if 'point' in metrics:
+            eval_results.update(self.point_evaluate(
+                results, radius=radius, score_thr=score_thr, max_dets=proposal_nums[-1], logger=logger))
+        return eval_results
+
+    def _category_dets(self, results, label):
+        # float64 xyxy boxes, scores and image ids of one category over all images
+        dets = np.concatenate([result[label][:, :5] for result in results] + [np.zeros((0, 5), dtype=np.float32)])
+        img_ids = np.repeat(self.img_ids, [len(result[label]) for result in results])
+        return dets[:, :4].astype(np.float64), dets[:, 4], img_ids
+
+    def fast_evaluate(self, results, iou_thrs=None, max_dets=1000, logger=None):
+        """``bbox_mAP`` and ``bbox_mAP_50`` as ``COCOeval``, averaged over the categories with ground truths."""
+        iou_thrs = COCO_IOU_THRS if iou_thrs is None else np.asarray(iou_thrs, dtype=np.float64)
+        index = self.coco_index
+        ann_rows = index.ann_inds(index.image_inds(self.img_ids))
+        aps = []
+        for label, cat_id in enumerate(self.cat_ids):
+            # xywh from float64 xyxy, as results2json
+            xyxy, scores, det_img_ids = self._category_dets(results, label)
+            gt_rows = ann_rows[index.ann_category_ids[ann_rows] == cat_id]
+            ap = coco_bbox_ap(
+                np.concatenate((xyxy[:, :2], xyxy[:, 2:] - xyxy[:, :2]), axis=1),
+                scores,
+                det_img_ids,
+                index.ann_bboxes[gt_rows],
+                # COCOeval ignores the crowd regions, not the `ignore` flag
+                index.ann_iscrowd[gt_rows],
+                index.ann_iscrowd[gt_rows],
+                index.img_ids[index.ann_img_inds[gt_rows]],
+                iou_thrs=iou_thrs,
+                max_dets=max_dets)
+            if ap[0] > -1:
+                aps.append(ap)
+
+        eval_results = OrderedDict()
+        if len(aps) == 0:
+            print_log('No ground truth to evaluate.', logger=logger)
+            return eval_results
+        aps = np.stack(aps)
+        eval_results['bbox_mAP'] = float(f'{aps.mean():.3f}')
+        thr_50 = np.flatnonzero(np.isclose(iou_thrs, 0.5))
+        if len(thr_50) > 0:
+            eval_results['bbox_mAP_50'] = float(f'{aps[:, thr_50[0]].mean():.3f}')
+        print_log('\n' + ' '.join(f'{k}: {v:.3f}' for k, v in eval_results.items()) + ' (bbox_fast)', logger=logger)
+        return eval_results
+
+    def point_evaluate(self, results, radius=3., score_thr=0.5, max_dets=1000, logger=None):
+        """``point_AP``, ``point_precision``, ``point_recall`` and ``point_F1`` of the box centres.
+
+        The ground truth points are the centres of the annotated boxes, i.e.
+        the puncta centroids the fixed size boxes are drawn around. See
+        :func:`mmdet.ppal.utils.fast_eval.centroid_match`, metrics are
+        averaged over the categories with ground truths.
+        """
+        index = self.coco_index
+        ann_rows = index.ann_inds(index.image_inds(self.img_ids))
+        cat_results = []
+        for label, cat_id in enumerate(self.cat_ids):
+            xyxy, scores, det_img_ids = self._category_dets(results, label)
+            gt_rows = ann_rows[index.ann_category_ids[ann_rows] == cat_id]
+            gt_bboxes = index.ann_bboxes[gt_rows]
+            cat_result = centroid_match(
+                (xyxy[:, :2] + xyxy[:, 2:]) / 2,
+                scores,
+                det_img_ids,
+                gt_bboxes[:, :2] + gt_bboxes[:, 2:] / 2,
+                index.ann_iscrowd[gt_rows],
+                index.img_ids[index.ann_img_inds[gt_rows]],
+                radius=radius,
+                score_thr=score_thr,
+                max_dets=max_dets)
+            if cat_result['ap'] > -1:
+                cat_results.append(cat_result)
+
+        eval_results = OrderedDict()
+        if len(cat_results) == 0:
+            print_log('No ground truth to evaluate.', logger=logger)
+            return eval_results
+        for key, name in (('ap', 'AP'), ('precision', 'precision'), ('recall', 'recall'), ('f1', 'F1')):
+            eval_results[f'point_{name}'] = float(f'{np.mean([r[key] for r in cat_results]):.3f}')
+        print_log('\n' + ' '.join(f'{k}: {v:.3f}' for k, v in eval_results.items()) +
+                  f' (radius {radius}, score_thr {score_thr})', logger=logger)
+        return eval_results
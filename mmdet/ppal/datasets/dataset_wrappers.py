@@ -0,0 +1,43 @@
+import numpy as np
+
+from mmdet.datasets.builder import DATASETS, build_dataset
+from mmdet.ppal.utils.coco_index import load_coco_index
+
+
+@DATASETS.register_module()
+class NewImageRepeatDataset(object):
+    """Repeat the images labeled in the current AL round.
+
+    Images that are not in ``last_ann_file`` (the labeled set of the
+    previous round) appear ``times`` times per epoch, the others once, so
+    a warm-started round sees the new labels more often in its short
+    schedule.
+
+    Args:
+        dataset (:obj:`Dataset` | dict): The labeled set of the round.
+        last_ann_file (str): Labeled set of the previous round, a json or
+            a subset file.
+        times (int): Repeat times of the new images.
+    """
+
+    def __init__(self, dataset, last_ann_file, times):
+        self.dataset = build_dataset(dataset) if isinstance(dataset, dict) else dataset
+        self.times = times
+        self.CLASSES = self.dataset.CLASSES
+        is_new = ~np.isin(self.dataset.img_ids, load_coco_index(last_ann_file).img_ids)
+        self.n_new = int(is_new.sum())
+        self.repeat_indices = np.repeat(np.arange(len(self.dataset)), np.where(is_new, times, 1))
+        if hasattr(self.dataset, 'flag'):
+            self.flag = self.dataset.flag[self.repeat_indices]
+
+    def __getitem__(self, idx):
+        return self.dataset[self.repeat_indices[idx]]
+
+    def get_cat_ids(self, idx):
+        return self.dataset.get_cat_ids(self.repeat_indices[idx])
+
+    def get_ann_info(self, idx):
+        return self.dataset.get_ann_info(self.repeat_indices[idx])
+
+    def __len__(self):
+        return len(self.repeat_indices)
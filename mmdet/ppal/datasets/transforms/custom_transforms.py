@@ -17,24 +17,12 @@ class RandomRotate:
             img = cv2.warpAffine(img, M, (w, h))
             results['img'] = img
 
-            # Rotate bounding boxes
+            # Rotate the 4 corners of all bounding boxes with one matrix product
             if 'gt_bboxes' in results:
                 bboxes = results['gt_bboxes']
-                new_bboxes = []
-                for bbox in bboxes:
-                    points = np.array([
-                        [bbox[0], bbox[1]],  # Top-left
-                        [bbox[2], bbox[1]],  # Top-right
-                        [bbox[2], bbox[3]],  # Bottom-right
-                        [bbox[0], bbox[3]],  # Bottom-left
-                    ])
-                    rotated_points = cv2.transform(np.array([points]), M)[0]
-                    x_min = np.min(rotated_points[:, 0])
-                    y_min = np.min(rotated_points[:, 1])
-                    x_max = np.max(rotated_points[:, 0])
-                    y_max = np.max(rotated_points[:, 1])
-                    new_bboxes.append([x_min, y_min, x_max, y_max])
-                results['gt_bboxes'] = np.array(new_bboxes, dtype=np.float32)
+                corners = bboxes[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+                rotated = corners @ M[:, :2].T + M[:, 2]
+                results['gt_bboxes'] = np.concatenate([rotated.min(axis=1), rotated.max(axis=1)], axis=1).astype(np.float32)
 
         return results
 
@@ -45,13 +33,11 @@ class ColorJitter:
         self.contrast = contrast
         self.saturation = saturation
         self.hue = hue
+        # the adjustments are per channel value, so on uint8 HSV they reduce to one lookup table per channel
+        ramp = np.arange(256, dtype=np.uint8)[:, None]
+        self.lut = np.dstack(self._adjust(ramp, ramp, ramp))
 
-    def __call__(self, results):
-        img = results['img']
-        # Apply color jitter to the image
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        h, s, v = cv2.split(img)
-
+    def _adjust(self, h, s, v):
         # Apply brightness adjustment
         v = cv2.add(v, int(self.brightness * 255))
         # Apply contrast adjustment
@@ -60,9 +46,33 @@ class ColorJitter:
         s = cv2.multiply(s, 1 + self.saturation)
         # Apply hue adjustment
         h = (h + int(self.hue * 180)) % 180
+        return h, s, v
 
-        img = cv2.merge([h, s, v])
-        img = cv2.cvtColor(img, cv2.COLOR_HSV2BGR)
+    def __call__(self, results):
+        img = results['img']
+        # Apply color jitter to the image
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        if img.dtype == np.uint8:
+            cv2.LUT(img, self.lut, dst=img)
+            cv2.cvtColor(img, cv2.COLOR_HSV2BGR, dst=img)
+        else:
+            img = cv2.cvtColor(cv2.merge(self._adjust(*cv2.split(img))), cv2.COLOR_HSV2BGR)
         results['img'] = img
 
         return results
+
+@PIPELINES.register_module()
+class DefaultImageId:
+    """Set ``results['img_id']`` to ``default`` when the dataset did not.
+
+    ALPunctaDataset sets the id in ``pre_pipeline``, images fed directly
+    (e.g. ``inference_detector``) have none, so the AL test pipelines put
+    this before the Collect that keeps ``img_id`` in the img_metas.
+    """
+
+    def __init__(self, default=-1):
+        self.default = default
+
+    def __call__(self, results):
+        results.setdefault('img_id', self.default)
+        return results
@@ -0,0 +1,70 @@
+import os.path as osp
+
+import numpy as np
+
+from mmdet.datasets.builder import PIPELINES
+from mmdet.datasets.pipelines import LoadImageFromFile
+from mmdet.ppal.utils.image_store import PackedImageStore
+
+
+@PIPELINES.register_module()
+class LoadImageFromStore(LoadImageFromFile):
+    """Load an image from packed image stores instead of decoding it.
+
+    The image path (``img_prefix`` + ``img_info['filename']``) is looked up
+    in each :class:`PackedImageStore` in turn, so one test pipeline can serve
+    the stores of several splits. The result keys are the same as
+    :class:`LoadImageFromFile`. Without ``to_float32``, ``results['img']`` is
+    a read-only view of the store; the usual resize / normalize / pad stages
+    all return new arrays.
+
+    Args:
+        store (str | list[str]): Store prefixes written by
+            ``tools/dataset_converters/build_image_store.py``.
+        fallback (bool): Decode images missing from the stores from file
+            instead of raising a KeyError. Default: True.
+        **kwargs: See :class:`LoadImageFromFile`.
+    """
+
+    def __init__(self, store, fallback=True, **kwargs):
+        super(LoadImageFromStore, self).__init__(**kwargs)
+        self.store_prefixes = [store] if isinstance(store, str) else list(store)
+        self.fallback = fallback
+        self.stores = [PackedImageStore(prefix) for prefix in self.store_prefixes]
+
+    def __call__(self, results):
+        if results['img_prefix'] is not None:
+            filename = osp.join(results['img_prefix'], results['img_info']['filename'])
+        else:
+            filename = results['img_info']['filename']
+
+        img = None
+        for store in self.stores:
+            index = store.index_of(filename)
+            if index is not None:
+                img = store.get(index)
+                break
+        if img is None:
+            if self.fallback:
+                return super(LoadImageFromStore, self).__call__(results)
+            raise KeyError('%s is not in the image stores %s' % (filename, self.store_prefixes))
+
+        if self.color_type == 'color' and img.ndim == 2:
+            img = np.repeat(img[..., None], 3, axis=2)
+        if self.to_float32:
+            img = img.astype(np.float32)
+
+        results['filename'] = filename
+        results['ori_filename'] = results['img_info']['filename']
+        results['img'] = img
+        results['img_shape'] = img.shape
+        results['ori_shape'] = img.shape
+        results['img_fields'] = ['img']
+        return results
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}('
+                f'store={self.store_prefixes}, '
+                f'fallback={self.fallback}, '
+                f'to_float32={self.to_float32}, '
+                f"color_type='{self.color_type}')")
@@ -0,0 +1,4 @@
+from .time_to_accuracy_hook import TimeToAccuracyHook
+from .warm_start_hook import WarmStartHook
+
+__all__ = ['TimeToAccuracyHook', 'WarmStartHook']
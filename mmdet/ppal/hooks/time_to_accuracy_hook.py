@@ -0,0 +1,39 @@
+import os.path as osp
+import time
+
+import mmcv
+from mmcv.runner import master_only
+from mmcv.runner.hooks import HOOKS, Hook
+
+
+@HOOKS.register_module()
+class TimeToAccuracyHook(Hook):
+    """Record the training wall-clock time at which each validation result is reached.
+
+    After every training epoch the elapsed time since the start of the run
+    and the validation ``metric`` of that epoch are appended to
+    ``<work_dir>/time_to_accuracy.json``, which
+    :func:`mmdet.ppal.utils.running_checks.display_time_to_accuracy` reads
+    to compare AL rounds. The elapsed time includes the validation itself.
+
+    Register it with a priority between the ``EvalHook`` (``LOW``) and the
+    logger hooks (``VERY_LOW``), which clear the validation results.
+    """
+
+    def __init__(self, metric='bbox_mAP', out_file='time_to_accuracy.json'):
+        self.metric = metric
+        self.out_file = out_file
+        self.records = []
+
+    def before_run(self, runner):
+        self.start = time.time()
+        self.records = []
+
+    @master_only
+    def after_train_epoch(self, runner):
+        self.records.append(dict(
+            epoch=runner.epoch + 1,
+            iter=runner.iter,
+            time=time.time() - self.start,
+            metric=runner.log_buffer.output.get(self.metric)))
+        mmcv.dump(dict(metric=self.metric, records=self.records), osp.join(runner.work_dir, self.out_file), indent=2)
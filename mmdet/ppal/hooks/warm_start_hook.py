@@ -0,0 +1,41 @@
+from mmcv.parallel import is_module_wrapper
+from mmcv.runner import load_state_dict
+from mmcv.runner.checkpoint import _load_checkpoint
+from mmcv.runner.hooks import HOOKS, Hook
+
+
+@HOOKS.register_module()
+class WarmStartHook(Hook):
+    """Start training from the checkpoint of the previous AL round.
+
+    Unlike ``load_from``, the optimizer state (e.g. SGD momentum) can be
+    carried over too, and the EMA statistics of the heads (the
+    ``class_quality`` and ``class_momentum`` buffers of
+    ``RetinaQualityEMAHead``) can be left at their initialisation. The
+    epoch and iteration counters start from 0, as for a cold start.
+
+    Args:
+        checkpoint (str): Checkpoint of the previous round, e.g. its
+            ``latest.pth``.
+        resume_optimizer (bool): Load the optimizer state as well.
+        resume_ema (bool): Load the EMA buffers of the heads.
+    """
+
+    EMA_KEYS = ('class_quality', 'class_momentum')
+
+    def __init__(self, checkpoint, resume_optimizer=True, resume_ema=True):
+        self.checkpoint = checkpoint
+        self.resume_optimizer = resume_optimizer
+        self.resume_ema = resume_ema
+
+    def before_run(self, runner):
+        checkpoint = _load_checkpoint(self.checkpoint, map_location='cpu')
+        state_dict = checkpoint.get('state_dict', checkpoint)
+        if not self.resume_ema:
+            state_dict = {k: v for k, v in state_dict.items() if k.split('.')[-1] not in self.EMA_KEYS}
+        model = runner.model.module if is_module_wrapper(runner.model) else runner.model
+        load_state_dict(model, state_dict, strict=False, logger=runner.logger)
+        if self.resume_optimizer and 'optimizer' in checkpoint:
+            runner.optimizer.load_state_dict(checkpoint['optimizer'])
+        runner.logger.info('warm start from %s (optimizer: %s, EMA buffers: %s)' %
+                           (self.checkpoint, self.resume_optimizer and 'optimizer' in checkpoint, self.resume_ema))
@@ -2,3 +2,8 @@ from mmdet.ppal.models.retinanet_al.retinanet_uncertainty_head import RetinaHead
 from mmdet.ppal.models.retinanet_al.al_retinanet import ALRetinaNet
 from mmdet.ppal.models.retinanet_al.al_retinanet_feat_head import RetinaHeadFeat
 from mmdet.ppal.models.retinanet_al.retinanet_quality_head import RetinaQualityEMAHead
+from mmdet.ppal.models.retinanet_al.retinanet_fused_head import RetinaHeadUncertaintyFeat
+from mmdet.ppal.models.retinanet_al.batch_aug_retinanet import BatchAugRetinaNet
+from mmdet.ppal.models.batch_augment import BatchAugment
+from mmdet.ppal.models.center_al.puncta_center_head import PunctaCenterHead, PunctaCenterHeadUncertainty
+from mmdet.ppal.models.center_al.puncta_center_feat_head import PunctaCenterHeadUncertaintyFeat
@@ -0,0 +1,139 @@
+import math
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+
+def bgr_to_hsv(img):
+    """``[N, 3, H, W]`` BGR in [0, 255] to HSV with H in degrees, S and V in [0, 255]."""
+    b, g, r = img.unbind(1)
+    v, _ = img.max(dim=1)
+    delta = v - img.min(dim=1)[0]
+    s = torch.where(v > 0, delta / v.clamp(min=1e-6) * 255, torch.zeros_like(v))
+    d = delta.clamp(min=1e-6)
+    h = torch.where(v == r, 60 * (g - b) / d, torch.where(v == g, 120 + 60 * (b - r) / d, 240 + 60 * (r - g) / d))
+    h = torch.where(delta > 0, h % 360, torch.zeros_like(h))
+    return h, s, v
+
+
+def hsv_to_bgr(h, s, v):
+    s = s / 255
+    channels = []
+    for n in (1, 3, 5):  # B, G, R
+        k = (n + h / 60) % 6
+        channels.append(v - v * s * torch.clamp(torch.min(k, 4 - k), 0, 1))
+    return torch.stack(channels, dim=1)
+
+
+class BatchAugment(object):
+    """Training augmentation of a collated ``[N, 3, H, W]`` batch.
+
+    Runs ``RandomFlip``, ``RandomRotate``, ``ColorJitter`` and ``Normalize``
+    of the training pipeline as tensor ops on the device of the batch, so
+    the data workers only decode and pad uint8 images. Flip and rotation
+    are one ``grid_sample`` (bilinear, zero border like ``cv2.warpAffine``)
+    and move the gt boxes with the same affine transform. The jitter is
+    done in float HSV, it matches ``ColorJitter`` up to the uint8 HSV
+    quantization of cv2.
+
+    Args:
+        img_norm_cfg (dict): ``mean``, ``std`` and ``to_rgb`` as for ``Normalize``.
+        flip_ratio (float): Probability of a horizontal flip.
+        rotate_level (float): Rotation angles are uniform in
+            ``[-rotate_level, rotate_level]`` degrees.
+        rotate_prob (float): Probability of a rotation.
+        color_jitter (dict, optional): ``brightness``, ``contrast``,
+            ``saturation`` and ``hue`` as for ``ColorJitter``, applied to
+            every image. None to skip it.
+    """
+
+    def __init__(self, img_norm_cfg, flip_ratio=0.5, rotate_level=15, rotate_prob=0.5, color_jitter=None):
+        self.mean = np.array(img_norm_cfg['mean'], dtype=np.float32)
+        self.std = np.array(img_norm_cfg['std'], dtype=np.float32)
+        self.to_rgb = img_norm_cfg.get('to_rgb', True)
+        self.flip_ratio = flip_ratio
+        self.rotate_level = rotate_level
+        self.rotate_prob = rotate_prob
+        self.color_jitter = None if color_jitter is None else \
+            dict(dict(brightness=0.2, contrast=0.2, saturation=0.2, hue=0.2), **color_jitter)
+
+    def __call__(self, img, img_metas, gt_bboxes):
+        n_images = img.size(0)
+        flip = torch.rand(n_images) < self.flip_ratio
+        rotate = torch.rand(n_images) < self.rotate_prob
+        angle = (torch.rand(n_images) * 2 - 1) * self.rotate_level * rotate
+        return self.transform(img, img_metas, gt_bboxes, flip, angle)
+
+    @staticmethod
+    def affine_matrices(img_shapes, flip, angle):
+        """Flip then rotate about the image centre, as ``cv2.getRotationMatrix2D``.
+
+        Returns:
+            tuple[Tensor]: ``[N, 3, 3]`` transforms of pixel centres and of
+                box coordinates, which differ by half a pixel in the flip.
+        """
+        h, w = torch.tensor([shape[:2] for shape in img_shapes], dtype=torch.float64).unbind(1)
+        alpha = torch.cos(angle.double() * math.pi / 180)
+        beta = torch.sin(angle.double() * math.pi / 180)
+        rot = torch.zeros((len(img_shapes), 3, 3), dtype=torch.float64)
+        rot[:, 0, 0], rot[:, 0, 1], rot[:, 0, 2] = alpha, beta, (1 - alpha) * w / 2 - beta * h / 2
+        rot[:, 1, 0], rot[:, 1, 1], rot[:, 1, 2] = -beta, alpha, beta * w / 2 + (1 - alpha) * h / 2
+        rot[:, 2, 2] = 1
+        flips = []
+        for offset in (1, 0):
+            mat = torch.eye(3, dtype=torch.float64).repeat(len(img_shapes), 1, 1)
+            mat[flip, 0, 0] = -1
+            mat[flip, 0, 2] = w[flip] - offset
+            flips.append(rot @ mat)
+        return tuple(flips)
+
+    def transform(self, img, img_metas, gt_bboxes, flip, angle):
+        """Augment with given per image ``flip`` (bool) and ``angle`` (degrees)."""
+        n_images, _, pad_h, pad_w = img.shape
+        img = img.float()
+        img_shapes = [meta['img_shape'] for meta in img_metas]
+        pix_mats, box_mats = self.affine_matrices(img_shapes, flip, angle)
+
+        moved = (flip | (angle != 0)).tolist()
+        if any(moved):
+            inds = [i for i in range(n_images) if moved[i]]
+            # output pixel -> source pixel, normalized for grid_sample(align_corners=False)
+            inv = torch.inverse(pix_mats[inds])[:, :2].to(device=img.device, dtype=img.dtype)
+            xs = torch.arange(pad_w, device=img.device, dtype=img.dtype)[None, :].expand(pad_h, -1)
+            ys = torch.arange(pad_h, device=img.device, dtype=img.dtype)[:, None].expand(-1, pad_w)
+            grid = torch.einsum('nij,hwj->nhwi', inv[:, :, :2], torch.stack([xs, ys], -1)) + inv[:, None, None, :, 2]
+            grid = (2 * grid + 1) / grid.new_tensor([pad_w, pad_h]) - 1
+            img[inds] = F.grid_sample(img[inds], grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+
+            n_boxes = [len(bboxes) for bboxes in gt_bboxes]
+            bboxes = torch.cat(gt_bboxes)
+            mats = box_mats.to(device=bboxes.device, dtype=bboxes.dtype).repeat_interleave(
+                torch.tensor(n_boxes, device=bboxes.device), dim=0)
+            corners = bboxes[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+            corners = corners @ mats[:, :2, :2].transpose(1, 2) + mats[:, None, :2, 2]
+            gt_bboxes = list(torch.cat([corners.min(dim=1)[0], corners.max(dim=1)[0]], dim=1).split(n_boxes))
+
+        if self.color_jitter is not None:
+            cfg = self.color_jitter
+            h, s, v = bgr_to_hsv(img)
+            v = (v + int(cfg['brightness'] * 255)).clamp(0, 255)
+            v = (v * (1 + cfg['contrast'])).clamp(0, 255)
+            s = (s * (1 + cfg['saturation'])).clamp(0, 255)
+            h = (h + 2 * int(cfg['hue'] * 180)) % 360  # cv2 uint8 hue is in units of 2 degrees
+            img = hsv_to_bgr(h, s, v)
+
+        if self.to_rgb:
+            img = img.flip(1)
+        img = (img - img.new_tensor(self.mean)[:, None, None]) / img.new_tensor(self.std)[:, None, None]
+        # padding stays 0 after normalization, as with Normalize before Pad
+        if any(tuple(shape[:2]) != (pad_h, pad_w) for shape in img_shapes):
+            valid = img.new_zeros((n_images, 1, pad_h, pad_w))
+            for i, shape in enumerate(img_shapes):
+                valid[i, :, :shape[0], :shape[1]] = 1
+            img = img * valid
+
+        img_norm_cfg = dict(mean=self.mean, std=self.std, to_rgb=self.to_rgb)
+        for meta, flipped in zip(img_metas, flip.tolist()):
+            meta.update(flip=flipped, flip_direction='horizontal' if flipped else None, img_norm_cfg=img_norm_cfg)
+        return img, img_metas, gt_bboxes
@@ -0,0 +1,107 @@
+import numpy as np
+import torch
+
+from mmcv.ops import batched_nms
+
+
+def batched_topk_candidates(cls_scores, bbox_preds, mlvl_priors, img_metas, bbox_coder,
+                            cls_out_channels, use_sigmoid_cls, nms_pre=-1):
+    """Pre-NMS candidates of a batch of images.
+
+    Same selection as ``filter_scores_and_topk`` (positive scores, top
+    ``nms_pre`` per level) and the same decoding as ``_get_bboxes_single``,
+    but with one sort per level over the ``(B, num_priors * num_classes)``
+    scores and one ``bbox_coder.decode`` per distinct ``img_shape``. Sorting
+    is stable, so among equal scores the first prior / class wins; the
+    ``topk`` of the per-image path is not, so on score ties at the
+    ``nms_pre`` cut the two paths may keep different candidates.
+
+    Returns:
+        dict: Candidates of all images, ordered by image, then level, then
+            descending score: ``img_inds``, ``lvl_inds``, ``scores``,
+            ``labels`` and decoded ``bboxes`` at network input scale.
+    """
+    n_images = len(img_metas)
+    cands = dict(img_inds=[], lvl_inds=[], scores=[], labels=[], priors=[], deltas=[])
+    for lvl, (cls_score, bbox_pred, priors) in enumerate(zip(cls_scores, bbox_preds, mlvl_priors)):
+        assert cls_score.size()[-2:] == bbox_pred.size()[-2:]
+        cls_score = cls_score.permute(0, 2, 3, 1).reshape(n_images, -1, cls_out_channels)
+        if use_sigmoid_cls:
+            scores = cls_score.sigmoid()
+        else:
+            scores = cls_score.softmax(-1)[..., :-1]
+        num_classes = scores.shape[-1]
+        scores = scores.reshape(n_images, -1)
+        k = scores.shape[1] if nms_pre <= 0 else min(nms_pre, scores.shape[1])
+        scores, inds = scores.sort(dim=1, descending=True, stable=True)
+        scores, inds = scores[:, :k], inds[:, :k]
+        prior_inds = torch.div(inds, num_classes, rounding_mode='floor')
+        bbox_pred = bbox_pred.permute(0, 2, 3, 1).reshape(n_images, -1, 4)
+
+        valid = scores > 0
+        img_inds = torch.arange(n_images, device=scores.device)[:, None].expand(-1, k)[valid]
+        cands['img_inds'].append(img_inds)
+        cands['lvl_inds'].append(torch.full_like(img_inds, lvl))
+        cands['scores'].append(scores[valid])
+        cands['labels'].append((inds % num_classes)[valid])
+        cands['priors'].append(priors[prior_inds[valid]])
+        cands['deltas'].append(bbox_pred[img_inds, prior_inds[valid]])
+
+    # back to image-major order, levels stay in order inside an image
+    cands = {k: torch.cat(v) for k, v in cands.items()}
+    order = torch.sort(cands['img_inds'], stable=True)[1]
+    cands = {k: v[order] for k, v in cands.items()}
+
+    priors, deltas = cands.pop('priors'), cands.pop('deltas')
+    cands['bboxes'] = deltas.new_zeros(deltas.shape)
+    img_shapes = [tuple(meta['img_shape']) for meta in img_metas]
+    for img_shape in set(img_shapes):
+        same_shape = cands['img_inds'].new_tensor([s == img_shape for s in img_shapes], dtype=torch.bool)
+        rows = same_shape[cands['img_inds']]
+        if rows.any():
+            cands['bboxes'][rows] = bbox_coder.decode(priors[rows], deltas[rows], max_shape=img_shape)
+    return cands
+
+
+def rescale_candidates(bboxes, img_inds, img_metas):
+    """Divide candidate boxes by the ``scale_factor`` of their image."""
+    scale_factors = bboxes.new_tensor(np.stack([
+        np.broadcast_to(np.asarray(meta['scale_factor'], dtype=np.float32), (4, )) for meta in img_metas]))
+    return bboxes / scale_factors[img_inds]
+
+
+def batched_nms_per_image(bboxes, scores, labels, img_inds, n_images, num_classes, nms_cfg, max_per_img):
+    """NMS over the candidates of a whole batch with a single NMS call.
+
+    Images are kept apart like classes: ``batched_nms`` offsets every
+    (image, class) group of boxes past the others. Offset coordinates are
+    float32, so the IoUs are rounded differently than in per-image NMS.
+    The results equal the per-image loop up to float rounding and the
+    order of tied scores: a pair of boxes with an IoU within rounding of
+    the threshold may be kept by one path and suppressed by the other.
+
+    Returns:
+        tuple: ``dets`` ``[n, 5]`` and ``keep`` (indices into the candidates)
+            with the kept boxes of each image contiguous, in descending score
+            order and at most ``max_per_img`` per image, and the list of the
+            number of kept boxes of each image.
+    """
+    if bboxes.numel() == 0:
+        return bboxes.new_zeros((0, 5)), img_inds.new_zeros((0, )), [0] * n_images
+    # split_thr would fall back to one NMS per group above 10000 boxes
+    nms_cfg = dict(nms_cfg, split_thr=float('inf'))
+    dets, keep = batched_nms(bboxes, scores, img_inds * num_classes + labels, nms_cfg)
+    order = torch.sort(img_inds[keep], stable=True)[1]
+    dets, keep = dets[order], keep[order]
+
+    kept_img_inds = img_inds[keep]
+    counts = torch.bincount(kept_img_inds, minlength=n_images)
+    starts = torch.cumsum(counts, 0) - counts
+    rank = torch.arange(len(keep), device=keep.device) - starts[kept_img_inds]
+    top = rank < max_per_img
+    return dets[top], keep[top], counts.clamp(max=max_per_img).tolist()
+
+
+def cls_uncertainty(cls_scores):
+    """Binary entropy of the detection scores, as returned by the AL heads."""
+    return -1 * (cls_scores * torch.log(cls_scores + 1e-10) + (1 - cls_scores) * torch.log((1 - cls_scores) + 1e-10))
@@ -0,0 +1,76 @@
+import torch
+
+from mmcv.runner import get_dist_info
+
+from mmdet.models.builder import HEADS
+from mmdet.ppal.models.batched_test import cls_uncertainty, rescale_candidates
+from mmdet.ppal.models.center_al.puncta_center_head import PunctaCenterHeadUncertainty
+from mmdet.ppal.models.retinanet_al.al_retinanet_feat_head import RetinaHeadFeat
+from mmdet.ppal.models.utils import (concat_all_gather, get_inter_feats_batched, pack_det_info, save_det_feat_cache,
+                                     unpack_det_info)
+
+
+@HEADS.register_module()
+class PunctaCenterHeadUncertaintyFeat(PunctaCenterHeadUncertainty):
+    """Single-pass AL head of :class:`PunctaCenterHead`, as :class:`RetinaHeadUncertaintyFeat`.
+
+    Returns the per-box ``cls_uncertainty`` of
+    :class:`PunctaCenterHeadUncertainty` and collects the embeddings of the
+    ``max_det`` highest scoring detections of every image, sampled from the
+    neck output the head runs on at the detection centres. Once
+    ``total_images`` images are seen they are written to ``output_path``
+    with :func:`save_det_feat_cache`, the cache ``DiversitySampler`` reads
+    with ``fused_inference``.
+    """
+
+    def __init__(self, total_images, max_det, feat_dim, output_path, **kwargs):
+        super(PunctaCenterHeadUncertaintyFeat, self).__init__(**kwargs)
+        self.max_det = max_det
+        self.feat_dim = feat_dim
+        self.reset_queue(total_images, output_path=output_path)
+
+    def reset_queue(self, total_images, output_path=None):
+        """Start collecting a new pool of ``total_images`` images."""
+        self.total_images = total_images
+        self.current_images = 0
+        self.det_info = []
+        if output_path is not None:
+            self.output_path = output_path
+
+    def simple_test_bboxes(self, feats, img_metas, rescale=False):
+        outs = self.forward(feats)
+        det_bboxes, det_labels, img_inds, counts = self._decode_batch(*outs, img_metas)
+
+        # embeddings of the top max_det detections of each image, sampled at network input scale
+        counts_t = img_inds.new_tensor(counts)
+        rank = torch.arange(len(img_inds), device=img_inds.device) - (torch.cumsum(counts_t, 0) - counts_t)[img_inds]
+        embedded = rank < self.max_det
+        det_feats = get_inter_feats_batched(
+            [feats[self.in_index]], img_inds[embedded], torch.zeros_like(img_inds[embedded]),
+            det_bboxes[embedded, :4], [img_meta['img_shape'] for img_meta in img_metas])
+        embedded_counts = [min(n, self.max_det) for n in counts]
+        for img_meta, labels, scores, img_feats in zip(img_metas, det_labels[embedded].split(embedded_counts),
+                                                       det_bboxes[embedded, 4].split(embedded_counts),
+                                                       det_feats.split(embedded_counts)):
+            self.det_info.append(pack_det_info(RetinaHeadFeat._image_id(img_meta), labels, scores, img_feats,
+                                               self.max_det))
+        self._step_queue(len(img_metas))
+
+        if rescale:
+            det_bboxes = torch.cat([rescale_candidates(det_bboxes[:, :4], img_inds, img_metas), det_bboxes[:, 4:]], 1)
+        cls_uncertainties = cls_uncertainty(det_bboxes[:, -1])
+        return list(zip(det_bboxes.split(counts), det_labels.split(counts), cls_uncertainties.split(counts),
+                        torch.zeros_like(cls_uncertainties).split(counts)))
+
+    def _step_queue(self, n_images):
+        # distributed samplers pad the pool, so every rank holds as many images
+        rank, world_size = get_dist_info()
+        self.current_images += n_images * world_size
+        if self.current_images < self.total_images:
+            return
+        packed = concat_all_gather(torch.stack(self.det_info))
+        self.det_info = []
+        if rank == 0:
+            image_ids, det_labels, det_scores, det_feats = unpack_det_info(packed, self.max_det, self.feat_dim)
+            save_det_feat_cache(self.output_path, image_ids.cpu().numpy(), det_labels.cpu().numpy(),
+                                det_scores.cpu().numpy(), det_feats.cpu().numpy())
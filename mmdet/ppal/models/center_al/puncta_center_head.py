@@ -0,0 +1,190 @@
+import torch
+
+from mmcv.runner import force_fp32
+
+from mmdet.core import multi_apply
+from mmdet.models.builder import HEADS
+from mmdet.models.dense_heads.centernet_head import CenterNetHead
+from mmdet.ppal.models.batched_test import cls_uncertainty, rescale_candidates
+
+
+def gaussian_radius_batched(height, width, min_overlap):
+    """``gaussian_radius`` of CornerNet for ``[n]`` box heights and widths.
+
+    As the scalar version, the terms are in the dtype of the boxes and the
+    square roots in float64.
+    """
+    def sqrt(x):
+        return torch.sqrt(x.double()).to(x.dtype)
+
+    b1 = height + width
+    c1 = width * height * (1 - min_overlap) / (1 + min_overlap)
+    r1 = (b1 - sqrt(b1 ** 2 - 4 * c1)) / 2
+    b2 = 2 * (height + width)
+    c2 = (1 - min_overlap) * width * height
+    r2 = (b2 - sqrt(b2 ** 2 - 4 * 4 * c2)) / (2 * 4)
+    a3 = 4 * min_overlap
+    b3 = -2 * min_overlap * (height + width)
+    c3 = (min_overlap - 1) * width * height
+    r3 = (b3 + sqrt(b3 ** 2 - 4 * a3 * c3)) / (2 * a3)
+    return torch.min(torch.min(r1, r2), r3)
+
+
+def _last_of_each(keys):
+    # index of the last occurrence of each distinct key, as sequential writes would leave it
+    order = torch.sort(keys, stable=True)[1]
+    last = torch.ones_like(order, dtype=torch.bool)
+    last[:-1] = keys[order][1:] != keys[order][:-1]
+    return order[last]
+
+
+@HEADS.register_module()
+class PunctaCenterHead(CenterNetHead):
+    """Centre heatmap head on a single level of the neck.
+
+    ``CenterNetHead`` on the ``in_index`` output of the neck only (stride 4
+    with ``FPN(start_level=0)``), in place of 9 anchors on each of 5 FPN
+    levels: every puncta is one peak of the heatmap, with a sub-pixel
+    offset and its width and height. There are no anchors to assign, the
+    Gaussian targets of all ground truths of a batch are drawn at once
+    (:meth:`get_targets`) and the local maxima of the whole batch are
+    decoded at once (:meth:`get_bboxes`).
+
+    Args:
+        in_index (int): Neck output the head runs on. Default: 0.
+    """
+
+    def __init__(self, *args, in_index=0, **kwargs):
+        super(PunctaCenterHead, self).__init__(*args, **kwargs)
+        self.in_index = in_index
+
+    def forward(self, feats):
+        """Forward the ``in_index`` level of ``feats``, the outputs are lists of one level."""
+        return multi_apply(self.forward_single, [feats[self.in_index]])
+
+    def get_targets(self, gt_bboxes, gt_labels, feat_shape, img_shape):
+        """Same targets as ``CenterNetHead.get_targets``, without a loop over the ground truths.
+
+        Each ground truth covers the ``(2 * radius + 1) ** 2`` window of its
+        Gaussian; the maximum over the ground truths of each heatmap cell
+        and the wh / offset targets of the last ground truth of each centre
+        cell are taken by sorting instead of by sequential writes.
+        """
+        img_h, img_w = img_shape[:2]
+        bs, _, feat_h, feat_w = feat_shape
+
+        width_ratio = float(feat_w / img_w)
+        height_ratio = float(feat_h / img_h)
+
+        center_heatmap_target = gt_bboxes[-1].new_zeros([bs, self.num_classes, feat_h, feat_w])
+        wh_target = gt_bboxes[-1].new_zeros([bs, 2, feat_h, feat_w])
+        offset_target = gt_bboxes[-1].new_zeros([bs, 2, feat_h, feat_w])
+        wh_offset_target_weight = gt_bboxes[-1].new_zeros([bs, 2, feat_h, feat_w])
+
+        gt_bbox = torch.cat(gt_bboxes)
+        if len(gt_bbox) > 0:
+            gt_label = torch.cat(gt_labels).long()
+            img_inds = torch.cat([
+                torch.full((len(bboxes), ), i, dtype=torch.long, device=gt_bbox.device)
+                for i, bboxes in enumerate(gt_bboxes)])
+            ctx = (gt_bbox[:, 0] + gt_bbox[:, 2]) * width_ratio / 2
+            cty = (gt_bbox[:, 1] + gt_bbox[:, 3]) * height_ratio / 2
+            ctx_int, cty_int = ctx.int().long(), cty.int().long()
+            scale_box_h = (gt_bbox[:, 3] - gt_bbox[:, 1]) * height_ratio
+            scale_box_w = (gt_bbox[:, 2] - gt_bbox[:, 0]) * width_ratio
+            radius = gaussian_radius_batched(scale_box_h, scale_box_w, min_overlap=0.3).long().clamp(min=0)
+
+            # Gaussian window of every ground truth, gaussian2D with sigma = diameter / 6
+            r_max = int(radius.max())
+            steps = torch.arange(-r_max, r_max + 1, device=gt_bbox.device)
+            dy, dx = steps.view(1, -1, 1), steps.view(1, 1, -1)
+            sigma = (2 * radius + 1).double() / 6
+            denom = (2 * sigma * sigma).to(gt_bbox.dtype).view(-1, 1, 1)
+            gaussian = (-(dx * dx + dy * dy).to(gt_bbox.dtype) / denom).exp()
+            x, y = ctx_int.view(-1, 1, 1) + dx, cty_int.view(-1, 1, 1) + dy
+            r = radius.view(-1, 1, 1)
+            valid = (dx.abs() <= r) & (dy.abs() <= r) & (x >= 0) & (x < feat_w) & (y >= 0) & (y < feat_h) & \
+                (gaussian >= torch.finfo(gaussian.dtype).eps)
+            group = (img_inds * self.num_classes + gt_label).view(-1, 1, 1).expand_as(valid)
+            cells = ((group * feat_h + y) * feat_w + x)[valid]
+            values = gaussian[valid]
+            # largest value of each cell: sorted by value, then by cell
+            order = torch.sort(values, stable=True)[1]
+            last = _last_of_each(cells[order])
+            center_heatmap_target.view(-1)[cells[order][last]] = values[order][last]
+
+            centers = _last_of_each((img_inds * feat_h + cty_int) * feat_w + ctx_int)
+            b, cy, cx = img_inds[centers], cty_int[centers], ctx_int[centers]
+            wh_target[b, 0, cy, cx] = scale_box_w[centers]
+            wh_target[b, 1, cy, cx] = scale_box_h[centers]
+            offset_target[b, 0, cy, cx] = (ctx - ctx_int)[centers]
+            offset_target[b, 1, cy, cx] = (cty - cty_int)[centers]
+            wh_offset_target_weight[b, :, cy, cx] = 1
+
+        avg_factor = max(1, center_heatmap_target.eq(1).sum())
+        target_result = dict(
+            center_heatmap_target=center_heatmap_target,
+            wh_target=wh_target,
+            offset_target=offset_target,
+            wh_offset_target_weight=wh_offset_target_weight)
+        return target_result, avg_factor
+
+    def _decode_batch(self, center_heatmap_preds, wh_preds, offset_preds, img_metas):
+        """Detections above ``test_cfg.score_thr`` of a batch at network input scale.
+
+        Returns:
+            tuple: ``dets`` ``[n, 5]`` and ``labels`` of all images, image by
+                image in descending score order, the image of each detection
+                and the number of detections of each image.
+        """
+        assert len(center_heatmap_preds) == len(wh_preds) == len(offset_preds) == 1
+        batch_det_bboxes, batch_labels = self.decode_heatmap(
+            center_heatmap_preds[0],
+            wh_preds[0],
+            offset_preds[0],
+            img_metas[0]['batch_input_shape'],
+            k=self.test_cfg.topk,
+            kernel=self.test_cfg.local_maximum_kernel)
+        # border of RandomCenterCropPad, if the pipeline has one
+        borders = batch_det_bboxes.new_tensor([img_meta.get('border', (0, 0, 0, 0)) for img_meta in img_metas])
+        batch_det_bboxes[..., :4] -= borders[:, None, [2, 0, 2, 0]]
+
+        keep = batch_det_bboxes[..., 4] > self.test_cfg.get('score_thr', 0.)
+        img_inds = torch.arange(len(img_metas), device=keep.device)[:, None].expand_as(keep)[keep]
+        return batch_det_bboxes[keep], batch_labels[keep], img_inds, keep.sum(dim=1).tolist()
+
+    @force_fp32(apply_to=('center_heatmap_preds', 'wh_preds', 'offset_preds'))
+    def get_bboxes(self,
+                   center_heatmap_preds,
+                   wh_preds,
+                   offset_preds,
+                   img_metas,
+                   rescale=True,
+                   with_nms=False):
+        """Same results as ``CenterNetHead.get_bboxes`` (up to ``score_thr``), decoded for the whole batch at once."""
+        det_bboxes, det_labels, img_inds, counts = self._decode_batch(
+            center_heatmap_preds, wh_preds, offset_preds, img_metas)
+        if rescale:
+            det_bboxes = torch.cat([rescale_candidates(det_bboxes[:, :4], img_inds, img_metas), det_bboxes[:, 4:]], 1)
+        result_list = list(zip(det_bboxes.split(counts), det_labels.split(counts)))
+        if with_nms:
+            result_list = [self._bboxes_nms(bboxes, labels, self.test_cfg) for bboxes, labels in result_list]
+        return result_list
+
+
+@HEADS.register_module()
+class PunctaCenterHeadUncertainty(PunctaCenterHead):
+    """:class:`PunctaCenterHead` with the per-box outputs of :class:`RetinaHeadUncertainty` for ``ALRetinaNet``."""
+
+    @force_fp32(apply_to=('center_heatmap_preds', 'wh_preds', 'offset_preds'))
+    def get_bboxes(self,
+                   center_heatmap_preds,
+                   wh_preds,
+                   offset_preds,
+                   img_metas,
+                   rescale=True,
+                   with_nms=False):
+        result_list = super(PunctaCenterHeadUncertainty, self).get_bboxes(
+            center_heatmap_preds, wh_preds, offset_preds, img_metas, rescale=rescale, with_nms=with_nms)
+        return [(det_bboxes, det_labels, cls_uncertainty(det_bboxes[:, -1]), det_bboxes.new_zeros(len(det_bboxes)))
+                for det_bboxes, det_labels in result_list]
@@ -33,6 +33,10 @@ class ALRetinaNet(RetinaNet):
         """
         feat = self.extract_feat(img)
         results_list = self.bbox_head.simple_test(feat, img_metas, rescale=rescale)
+        if len(results_list) > 1:
+            # one device to host copy for the whole batch
+            counts = [len(det_bboxes) for det_bboxes, *_ in results_list]
+            results_list = list(zip(*[torch.cat(x).cpu().split(counts) for x in zip(*results_list)]))
         bbox_results = [
             bbox2result_with_uncertainty(det_bboxes, det_labels, cls_uncertainties, box_uncertainties, self.bbox_head.num_classes)
             for det_bboxes, det_labels, cls_uncertainties, box_uncertainties in results_list
@@ -12,17 +12,42 @@ from mmdet.core.utils import filter_scores_and_topk, select_single_mlvl
 from mmdet.models.builder import HEADS
 from mmdet.models.dense_heads.retina_head import RetinaHead
 
-from mmdet.ppal.models.utils import get_img_score_distance_matrix_slow, concat_all_gather, get_inter_feats
+from mmdet.ppal.models.batched_test import (batched_nms_per_image, batched_topk_candidates, cls_uncertainty,
+                                            rescale_candidates)
+from mmdet.ppal.models.utils import (DetFeatStream, ImageDistanceCache, get_img_score_distance_columns,
+                                     get_img_score_distance_cross, get_img_score_distance_matrix,
+                                     concat_all_gather, get_inter_feats, get_inter_feats_batched,
+                                     pack_det_info, unpack_det_info)
 
 @HEADS.register_module()
 class RetinaHeadFeat(RetinaHead):
-    def __init__(self, total_images, max_det, feat_dim, output_path, **kwargs):
+    def __init__(self, total_images, max_det, feat_dim, output_path,
+                 distance_engine='tiled', distance_metric='cosine', block_memory_mb=256,
+                 queue_mode='dense', stream_score_thr=0.03, stream_memmap=False, stream_chunk_images=1024,
+                 distance_cache=None, collect_batches=1, batched_test=False, **kwargs):
         super(RetinaHeadFeat, self).__init__(**kwargs)
 
+        # 'dense' keeps padded (total_images, max_det, feat_dim) queues on the model device,
+        # 'stream' keeps the detections above stream_score_thr of each rank on CPU in fp16 (see DetFeatStream)
+        assert queue_mode in ('dense', 'stream')
+        self.queue_mode = queue_mode
+        self.stream_score_thr = stream_score_thr
+        self.stream_memmap = stream_memmap
+        self.stream_chunk_images = stream_chunk_images
+        self.det_stream = None
+
+        # dense queues gather the detections of collect_batches test batches with one collective
+        self.collect_batches = collect_batches
+        self.pending_det_info = []
+        self.pending_batches = 0
+        # post-process a test batch at once (see _get_bboxes_batched) instead of image by image
+        self.batched_test = batched_test
+
         _, world_size = get_dist_info()
-        assert total_images % world_size == 0  # 8 GPUs
+        if queue_mode == 'dense':
+            assert total_images % world_size == 0  # 8 GPUs
         self.total_images = total_images
-        self.queue_length = total_images
+        self.queue_length = total_images if queue_mode == 'dense' else 0
         self.current_images = 0
 
         # Adjust max_det if necessary to accommodate more detections due to refined anchor settings
@@ -30,11 +55,106 @@ class RetinaHeadFeat(RetinaHead):
         self.feat_dim = feat_dim
         self.output_path = output_path
 
+        # 'tiled' processes blocks of image pairs under block_memory_mb, 'slow' is the per-image loop
+        self.distance_engine = distance_engine
+        self.distance_metric = distance_metric
+        self.block_memory_mb = block_memory_mb
+        # dict(path=..., policy='frozen' | 'recompute', max_images=...) to reuse distances across rounds,
+        # see ImageDistanceCache; None recomputes every pair without keeping them
+        self.distance_cache = distance_cache
+
         self.register_buffer("det_label_queue", torch.zeros((self.queue_length, max_det)))
         self.register_buffer("det_score_queue", torch.zeros((self.queue_length, max_det)))
         self.register_buffer("det_feat_queue", torch.zeros((self.queue_length, max_det, feat_dim)))
         self.register_buffer("image_id_queue", torch.zeros((self.queue_length, 1), dtype=torch.int) - 1)
 
+    def reset_queue(self, total_images, output_path=None):
+        """Re-size the collection queues so a resident model can score a new pool."""
+        _, world_size = get_dist_info()
+        if self.queue_mode == 'dense':
+            assert total_images % world_size == 0
+        device = self.det_feat_queue.device
+        self.total_images = total_images
+        self.queue_length = total_images if self.queue_mode == 'dense' else 0
+        self.current_images = 0
+        self.det_stream = None
+        self.pending_det_info = []
+        self.pending_batches = 0
+        if output_path is not None:
+            self.output_path = output_path
+
+        self.det_label_queue = torch.zeros((self.queue_length, self.max_det), device=device)
+        self.det_score_queue = torch.zeros((self.queue_length, self.max_det), device=device)
+        self.det_feat_queue = torch.zeros((self.queue_length, self.max_det, self.feat_dim), device=device)
+        self.image_id_queue = torch.zeros((self.queue_length, 1), dtype=torch.int, device=device) - 1
+
+    def _get_stream(self):
+        if self.det_stream is None:
+            rank, world_size = get_dist_info()
+            # distributed samplers give each rank ceil(total_images / world_size) images, rank 0 also receives the others
+            images_per_rank = (self.total_images + world_size - 1) // world_size
+            n_images = images_per_rank * (world_size if rank == 0 else 1)
+            memmap_path = '%s.stream_rank%d.mmap' % (self.output_path, rank) if self.stream_memmap else None
+            self.det_stream = DetFeatStream(
+                self.feat_dim, score_thr=self.stream_score_thr, capacity=n_images * self.max_det if memmap_path else 4096,
+                memmap_path=memmap_path)
+        return self.det_stream
+
+    def _gather_stream(self):
+        # move the streams of all ranks to rank 0 through files next to output_path
+        rank, world_size = get_dist_info()
+        if world_size == 1:
+            return
+        part_path = '%s.stream_rank%d.npz' % (self.output_path, rank)
+        self._get_stream().save(part_path)
+        torch.distributed.barrier()
+        if rank == 0:
+            for r in range(1, world_size):
+                self._get_stream().extend('%s.stream_rank%d.npz' % (self.output_path, r))
+                os.remove('%s.stream_rank%d.npz' % (self.output_path, r))
+            os.remove(part_path)
+
+    def _release_stream(self):
+        stream, self.det_stream = self.det_stream, None
+        if stream is not None and stream.memmap_path is not None:
+            os.remove(stream.memmap_path)
+
+    def _step_queue(self, n_images=1):
+        # called once per test batch after collect_det_info, runs compute_al when the whole pool is seen
+        rank, world_size = get_dist_info()
+        self.current_images += n_images * world_size
+        self.pending_batches += 1
+        done = self.current_images >= self.total_images
+        if self.queue_mode == 'dense' and (self.pending_batches >= self.collect_batches or done):
+            self._flush_det_info()
+        if not done:
+            return
+        torch.cuda.empty_cache()
+        if self.queue_mode == 'stream':
+            self._gather_stream()
+        if rank == 0:
+            self.compute_al()
+        elif torch.cuda.is_available():
+            torch.cuda.synchronize()
+        if self.queue_mode == 'stream':
+            self._release_stream()
+
+    def _flush_det_info(self):
+        # every rank holds the same number of pending images, as distributed samplers pad the pool
+        self.pending_batches = 0
+        if len(self.pending_det_info) == 0:
+            return
+        packed = concat_all_gather(torch.stack(self.pending_det_info))
+        self.pending_det_info = []
+        start = self.current_images - packed.shape[0]
+        end = min(self.current_images, self.queue_length)
+        packed = packed[:end - start]
+        image_ids, det_labels, det_scores, det_feats = unpack_det_info(packed, self.max_det, self.feat_dim)
+        self.image_id_queue[start:end] = image_ids
+        self.det_label_queue[start:end] = det_labels
+        self.det_score_queue[start:end] = det_scores
+        self.det_feat_queue[start:end] = det_feats
+
     def forward_single(self, x):
         """Forward feature of a single scale level.
 
@@ -127,6 +247,8 @@ class RetinaHeadFeat(RetinaHead):
                 the corresponding box.
         """
         assert len(cls_scores) == len(bbox_preds)
+        if self.batched_test and with_nms and score_factors is None:
+            return self._get_bboxes_batched(cls_scores, bbox_preds, fpn_feats, img_metas, cfg, rescale)
 
         if score_factors is None:
             # e.g. Retina, FreeAnchor, Foveabox, etc.
@@ -161,8 +283,53 @@ class RetinaHeadFeat(RetinaHead):
                                               img_meta, cfg, rescale, with_nms,
                                               **kwargs)
             result_list.append(results)
+        self._step_queue(len(img_metas))
         return result_list
 
+    def _num_embedded_dets(self, cfg):
+        # detections per image whose embeddings are collected
+        return cfg.max_per_img
+
+    def _get_bboxes_batched(self, cls_scores, bbox_preds, fpn_feats, img_metas, cfg, rescale):
+        """Batched counterpart of the per-image ``_get_bboxes_single`` and
+        ``_bbox_post_process``: candidates, NMS and embeddings of the whole
+        batch at once (see :mod:`mmdet.ppal.models.batched_test`), with the
+        same per-image results and collected detections."""
+        if not rescale:
+            raise NotImplementedError
+        cfg = self.test_cfg if cfg is None else cfg
+        featmap_sizes = [cls_score.shape[-2:] for cls_score in cls_scores]
+        mlvl_priors = self.prior_generator.grid_priors(
+            featmap_sizes, dtype=cls_scores[0].dtype, device=cls_scores[0].device)
+        cands = batched_topk_candidates(cls_scores, bbox_preds, mlvl_priors, img_metas, self.bbox_coder,
+                                        self.cls_out_channels, self.use_sigmoid_cls, cfg.get('nms_pre', -1))
+        bboxes = rescale_candidates(cands['bboxes'], cands['img_inds'], img_metas)
+        dets, keep, counts = batched_nms_per_image(
+            bboxes, cands['scores'], cands['labels'], cands['img_inds'], len(img_metas), self.num_classes,
+            cfg.nms, cfg.max_per_img)
+        det_labels = cands['labels'][keep]
+        det_scores = dets[:, -1]
+        cls_uncertainties = cls_uncertainty(det_scores)
+
+        # embeddings of the top _num_embedded_dets detections of each image, sampled at network input scale
+        n_embedded = self._num_embedded_dets(cfg)
+        img_inds = cands['img_inds'][keep]
+        counts_t = keep.new_tensor(counts)
+        rank = torch.arange(len(keep), device=keep.device) - (torch.cumsum(counts_t, 0) - counts_t)[img_inds]
+        embedded = rank < n_embedded
+        det_feats = get_inter_feats_batched(
+            fpn_feats, img_inds[embedded], cands['lvl_inds'][keep][embedded], cands['bboxes'][keep][embedded],
+            [img_meta['img_shape'] for img_meta in img_metas])
+        embedded_counts = [min(n, n_embedded) for n in counts]
+        for img_meta, labels, scores, feats in zip(img_metas, det_labels[embedded].split(embedded_counts),
+                                                   det_scores[embedded].split(embedded_counts),
+                                                   det_feats.split(embedded_counts)):
+            self.collect_det_info(img_meta, labels, scores, feats)
+        self._step_queue(len(img_metas))
+
+        return list(zip(dets.split(counts), det_labels.split(counts), cls_uncertainties.split(counts),
+                        torch.zeros_like(cls_uncertainties).split(counts)))
+
     def _get_bboxes_single(self,
                            cls_score_list,
                            bbox_pred_list,
@@ -360,57 +527,64 @@ class RetinaHeadFeat(RetinaHead):
             cls_uncertainties = -1 * (cls_scores * torch.log(cls_scores+1e-10) + (1-cls_scores) * torch.log((1-cls_scores) + 1e-10))
             box_uncertainties = torch.zeros_like(cls_uncertainties)
 
-            rank, world_size = get_dist_info()
             self.collect_det_info(img_meta, det_labels, cls_scores, det_feats)
-            self.current_images += world_size
-
-            if self.current_images >= self.total_images:
-                torch.cuda.empty_cache()
-                if rank == 0:
-                    self.compute_al()
-                else:
-                    torch.cuda.synchronize()
 
             return det_bboxes, det_labels, cls_uncertainties, box_uncertainties
         else:
             raise NotImplementedError
 
+    @staticmethod
+    def _image_id(img_meta):
+        # 'img_id' is kept by the Collect meta_keys of al_test_pipeline (ALPunctaDataset's id, or
+        # DefaultImageId's -1 without a dataset); the file names of the puncta sets are not the ids
+        if 'img_id' not in img_meta:
+            raise KeyError("'img_id' is not in img_metas, AL inference configs need "
+                           "pipeline={{_base_.al_test_pipeline}} in data.test")
+        return int(img_meta['img_id'])
+
     def collect_det_info(self, img_meta, det_labels, det_scores, det_feats):
-        if torch.distributed.is_initialized():
-            rank, world_size = get_dist_info()
+        image_id = self._image_id(img_meta)
+        if self.queue_mode == 'stream':
+            self._get_stream().append(image_id, det_labels, det_scores, det_feats)
         else:
-            world_size = 1  # Since we're not using distributed training
-
-        img_id = int(os.path.split(img_meta['filename'])[-1].split('.')[0])
-        img_id = torch.tensor([[img_id]], dtype=torch.int, device=self.image_id_queue.device)
-
-    # Debugging: Print tensor shapes before reshaping
-        print(f"Debug: det_labels shape before reshaping: {det_labels.shape}")
-        print(f"Debug: det_scores shape before reshaping: {det_scores.shape}")
-        print(f"Debug: det_feats shape before reshaping: {det_feats.shape}")
-
-    # Ensure that det_labels has enough elements to be reshaped to (1, self.max_det)
-        num_detections = det_labels.shape[0]
-    
-    # If fewer detections than max_det, pad the tensor
-        if num_detections < self.max_det:
-            padding_size = self.max_det - num_detections
-            det_labels = torch.cat([det_labels, det_labels.new_full((padding_size,), -1)])
-            det_scores = torch.cat([det_scores, det_scores.new_full((padding_size,), 0)])
-            det_feats = torch.cat([det_feats, det_feats.new_full((padding_size, self.feat_dim), 0)], dim=0)
-
-        collected_img_ids = concat_all_gather(img_id.reshape(1, 1))
-        self.image_id_queue[self.current_images:(self.current_images + world_size)] = collected_img_ids
-
-        collected_det_labels = concat_all_gather(det_labels.reshape(1, self.max_det))
-        collected_det_scores = concat_all_gather(det_scores.reshape(1, self.max_det).contiguous())
-        collected_det_feats  = concat_all_gather(det_feats.reshape(1, self.max_det, self.feat_dim).contiguous())
-        self.det_label_queue[self.current_images:(self.current_images + world_size)] = collected_det_labels
-        self.det_score_queue[self.current_images:(self.current_images + world_size)] = collected_det_scores
-        self.det_feat_queue[self.current_images:(self.current_images + world_size)] = collected_det_feats
-        return
+            self.pending_det_info.append(pack_det_info(image_id, det_labels, det_scores, det_feats, self.max_det))
+
+    def _compute_al_stream(self):
+        # image distances of the streamed detections, computed between chunks of stream_chunk_images images
+        stream = self._get_stream()
+        positions = stream.first_occurrences()
+        n_images = len(positions)
+        chunk = self.stream_chunk_images
+        kwargs = dict(score_thr=0.03, metric=self.distance_metric, block_memory_mb=self.block_memory_mb)
+        if self.distance_cache is not None:
+            def columns_fn(inds):
+                cols = stream.padded(positions[inds])
+                return torch.cat([get_img_score_distance_cross(*stream.padded(positions[r0:r0 + chunk]), *cols, **kwargs)
+                                  for r0 in range(0, n_images, chunk)]).numpy()
+
+            img_dis_mat = ImageDistanceCache(**self.distance_cache).distance_matrix(
+                np.asarray(stream.image_ids)[positions], columns_fn)
+        else:
+            img_dis_mat = np.zeros((n_images, n_images), dtype=np.float32)
+            for r0 in range(0, n_images, chunk):
+                rows = stream.padded(positions[r0:r0 + chunk])
+                for c0 in range(r0, n_images, chunk):
+                    cols = rows if c0 == r0 else stream.padded(positions[c0:c0 + chunk])
+                    dis = get_img_score_distance_cross(*rows, *cols, **kwargs).numpy()
+                    img_dis_mat[r0:r0 + chunk, c0:c0 + chunk] = dis
+                    img_dis_mat[c0:c0 + chunk, r0:r0 + chunk] = dis.T
+        img_ids = np.asarray(stream.image_ids, dtype=np.int32)[positions].reshape(-1, 1)
+
+        output_dir = os.path.dirname(self.output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        with open(self.output_path, 'wb') as fwb:
+            np.save(fwb, img_dis_mat)
+            np.save(fwb, img_ids)
 
     def compute_al(self):
+        if self.queue_mode == 'stream':
+            return self._compute_al_stream()
         try:
             # Filter out invalid indices (those with image_id_queue < 0)
             valid_inds = (self.image_id_queue >= 0).reshape(-1)
@@ -428,8 +602,16 @@ class RetinaHeadFeat(RetinaHead):
             print(f"Debug: Detected feature queue shape: {det_feat_queue.shape}")
 
             # Compute the image distance matrix using the provided method
-            img_dis_mat = get_img_score_distance_matrix_slow(
-                det_label_queue, det_score_queue, det_feat_queue, score_thr=0.03)  # Changed for puncta
+            if self.distance_cache is not None:
+                img_dis_mat = torch.from_numpy(ImageDistanceCache(**self.distance_cache).distance_matrix(
+                    image_id_queue.cpu().numpy(),
+                    lambda inds: get_img_score_distance_columns(
+                        det_label_queue, det_score_queue, det_feat_queue, inds, score_thr=0.03,
+                        metric=self.distance_metric, block_memory_mb=self.block_memory_mb).cpu()))
+            else:
+                img_dis_mat = get_img_score_distance_matrix(
+                    det_label_queue, det_score_queue, det_feat_queue, score_thr=0.03,  # Changed for puncta
+                    metric=self.distance_metric, engine=self.distance_engine, block_memory_mb=self.block_memory_mb)
 
             print("Debug: Image distance matrix computed successfully.")
 
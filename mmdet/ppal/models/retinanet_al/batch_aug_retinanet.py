@@ -0,0 +1,29 @@
+from mmdet.models.builder import DETECTORS
+from mmdet.models.detectors.retinanet import RetinaNet
+from mmdet.ppal.models.batch_augment import BatchAugment
+
+
+@DETECTORS.register_module()
+class BatchAugRetinaNet(RetinaNet):
+    """RetinaNet that augments the collated training batch on its device.
+
+    ``batch_augments`` are the arguments of :class:`BatchAugment`, the
+    training pipeline then stops after ``Pad`` on uint8 images. Testing is
+    unchanged.
+    """
+
+    def __init__(self,
+                 batch_augments=None,
+                 **kwargs):
+        super(BatchAugRetinaNet, self).__init__(**kwargs)
+        self.batch_augments = None if batch_augments is None else BatchAugment(**batch_augments)
+
+    def forward_train(self,
+                      img,
+                      img_metas,
+                      gt_bboxes,
+                      gt_labels,
+                      gt_bboxes_ignore=None):
+        if self.batch_augments is not None:
+            img, img_metas, gt_bboxes = self.batch_augments(img, img_metas, gt_bboxes)
+        return super(BatchAugRetinaNet, self).forward_train(img, img_metas, gt_bboxes, gt_labels, gt_bboxes_ignore)
@@ -0,0 +1,108 @@
+import numpy as np
+import torch
+
+from mmcv.ops import batched_nms
+
+from mmdet.models.builder import HEADS
+from mmdet.ppal.models.retinanet_al.al_retinanet_feat_head import RetinaHeadFeat
+from mmdet.ppal.models.utils import get_inter_feats, save_det_feat_cache
+
+
+@HEADS.register_module()
+class RetinaHeadUncertaintyFeat(RetinaHeadFeat):
+    """Single-pass head for uncertainty and diversity acquisition.
+
+    Returns the same per-box ``cls_uncertainty`` as
+    :class:`RetinaHeadUncertainty` and, in the same forward pass, collects
+    the ``get_inter_feats`` embeddings of every image like
+    :class:`RetinaHeadFeat`. Instead of computing the image distance matrix
+    over the whole unlabeled set, the collected detections are written to
+    ``output_path`` with :func:`save_det_feat_cache`; ``DiversitySampler``
+    later computes distances for the uncertainty-selected pool from there.
+
+    Only the ``max_det`` highest scoring boxes of an image are cached, while
+    up to ``test_cfg.max_per_img`` boxes are returned for uncertainty.
+    """
+
+    def _num_embedded_dets(self, cfg):
+        return min(self.max_det, cfg.max_per_img)
+
+    def _bbox_post_process(self,
+                           mlvl_scores,
+                           mlvl_labels,
+                           mlvl_bboxes,
+                           mlvl_feats,
+                           img_meta,
+                           cfg,
+                           rescale=False,
+                           with_nms=True,
+                           mlvl_score_factors=None,
+                           **kwargs):
+        assert len(mlvl_scores) == len(mlvl_bboxes) == len(mlvl_labels)
+        img_shape = img_meta['img_shape']
+
+        mlvl_bboxes_unscale = torch.cat(mlvl_bboxes)
+        if rescale:
+            mlvl_bboxes = mlvl_bboxes_unscale / mlvl_bboxes_unscale.new_tensor(img_meta['scale_factor'])
+        else:
+            raise NotImplementedError
+
+        lvl_inds = torch.cat([torch.zeros_like(x)+i for (i,x) in enumerate(mlvl_scores)])
+        mlvl_scores = torch.cat(mlvl_scores)
+        mlvl_labels = torch.cat(mlvl_labels)
+
+        if mlvl_score_factors is not None:
+            mlvl_score_factors = torch.cat(mlvl_score_factors)
+            mlvl_scores = mlvl_scores * mlvl_score_factors
+
+        if not with_nms:
+            raise NotImplementedError
+
+        if mlvl_bboxes.numel() == 0:
+            det_bboxes = torch.cat([mlvl_bboxes, mlvl_scores[:, None]], -1)
+            det_labels = mlvl_labels
+            det_feats = mlvl_bboxes.new_zeros((0, self.feat_dim))
+        else:
+            det_bboxes, keep_idxs = batched_nms(mlvl_bboxes, mlvl_scores, mlvl_labels, cfg.nms)
+            det_bboxes = det_bboxes[:cfg.max_per_img]
+            det_labels = mlvl_labels[keep_idxs][:cfg.max_per_img]
+
+            # NMS output is sorted by score, so the cache keeps the top max_det boxes
+            n_cached = min(self.max_det, cfg.max_per_img)
+            det_lvl_inds = lvl_inds[keep_idxs][:n_cached]
+            det_unscale_bboxes = mlvl_bboxes_unscale[keep_idxs][:n_cached]
+            det_feats = get_inter_feats(mlvl_feats, det_lvl_inds, det_unscale_bboxes, img_shape)
+
+        cls_scores = det_bboxes[:, -1]
+        cls_uncertainties = -1 * (cls_scores * torch.log(cls_scores+1e-10) + (1-cls_scores) * torch.log((1-cls_scores) + 1e-10))
+        box_uncertainties = torch.zeros_like(cls_uncertainties)
+
+        n_cached = det_feats.shape[0]
+        self.collect_det_info(img_meta, det_labels[:n_cached], cls_scores[:n_cached], det_feats)
+
+        return det_bboxes, det_labels, cls_uncertainties, box_uncertainties
+
+    def compute_al(self):
+        if self.queue_mode == 'stream':
+            # padded to the largest number of kept detections instead of max_det, embeddings stay fp16
+            stream = self._get_stream()
+            positions = stream.first_occurrences()
+            width = max([1] + np.diff(stream.offsets)[positions].tolist())
+            det_labels = np.full((len(positions), width), -1, dtype=np.float32)
+            det_scores = np.zeros((len(positions), width), dtype=np.float32)
+            det_feats = np.zeros((len(positions), width, self.feat_dim), dtype=np.float16)
+            for c0 in range(0, len(positions), self.stream_chunk_images):
+                c1 = c0 + self.stream_chunk_images
+                labels, scores, feats = stream.padded(positions[c0:c1], width=width)
+                det_labels[c0:c1], det_scores[c0:c1], det_feats[c0:c1] = labels.numpy(), scores.numpy(), feats.numpy()
+            save_det_feat_cache(
+                self.output_path, np.asarray(stream.image_ids)[positions], det_labels, det_scores, det_feats)
+            return
+
+        valid_inds = (self.image_id_queue >= 0).reshape(-1)
+        save_det_feat_cache(
+            self.output_path,
+            self.image_id_queue[valid_inds].cpu().numpy(),
+            self.det_label_queue[valid_inds].cpu().numpy(),
+            self.det_score_queue[valid_inds].cpu().numpy(),
+            self.det_feat_queue[valid_inds].cpu().numpy())
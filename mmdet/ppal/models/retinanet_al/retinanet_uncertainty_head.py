@@ -9,12 +9,53 @@ from mmcv.runner import BaseModule, force_fp32
 from mmdet.core.utils import filter_scores_and_topk, select_single_mlvl
 from mmdet.models.builder import HEADS
 from mmdet.models.dense_heads.retina_head import RetinaHead
+from mmdet.ppal.models.batched_test import (batched_nms_per_image, batched_topk_candidates, cls_uncertainty,
+                                            rescale_candidates)
 
 
 @HEADS.register_module()
 class RetinaHeadUncertainty(RetinaHead):
-    def __init__(self, **kwargs):
+    def __init__(self, batched_test=False, **kwargs):
         super(RetinaHeadUncertainty, self).__init__(**kwargs)
+        # post-process a test batch at once (see get_bboxes) instead of image by image
+        self.batched_test = batched_test
+
+    @force_fp32(apply_to=('cls_scores', 'bbox_preds'))
+    def get_bboxes(self,
+                   cls_scores,
+                   bbox_preds,
+                   score_factors=None,
+                   img_metas=None,
+                   cfg=None,
+                   rescale=False,
+                   with_nms=True,
+                   **kwargs):
+        """Transform network outputs of a batch into bbox results.
+
+        With ``batched_test``, candidate selection, decoding and NMS run
+        once for the whole batch (see :mod:`mmdet.ppal.models.batched_test`)
+        and give the same per-image results as the per-image path.
+        """
+        if not self.batched_test or not with_nms or score_factors is not None:
+            return super(RetinaHeadUncertainty, self).get_bboxes(
+                cls_scores, bbox_preds, score_factors, img_metas, cfg, rescale, with_nms, **kwargs)
+
+        cfg = self.test_cfg if cfg is None else cfg
+        featmap_sizes = [cls_score.shape[-2:] for cls_score in cls_scores]
+        mlvl_priors = self.prior_generator.grid_priors(
+            featmap_sizes, dtype=cls_scores[0].dtype, device=cls_scores[0].device)
+        cands = batched_topk_candidates(cls_scores, bbox_preds, mlvl_priors, img_metas, self.bbox_coder,
+                                        self.cls_out_channels, self.use_sigmoid_cls, cfg.nms_pre)
+        bboxes = cands['bboxes']
+        if rescale:
+            bboxes = rescale_candidates(bboxes, cands['img_inds'], img_metas)
+        dets, keep, counts = batched_nms_per_image(
+            bboxes, cands['scores'], cands['labels'], cands['img_inds'], len(img_metas), self.num_classes,
+            cfg.nms, cfg.max_per_img)
+
+        cls_uncertainties = cls_uncertainty(dets[:, -1])
+        return list(zip(dets.split(counts), cands['labels'][keep].split(counts),
+                        cls_uncertainties.split(counts), torch.zeros_like(cls_uncertainties).split(counts)))
 
     def _get_bboxes_single(self,
                            cls_score_list,
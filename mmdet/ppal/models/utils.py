@@ -3,6 +3,8 @@ import torch.nn.functional as F
 import numpy as np
 import os
 
+from mmdet.ppal.utils.running_checks import sys_echo
+
 INF = 1e12
 
 
@@ -135,6 +137,498 @@ def get_img_score_distance_matrix_slow(
             raise NotImplementedError
             return None
 
+
+def _distance_block_size(n_images, n_dets, feat_dim, metric, block_memory_mb):
+    # bytes of the temporaries built for one (image, image) pair:
+    # [n_dets, n_dets] distances plus masks, or [n_dets, n_dets, feat_dim] for kl
+    pair_elems = n_dets * n_dets * (feat_dim if metric == 'kl' else 4)
+    max_pairs = max(1, int(block_memory_mb * 1024 * 1024) // (4 * pair_elems))
+    return max(1, min(n_images, int(max_pairs ** 0.5)))
+
+
+def _reduce_distance_tile(feat_dis, labels_r, valid_r, scores_r, labels_c, valid_c, n_dets, same_label):
+    """Turn ``[br, bc, n_active, n_active]`` box distances into image distances.
+
+    ``scores_r`` keeps all ``n_dets`` slots so that the final weighted sums
+    run over the same number of elements as in the slow path.
+    """
+    n_rows, n_cols, n_active = feat_dis.shape[:3]
+    dets_indices = torch.arange(n_active, device=feat_dis.device)
+    feat_dis[:, :, dets_indices, dets_indices] = 0  # force diag to 0, avoid numerical unstable
+
+    if same_label:
+        label_invalid = labels_r[:n_rows, None, :n_active, None] != labels_c[None, :, None, :n_active]
+        feat_dis.masked_fill_(label_invalid, 2.)
+    score_valid = valid_r[:, None, :n_active, None] & valid_c[None, :, None, :n_active]
+    feat_dis.masked_fill_(~score_valid, INF)
+
+    feat_dis = feat_dis.min(dim=-1)[0]  # [br, bc, n_active]
+    feat_dis.masked_fill_(feat_dis > 2, 0.)
+    feat_dis = F.pad(feat_dis, (0, n_dets - n_active))
+    feat_dis = feat_dis * scores_r[:, None, :]
+
+    score_valid = (valid_r[:, None, :] & valid_c.any(dim=-1)[None, :, None]).to(dtype=scores_r.dtype)
+    norm = (score_valid * scores_r[:, None, :]).sum(dim=-1) + 0.00001
+    return feat_dis.sum(dim=-1) / norm
+
+
+@torch.no_grad()
+def get_img_score_distance_matrix_tiled(
+        all_labels,
+        all_scores,
+        all_feats,
+        score_thr=0.,
+        same_label=True,
+        metric='cosine',
+        block_memory_mb=256):
+    """Blocked version of :func:`get_img_score_distance_matrix_slow`.
+
+    Image pairs are processed in square tiles whose temporaries stay under
+    ``block_memory_mb`` instead of one Python iteration per image. Detection
+    slots that are below ``score_thr`` in every image are dropped before the
+    pairwise step, and for the symmetric metrics one box similarity tile
+    serves both the (i, j) and the (j, i) direction. Per-pair arithmetic
+    mirrors the slow path, but the blocked matrix products sum in a different
+    order, so the returned ``[n_images, n_images]`` CPU tensor matches the
+    slow one up to float32 rounding (``atol=1e-6``), not bit for bit.
+
+    ``'l2'`` is only available here: it is the euclidean distance between
+    L2-normalized embeddings, which shares the [0, 2] range (and therefore
+    the label / validity constants) of the cosine distance.
+    """
+    assert metric in ('l2', 'cosine', 'kl')
+    if metric == 'kl':
+        assert not same_label
+
+    n_images = all_labels.size(0)
+    n_dets = all_labels.size(1)
+    feat_dim = all_feats.size(-1)
+
+    all_score_valid = all_scores > score_thr
+    # slots past the last valid detection of every image never contribute
+    valid_slots = all_score_valid.any(dim=0).nonzero()
+    n_active = int(valid_slots.max()) + 1 if valid_slots.numel() > 0 else 1
+    active_feats = all_feats[:, :n_active]
+
+    if metric in ('cosine', 'l2'):
+        active_feats = F.normalize(active_feats, p=2, dim=-1).reshape(n_images * n_active, feat_dim)
+    else:
+        eps = 1e-12
+        active_log_feats = (active_feats + eps).log()
+
+    def box_distance(sim):
+        if metric == 'cosine':
+            return -1 * sim + 1
+        return (2 - 2 * sim).clamp(min=0).sqrt()
+
+    block = _distance_block_size(n_images, n_active, feat_dim, metric, block_memory_mb)
+    distances = all_feats.new_zeros((n_images, n_images), device='cpu')
+    for r0 in range(0, n_images, block):
+        r1 = min(r0 + block, n_images)
+        rows = (all_labels[r0:r1], all_score_valid[r0:r1], all_scores[r0:r1])
+        # symmetric metrics only visit the upper triangle of tiles
+        c_start = 0 if metric == 'kl' else r0
+        for c0 in range(c_start, n_images, block):
+            c1 = min(c0 + block, n_images)
+            br, bc = r1 - r0, c1 - c0
+            cols = (all_labels[c0:c1], all_score_valid[c0:c1])
+
+            if metric == 'kl':
+                _target = active_feats[c0:c1].view(1, bc, 1, n_active, feat_dim)
+                _log_target = active_log_feats[c0:c1].view(1, bc, 1, n_active, feat_dim)
+                _log_pred = active_log_feats[r0:r1].view(br, 1, n_active, 1, feat_dim)
+                feat_dis = (_target * (_log_target - _log_pred)).sum(dim=-1)
+                distances[r0:r1, c0:c1] = _reduce_distance_tile(
+                    feat_dis, *rows, *cols, n_dets, same_label).cpu()
+                continue
+
+            sim = torch.matmul(active_feats[r0 * n_active:r1 * n_active],
+                               active_feats[c0 * n_active:c1 * n_active].t())
+            feat_dis = box_distance(sim.view(br, n_active, bc, n_active).permute(0, 2, 1, 3))
+            distances[r0:r1, c0:c1] = _reduce_distance_tile(
+                feat_dis, *rows, *cols, n_dets, same_label).cpu()
+            if c0 != r0:
+                feat_dis = box_distance(sim.t().view(bc, n_active, br, n_active).permute(0, 2, 1, 3))
+                distances[c0:c1, r0:r1] = _reduce_distance_tile(
+                    feat_dis, all_labels[c0:c1], all_score_valid[c0:c1], all_scores[c0:c1],
+                    all_labels[r0:r1], all_score_valid[r0:r1], n_dets, same_label).cpu()
+
+    return 0.5 * (distances + distances.transpose(0, 1))
+
+
+@torch.no_grad()
+def get_img_score_distance_cross(
+        row_labels,
+        row_scores,
+        row_feats,
+        col_labels,
+        col_scores,
+        col_feats,
+        score_thr=0.,
+        same_label=True,
+        metric='cosine',
+        block_memory_mb=256):
+    """Distances between two image sets, as in :func:`get_img_score_distance_matrix_tiled`.
+
+    Returns the ``[n_rows, n_cols]`` symmetrized distances, computed in row
+    chunks that stay under ``block_memory_mb``. Both sets may be padded to
+    different numbers of detection slots.
+    """
+    assert metric in ('l2', 'cosine', 'kl')
+    if metric == 'kl':
+        assert not same_label
+
+    n_dets = max(row_labels.size(1), col_labels.size(1))
+    if row_labels.size(1) < n_dets:
+        pad = n_dets - row_labels.size(1)
+        row_labels, row_scores = F.pad(row_labels, (0, pad), value=-1), F.pad(row_scores, (0, pad))
+        row_feats = F.pad(row_feats, (0, 0, 0, pad))
+    if col_labels.size(1) < n_dets:
+        pad = n_dets - col_labels.size(1)
+        col_labels, col_scores = F.pad(col_labels, (0, pad), value=-1), F.pad(col_scores, (0, pad))
+        col_feats = F.pad(col_feats, (0, 0, 0, pad))
+    n_rows, n_cols = row_labels.size(0), col_labels.size(0)
+    feat_dim = row_feats.size(-1)
+
+    row_valid = row_scores > score_thr
+    col_valid = col_scores > score_thr
+    valid_slots = torch.cat((row_valid, col_valid)).any(dim=0).nonzero()
+    n_active = int(valid_slots.max()) + 1 if valid_slots.numel() > 0 else 1
+    row_feats = row_feats[:, :n_active]
+    col_feats = col_feats[:, :n_active]
+    if metric in ('cosine', 'l2'):
+        row_feats = F.normalize(row_feats, p=2, dim=-1)
+        col_feats = F.normalize(col_feats, p=2, dim=-1)
+    else:
+        row_log_feats = (row_feats + 1e-12).log()
+        col_log_feats = (col_feats + 1e-12).log()
+
+    def box_distance(sim):
+        if metric == 'cosine':
+            return -1 * sim + 1
+        return (2 - 2 * sim).clamp(min=0).sqrt()
+
+    def kl_distance(target, log_target, log_pred):
+        return (target[None, :, None] * (log_target[None, :, None] - log_pred[:, None, :, None])).sum(dim=-1)
+
+    cols = (col_labels, col_valid, col_scores)
+    flat_col_feats = col_feats.reshape(n_cols * n_active, feat_dim)
+    block = _distance_block_size(max(n_rows, n_cols), n_active, feat_dim, metric, block_memory_mb)
+    row_block = max(1, block * block // max(1, n_cols))
+
+    distances = row_feats.new_zeros((n_rows, n_cols), device='cpu')
+    for r0 in range(0, n_rows, row_block):
+        r1 = min(r0 + row_block, n_rows)
+        br = r1 - r0
+        rows = (row_labels[r0:r1], row_valid[r0:r1], row_scores[r0:r1])
+        if metric == 'kl':
+            rc_dis = kl_distance(col_feats, col_log_feats, row_log_feats[r0:r1])
+            cr_dis = kl_distance(row_feats[r0:r1], row_log_feats[r0:r1], col_log_feats)
+        else:
+            sim = torch.matmul(row_feats[r0:r1].reshape(br * n_active, feat_dim), flat_col_feats.t())
+            rc_dis = box_distance(sim.view(br, n_active, n_cols, n_active).permute(0, 2, 1, 3))
+            cr_dis = box_distance(sim.t().view(n_cols, n_active, br, n_active).permute(0, 2, 1, 3))
+        rc_dis = _reduce_distance_tile(rc_dis, *rows, *cols[:2], n_dets, same_label)
+        cr_dis = _reduce_distance_tile(cr_dis, *cols, *rows[:2], n_dets, same_label)
+        distances[r0:r1] = (0.5 * (rc_dis + cr_dis.t())).cpu()
+    return distances
+
+
+def get_img_score_distance_columns(all_labels, all_scores, all_feats, col_inds, **kwargs):
+    """Columns ``col_inds`` of the matrix of :func:`get_img_score_distance_matrix_tiled`.
+
+    Returns the ``[n_images, len(col_inds)]`` distances of every image to the
+    images ``col_inds``, so large pools can be clustered without the dense
+    matrix.
+    """
+    col_inds = torch.as_tensor(col_inds, dtype=torch.long)
+    return get_img_score_distance_cross(
+        all_labels, all_scores, all_feats,
+        all_labels[col_inds], all_scores[col_inds], all_feats[col_inds], **kwargs)
+
+
+def get_img_score_distance_matrix(all_labels, all_scores, all_feats, engine='tiled', **kwargs):
+    if engine == 'tiled':
+        return get_img_score_distance_matrix_tiled(all_labels, all_scores, all_feats, **kwargs)
+    elif engine == 'slow':
+        kwargs.pop('block_memory_mb', None)
+        return get_img_score_distance_matrix_slow(all_labels, all_scores, all_feats, **kwargs)
+    else:
+        raise NotImplementedError
+
+class ImageDistanceCache(object):
+    """Image distances kept across AL rounds, keyed by image id pair.
+
+    With ``policy='frozen'`` (embeddings from a frozen extractor), pairs
+    seen in an earlier pool are reused and only the columns of images with
+    unknown pairs, mostly the ones newly entering the pool, are computed.
+    ``policy='recompute'`` computes every pair (embeddings of a retrained
+    model) and only refreshes the cache. At most ``max_images`` images are
+    kept, the least recently pooled are dropped first.
+    """
+
+    def __init__(self, path, policy='frozen', max_images=20000):
+        assert policy in ('frozen', 'recompute')
+        self.path = path
+        self.policy = policy
+        self.max_images = max_images
+        self.image_ids = np.zeros((0, ), dtype=np.int64)
+        self.last_used = np.zeros((0, ), dtype=np.int64)
+        self.distances = np.zeros((0, 0), dtype=np.float32)  # nan for pairs never computed
+        self.n_updates = 0
+        if os.path.isfile(path):
+            with np.load(path) as data:
+                self.image_ids = data['image_ids']
+                self.last_used = data['last_used']
+                self.distances = data['distances']
+                self.n_updates = int(data['n_updates'])
+
+    def distance_matrix(self, image_ids, columns_fn):
+        """Distances between ``image_ids``, computing missing pairs with
+        ``columns_fn(inds)``, which returns the ``[len(image_ids), len(inds)]``
+        distances of all images to the images at positions ``inds``.
+        """
+        image_ids = np.asarray(image_ids, dtype=np.int64).reshape(-1)
+        n_images = len(image_ids)
+        cached = np.isin(image_ids, self.image_ids)
+        dis_mat = np.full((n_images, n_images), np.nan, dtype=np.float32)
+        if self.policy == 'frozen' and cached.any():
+            order = np.argsort(self.image_ids)
+            cache_inds = order[np.searchsorted(self.image_ids, image_ids[cached], sorter=order)]
+            dis_mat[np.ix_(cached, cached)] = self.distances[np.ix_(cache_inds, cache_inds)]
+
+        # columns of new images, then greedily of the images with the most pairs still missing
+        compute = ~cached if self.policy == 'frozen' else np.ones(n_images, dtype=bool)
+        missing = np.isnan(dis_mat)
+        missing[compute] = False
+        missing[:, compute] = False
+        n_missing = missing.sum(axis=0)
+        while n_missing.any():
+            j = np.argmax(n_missing)
+            compute[j] = True
+            n_missing -= missing[:, j]
+            n_missing[j] = 0
+            missing[j, :] = False
+        inds = np.flatnonzero(compute)
+        if len(inds) > 0:
+            columns = np.asarray(columns_fn(inds), dtype=np.float32)
+            dis_mat[:, inds] = columns
+            dis_mat[inds, :] = columns.T
+        sys_echo('>>>> Image distance cache: %d of %d images reused, %d columns computed' % (
+            n_images - len(inds), n_images, len(inds)))
+
+        self.update(image_ids, dis_mat)
+        return dis_mat
+
+    def update(self, image_ids, dis_mat):
+        # distributed samplers may pad the pool with repeated images
+        _, first = np.unique(image_ids, return_index=True)
+        first = np.sort(first)
+        image_ids, dis_mat = image_ids[first], dis_mat[np.ix_(first, first)]
+        self.n_updates += 1
+        keep_old = ~np.isin(self.image_ids, image_ids)
+        old_ids = self.image_ids[keep_old]
+        old_last_used = self.last_used[keep_old]
+        # least recently pooled images go first
+        n_old = max(0, min(len(old_ids), self.max_images - len(image_ids)))
+        old_sel = np.sort(np.argsort(-old_last_used, kind='stable')[:n_old])
+        old_ids, old_last_used = old_ids[old_sel], old_last_used[old_sel]
+        old_inds = np.flatnonzero(keep_old)[old_sel]
+
+        all_ids = np.concatenate((old_ids, image_ids))
+        distances = np.full((len(all_ids), len(all_ids)), np.nan, dtype=np.float32)
+        distances[:n_old, :n_old] = self.distances[np.ix_(old_inds, old_inds)]
+        distances[n_old:, n_old:] = dis_mat
+        if n_old > 0 and len(self.image_ids) > 0:
+            # pairs between an old image and a pooled image seen before
+            order = np.argsort(self.image_ids)
+            pooled_cached = np.isin(image_ids, self.image_ids)
+            pooled_inds = order[np.searchsorted(self.image_ids, image_ids[pooled_cached], sorter=order)]
+            distances[np.ix_(np.arange(n_old), n_old + np.flatnonzero(pooled_cached))] = \
+                self.distances[np.ix_(old_inds, pooled_inds)]
+            distances[n_old:, :n_old] = distances[:n_old, n_old:].T
+
+        self.image_ids = all_ids
+        self.last_used = np.concatenate((old_last_used, np.full(len(image_ids), self.n_updates, dtype=np.int64)))
+        self.distances = distances
+        self.save()
+
+    def save(self):
+        output_dir = os.path.dirname(self.path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        # every rank may update the cache, each writes its own file and renames it atomically
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmp_path, 'wb') as fwb:
+            np.savez(fwb, image_ids=self.image_ids, last_used=self.last_used,
+                     distances=self.distances, n_updates=self.n_updates)
+        os.replace(tmp_path, self.path)
+
+
+def save_det_feat_cache(path, image_ids, det_labels, det_scores, det_feats):
+    """Save padded per-image detections and embeddings for later distance computation."""
+    output_dir = os.path.dirname(path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(path, 'wb') as fwb:
+        np.savez(fwb,
+                 image_ids=np.asarray(image_ids).reshape(-1),
+                 det_labels=np.asarray(det_labels),
+                 det_scores=np.asarray(det_scores),
+                 det_feats=np.asarray(det_feats))
+
+
+def load_det_feat_cache(path, image_ids=None):
+    """Load a cache written by :func:`save_det_feat_cache`.
+
+    If ``image_ids`` is given, only those images are returned (each once,
+    sorted by image id); images missing from the cache are ignored.
+    """
+    with np.load(path) as data:
+        cache = {k: data[k] for k in data.files}
+    if image_ids is not None:
+        # distributed samplers may pad the dataset with repeated images
+        uniq_ids, first_inds = np.unique(cache['image_ids'], return_index=True)
+        keep = first_inds[np.isin(uniq_ids, np.asarray(image_ids))]
+        cache = {k: v[keep] for k, v in cache.items()}
+    return cache
+
+
+class DetFeatStream(object):
+    """Append-only CPU store of the detections of each image, without padding.
+
+    Only detections scoring above ``score_thr`` are kept, with embeddings in
+    fp16. Rows live in growable arrays, or, if ``memmap_path`` is given, the
+    embeddings go to a memory-mapped file pre-sized to ``capacity`` rows.
+    Images are kept in arrival order (duplicates included) and read back as
+    padded chunks with :meth:`padded`.
+    """
+
+    def __init__(self, feat_dim, score_thr=0., capacity=4096, memmap_path=None):
+        self.feat_dim = feat_dim
+        self.score_thr = score_thr
+        self.memmap_path = memmap_path
+        self.capacity = capacity
+        self.n_rows = 0
+        self.image_ids = []
+        self.offsets = [0]
+        self.det_labels = np.zeros((capacity, ), dtype=np.int32)
+        self.det_scores = np.zeros((capacity, ), dtype=np.float32)
+        if memmap_path is not None:
+            output_dir = os.path.dirname(memmap_path)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+            self.det_feats = np.memmap(memmap_path, dtype=np.float16, mode='w+', shape=(capacity, feat_dim))
+        else:
+            self.det_feats = np.zeros((capacity, feat_dim), dtype=np.float16)
+
+    def __len__(self):
+        return len(self.image_ids)
+
+    def _grow(self, n_rows):
+        assert self.memmap_path is None, \
+            'memory-mapped stream is full (%d rows), increase its capacity' % self.capacity
+        capacity = max(n_rows, 2 * self.capacity)
+        for name in ('det_labels', 'det_scores', 'det_feats'):
+            old = getattr(self, name)
+            new = np.zeros((capacity, ) + old.shape[1:], dtype=old.dtype)
+            new[:self.n_rows] = old[:self.n_rows]
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    def append(self, image_id, det_labels, det_scores, det_feats):
+        keep = det_scores > self.score_thr
+        n = int(keep.sum())
+        if self.n_rows + n > self.capacity:
+            self._grow(self.n_rows + n)
+        end = self.n_rows + n
+        self.det_labels[self.n_rows:end] = det_labels[keep].cpu().numpy()
+        self.det_scores[self.n_rows:end] = det_scores[keep].cpu().numpy()
+        self.det_feats[self.n_rows:end] = det_feats[keep].cpu().numpy().astype(np.float16)
+        self.n_rows = end
+        self.image_ids.append(int(image_id))
+        self.offsets.append(end)
+
+    def first_occurrences(self):
+        """Positions of the first occurrence of each image, in arrival order."""
+        _, first = np.unique(np.asarray(self.image_ids, dtype=np.int64), return_index=True)
+        return np.sort(first)
+
+    def padded(self, positions, width=None):
+        """Padded ``(labels, scores, feats)`` float32 tensors of the images at ``positions``.
+
+        Label padding is -1 and score padding 0, as in the dense queues.
+        """
+        offsets = np.asarray(self.offsets)
+        starts, ends = offsets[positions], offsets[np.asarray(positions) + 1]
+        if width is None:
+            width = max([1] + (ends - starts).tolist())
+        labels = np.full((len(positions), width), -1, dtype=np.float32)
+        scores = np.zeros((len(positions), width), dtype=np.float32)
+        feats = np.zeros((len(positions), width, self.feat_dim), dtype=np.float32)
+        for i, (start, end) in enumerate(zip(starts, ends)):
+            labels[i, :end - start] = self.det_labels[start:end]
+            scores[i, :end - start] = self.det_scores[start:end]
+            feats[i, :end - start] = self.det_feats[start:end]
+        return torch.from_numpy(labels), torch.from_numpy(scores), torch.from_numpy(feats)
+
+    def save(self, path):
+        with open(path, 'wb') as fwb:
+            np.savez(fwb,
+                     image_ids=np.asarray(self.image_ids, dtype=np.int64),
+                     offsets=np.asarray(self.offsets, dtype=np.int64),
+                     det_labels=self.det_labels[:self.n_rows],
+                     det_scores=self.det_scores[:self.n_rows],
+                     det_feats=np.asarray(self.det_feats[:self.n_rows]))
+
+    def extend(self, path):
+        """Append the images of a stream written with :meth:`save`."""
+        with np.load(path) as data:
+            offsets = data['offsets']
+            n = int(offsets[-1])
+            if self.n_rows + n > self.capacity:
+                self._grow(self.n_rows + n)
+            self.det_labels[self.n_rows:self.n_rows + n] = data['det_labels']
+            self.det_scores[self.n_rows:self.n_rows + n] = data['det_scores']
+            self.det_feats[self.n_rows:self.n_rows + n] = data['det_feats']
+            self.image_ids.extend(data['image_ids'].tolist())
+            self.offsets.extend((offsets[1:] + self.n_rows).tolist())
+            self.n_rows += n
+
+
+def pack_det_info(image_id, det_labels, det_scores, det_feats, max_det):
+    """Pack the top ``max_det`` detections of an image into one float32 row.
+
+    The row is ``[id // 2**16, id % 2**16, labels, scores, feats]`` with
+    label padding -1 and score / feature padding 0, so a batch of images is
+    gathered across ranks with a single collective. The image id is split in
+    two halves that float32 represents exactly.
+    """
+    det_labels, det_scores, det_feats = det_labels[:max_det], det_scores[:max_det], det_feats[:max_det]
+    n, feat_dim = det_feats.shape[0], det_feats.shape[1]
+    row = det_feats.new_zeros((2 + max_det * (2 + feat_dim), ), dtype=torch.float32)
+    row[0], row[1] = image_id // 2 ** 16, image_id % 2 ** 16
+    row[2:2 + max_det] = -1
+    row[2:2 + n] = det_labels
+    row[2 + max_det:2 + max_det + n] = det_scores
+    row[2 + 2 * max_det:2 + 2 * max_det + n * feat_dim] = det_feats.reshape(-1)
+    return row
+
+
+def unpack_det_info(packed, max_det, feat_dim):
+    """Inverse of :func:`pack_det_info` for ``[n, row]`` packed rows.
+
+    Returns:
+        tuple: image ids ``[n, 1]`` (int32), labels and scores ``[n, max_det]``
+            and features ``[n, max_det, feat_dim]``.
+    """
+    image_ids = (packed[:, 0].long() * 2 ** 16 + packed[:, 1].long()).int().reshape(-1, 1)
+    det_labels = packed[:, 2:2 + max_det]
+    det_scores = packed[:, 2 + max_det:2 + 2 * max_det]
+    det_feats = packed[:, 2 + 2 * max_det:].reshape(-1, max_det, feat_dim)
+    return image_ids, det_labels, det_scores, det_feats
+
+
 @torch.no_grad()
 def concat_all_gather(tensor):
     if torch.distributed.is_initialized():
@@ -183,9 +677,43 @@ def get_inter_feats(lvl_feats, lvl_inds, boxes, img_shape):
     return ret_feats
 
 
+def get_inter_feats_batched(lvl_feats, img_inds, lvl_inds, boxes, img_shapes):
+    """:func:`get_inter_feats` for the detections of a batch of images.
+
+    ``lvl_feats`` are the ``[B, C, H, W]`` maps of each level, ``img_inds``
+    the image of each detection and ``img_shapes`` the ``img_shape`` of each
+    image. Each level is sampled with one ``grid_sample`` call over the
+    batch, the points of an image padded to the largest count.
+    """
+    img_wh = boxes.new_tensor([img_shape[:2] for img_shape in img_shapes]).reshape(-1, 2)[img_inds]
+    cx = ((0.5 * (boxes[:, 0] + boxes[:, 2]) / img_wh[:, 0]) - 0.5) * 2
+    cy = ((0.5 * (boxes[:, 1] + boxes[:, 3]) / img_wh[:, 1]) - 0.5) * 2
+
+    coor = torch.stack((cx, cy), dim=-1)  # [n_det, 2]
+    ret_feats = coor.new_full((coor.shape[0], lvl_feats[0].shape[1]), 0.)
+    n_images = lvl_feats[0].shape[0]
+
+    for l in range(len(lvl_feats)):
+        det_inds = torch.nonzero(lvl_inds == l).reshape(-1)
+        if len(det_inds) == 0:
+            continue
+        det_inds = det_inds[torch.sort(img_inds[det_inds], stable=True)[1]]
+        det_img_inds = img_inds[det_inds]
+        counts = torch.bincount(det_img_inds, minlength=n_images)
+        slots = torch.arange(len(det_inds), device=coor.device) - (torch.cumsum(counts, 0) - counts)[det_img_inds]
+
+        grid = coor.new_zeros((n_images, 1, int(counts.max()), 2))
+        grid[det_img_inds, 0, slots] = coor[det_inds]
+        inter_feat = F.grid_sample(lvl_feats[l], grid, mode='bilinear')  # [B, C, 1, n_slots]
+        ret_feats[det_inds] = inter_feat[det_img_inds, :, 0, slots]
+
+    return ret_feats
+
+
 def bbox2result_with_uncertainty(bboxes, labels, cls_uncertainties, box_uncertainties, num_classes):
     if bboxes.shape[0] == 0:
-        return [np.zeros((0, 5), dtype=np.float32) for i in range(num_classes)]
+        # same columns as the non-empty results, so the results of several images concatenate
+        return [np.zeros((0, 7), dtype=np.float32) for i in range(num_classes)]
     else:
         if isinstance(bboxes, torch.Tensor):
             bboxes = bboxes.detach().cpu().numpy()
@@ -1,5 +1,5 @@
-import json
 import numpy as np
+from mmdet.ppal.utils.coco_index import load_coco_index
 from mmdet.ppal.utils.dataset_info import CLASSES
 from mmdet.ppal.utils.running_checks import sys_echo
 
@@ -17,13 +17,10 @@ class BaseALSampler(object):
         self.n_images = n_sample_images
         self.is_random = is_random
 
-        # read and store oracle annotations
-        with open(oracle_annotation_path) as f:
-            data = json.load(f)
-
-        self.image_pool_size = len(data['images'])
-        self.oracle_data = dict()
-        self.categories = data['categories']
+        # columnar oracle annotations, shared with the other samplers and cached next to the json
+        self.oracle_index = load_coco_index(oracle_annotation_path)
+        self.image_pool_size = len(self.oracle_index)
+        self.categories = self.oracle_index.categories
 
         self.categories_dict = dict()
         self.class_id2name = dict()
@@ -37,15 +34,11 @@ class BaseALSampler(object):
                 self.class_id2name[c['id']] = c['name']
                 self.valid_categories.append(c['id'])
 
-        for img in data['images']:
-            self.oracle_data[img['id']] = dict()
-            self.oracle_data[img['id']]['image'] = img
-            self.oracle_data[img['id']]['annotations'] = []
-
-        for ann in data['annotations']:
-            img_id = ann['image_id']
-            if self.categories_dict[ann['category_id']] in self.CLASSES:
-                self.oracle_data[img_id]['annotations'].append(ann)
+        # per-image tables in oracle order, rows are found from image ids with image_inds
+        self.oracle_img_ids = self.oracle_index.img_ids
+        self.oracle_img_sizes = self.oracle_index.img_sizes
+        # oracle annotations of the AL classes, the ones copied to the labeled sets
+        self.oracle_ann_valid = np.isin(self.oracle_index.ann_category_ids, self.valid_categories)
 
         self.oracle_cate_prob = self.cate_prob_stat(input_json=None)
 
@@ -60,19 +53,10 @@ class BaseALSampler(object):
         self.latest_labeled = None
 
     def cate_prob_stat(self, input_json=None):
+        index = self.oracle_index if input_json is None else load_coco_index(input_json)
         cate_freqs = dict()
         for cid in self.valid_categories:
-            cate_freqs[cid] = 0.
-        if input_json is None:
-            for img_id in self.oracle_data.keys():
-                for ann in self.oracle_data[img_id]['annotations']:
-                    cate_freqs[ann['category_id']] += 1.
-        else:
-            with open(input_json) as f:
-                data = json.load(f)
-            for ann in data['annotations']:
-                if ann['category_id'] in self.valid_categories:
-                    cate_freqs[ann['category_id']] += 1.
+            cate_freqs[cid] = float((index.ann_category_ids == cid).sum())
 
         total = sum(cate_freqs.values())
         cate_probs = dict()
@@ -92,6 +76,37 @@ class BaseALSampler(object):
         h = y2 - y1
         return (np.sqrt(w*h) > self.size_thr) and (w/(h+eps) < self.ratio_thr) and (h/(w+eps) < self.ratio_thr)
 
+    def are_boxes_valid(self, bboxes, img_w, img_h):
+        # vectorized is_box_valid, bboxes in xywh of shape (n, 4), image sizes of shape (n, )
+        x1, y1 = bboxes[:, 0], bboxes[:, 1]
+        inside = (x1 <= img_w) & (y1 <= img_h)
+        w = np.minimum(img_w, x1 + bboxes[:, 2]) - x1
+        h = np.minimum(img_h, y1 + bboxes[:, 3]) - y1
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return inside & (np.sqrt(w*h) > self.size_thr) & (w/(h+eps) < self.ratio_thr) & (h/(w+eps) < self.ratio_thr)
+
+    def image_inds(self, img_ids):
+        # rows of img_ids in the oracle tables
+        return self.oracle_index.image_inds(img_ids)
+
+    def top_k_images(self, image_scores, candidate_inds, k):
+        # the k candidates with the highest scores, in descending order with ties kept in candidate order, and the rest
+        candidate_inds = np.asarray(candidate_inds, dtype=np.int64)
+        scores = image_scores[candidate_inds]
+        if k <= 0:
+            return candidate_inds[:0], candidate_inds
+        if k < len(candidate_inds):
+            top = np.argpartition(-scores, k - 1)[:k]
+            kth = scores[top].min()
+            # candidates tied with the k-th score are taken in candidate order
+            top = np.concatenate((np.flatnonzero(scores > kth), np.flatnonzero(scores == kth)))[:k]
+        else:
+            top = np.arange(len(candidate_inds))
+        top = top[np.lexsort((candidate_inds[top], -scores[top]))]
+        rest = np.ones(len(candidate_inds), dtype=bool)
+        rest[top] = False
+        return candidate_inds[top], candidate_inds[rest]
+
     def set_round(self, new_round):
         self.round = new_round
 
@@ -99,10 +114,7 @@ class BaseALSampler(object):
         pass  # To be implemented by child classes
 
     def create_jsons(self, sampled_img_ids, unsampled_img_ids, last_labeled_json, out_label_path, out_unlabeled_path):
-        with open(last_labeled_json) as f:
-            last_labeled_data = json.load(f)
-
-        last_labeled_img_ids = [x['id'] for x in last_labeled_data['images']]
+        last_labeled_img_ids = load_coco_index(last_labeled_json).img_ids.tolist()
         all_labeled_img_ids = last_labeled_img_ids + sampled_img_ids
         assert len(set(all_labeled_img_ids)) == len(last_labeled_img_ids) + len(sampled_img_ids)
         assert len(all_labeled_img_ids) + len(unsampled_img_ids) == self.image_pool_size
@@ -114,19 +126,9 @@ class BaseALSampler(object):
         sys_echo('--->>> New unlabeled set size: %d (%.2f%%)'%(len(unsampled_img_ids), 100.*float(len(unsampled_img_ids))/self.image_pool_size))
         sys_echo('---------------------------------------------')
 
-        labeled_data = dict(images=[], annotations=[], categories=self.categories)
-        unlabeled_data = dict(images=[], categories=self.categories)
-
-        for img_id in all_labeled_img_ids:
-            labeled_data['images'].append(self.oracle_data[img_id]['image'])
-            labeled_data['annotations'].extend(self.oracle_data[img_id]['annotations'])
-        for img_id in unsampled_img_ids:
-            unlabeled_data['images'].append(self.oracle_data[img_id]['image'])
-
-        with open(out_label_path, 'w') as f:
-            json.dump(labeled_data, f)
-        with open(out_unlabeled_path, 'w') as f:
-            json.dump(unlabeled_data, f)
+        labeled_inds = self.image_inds(all_labeled_img_ids)
+        self.oracle_index.dump(out_label_path, labeled_inds, self.oracle_index.ann_inds(labeled_inds, self.oracle_ann_valid))
+        self.oracle_index.dump(out_unlabeled_path, self.image_inds(unsampled_img_ids))
 
         self.latest_labeled = out_label_path
 
@@ -1,10 +1,10 @@
-import json
 import numpy as np
 import os
 import torch
-from collections import OrderedDict
 from mmdet.ppal.builder import SAMPLER
 from mmdet.ppal.sampler.al_sampler_base import BaseALSampler
+from mmdet.ppal.utils.al_results import load_al_results
+from mmdet.ppal.utils.coco_index import load_coco_index
 from mmdet.ppal.utils.running_checks import sys_echo
 
 eps = 1e-10
@@ -25,96 +25,48 @@ class DCUSSampler(BaseALSampler):
         # Since this is a single-class dataset, we return a fixed weight of 1.0 for all calculations
         return {self.class_name2id[self.CLASSES[0]]: 1.0}
 
+    def image_uncertainty(self, results, class_weights):
+        # class-weighted sum of the uncertainties of the valid detections of each oracle image
+        inds = np.flatnonzero(results['score'] >= self.score_thr)
+        det_img_inds = self.image_inds(results['image_id'][inds])
+        img_sizes = self.oracle_img_sizes[det_img_inds]
+        keep = self.are_boxes_valid(results['bbox'][inds], img_sizes[:, 0], img_sizes[:, 1])
+
+        labels = results['category_id'][inds]
+        weights = np.zeros(len(labels))
+        known_label = np.zeros(len(labels), dtype=bool)
+        for label, weight in class_weights.items():
+            label_mask = labels == label
+            weights[label_mask] = weight
+            known_label |= label_mask
+        if (keep & ~known_label).any():
+            print(f"Warning: {int((keep & ~known_label).sum())} detections with labels not found in class_weights. Skipping these entries.")
+        keep &= known_label
+
+        return np.bincount(det_img_inds[keep], weights=results['cls_uncertainty'][inds[keep]] * weights[keep],
+                           minlength=len(self.oracle_img_ids))
+
     def al_acquisition(self, result_json, last_label_path):
         # Adjust the method to work without class weights since we have only one class
         class_weights = self._get_classwise_weight(result_json)
 
-        with open(result_json) as f:
-            results = json.load(f)
-
-        category_uncertainty = OrderedDict()
-        category_count = OrderedDict()
-
-        for res in results:
-            img_id = res['image_id']
-            img_size = (self.oracle_data[img_id]['image']['width'], self.oracle_data[img_id]['image']['height'])
-            if not self.is_box_valid(res['bbox'], img_size):
-                continue
-            if res['score'] < self.score_thr:
-                continue
-            uncertainty = float(res['cls_uncertainty'])
-            label = res['category_id']
-
-            if label not in class_weights:
-                print(f"Warning: Label {label} not found in class_weights. Skipping this entry.")
-                continue
-
-            if label not in category_uncertainty.keys():
-                category_uncertainty[label] = 0.
-                category_count[label] = 0.
-            category_uncertainty[label] += uncertainty
-            category_count[label] += 1
-
-        category_avg_uncertainty = OrderedDict()
-        for k in category_uncertainty.keys():
-            category_avg_uncertainty[k] = category_uncertainty[k] / (category_count[k] + 1e-5)
-
-        with open(last_label_path) as f:
-            last_labeled_data = json.load(f)
-            last_labeled_img_ids = [x['id'] for x in last_labeled_data['images']]
-
-        image_hit = dict()
-        for img_id in self.oracle_data.keys():
-            image_hit[img_id] = 0
-        for img_id in last_labeled_img_ids:
-            image_hit[img_id] = 1
-
-        image_uncertainties = OrderedDict()
-        for img_id in self.oracle_data.keys():
-            if image_hit[img_id] == 0:
-                image_uncertainties[img_id] = [0.]
-
-        for res in results:
-            img_id = res['image_id']
-            img_size = (self.oracle_data[img_id]['image']['width'], self.oracle_data[img_id]['image']['height'])
-            if not self.is_box_valid(res['bbox'], img_size):
-                continue
-            if res['score'] < self.score_thr:
-                continue
-            uncertainty = float(res['cls_uncertainty'])
-            label = res['category_id']
-
-            if label not in class_weights:
-                print(f"Warning: Label {label} not found in class_weights during image uncertainty calculation. Skipping this entry.")
-                continue
-
-            image_uncertainties[img_id].append(uncertainty * class_weights[label])
-
-        for img_id in image_uncertainties.keys():
-            _img_uncertainties = np.array(image_uncertainties[img_id])
-            image_uncertainties[img_id] = _img_uncertainties.sum()
-
-        img_ids = []
-        merged_img_uncertainties = []
-        for k, v in image_uncertainties.items():
-            img_ids.append(k)
-            merged_img_uncertainties.append(v)
-        img_ids = np.array(img_ids)
-        merged_img_uncertainties = np.array(merged_img_uncertainties)
-
-        inds_sort = np.argsort(-1. * merged_img_uncertainties)
-        sampled_inds = inds_sort[:self.n_images]
-        unsampled_img_ids = inds_sort[self.n_images:]
-        sampled_img_ids = img_ids[sampled_inds].tolist()
-        unsampled_img_ids = img_ids[unsampled_img_ids].tolist()
+        # results are read as columns, from either a .bbox.json or a .bbox.npz
+        results = load_al_results(result_json)
+        image_uncertainties = self.image_uncertainty(results, class_weights)
+
+        last_labeled_img_ids = load_coco_index(last_label_path).img_ids
+
+        # only unlabeled images are ranked
+        unlabeled = np.ones(len(self.oracle_img_ids), dtype=bool)
+        unlabeled[self.image_inds(last_labeled_img_ids)] = False
+        sampled_inds, unsampled_inds = self.top_k_images(image_uncertainties, np.flatnonzero(unlabeled), self.n_images)
+        sampled_img_ids = self.oracle_img_ids[sampled_inds].tolist()
+        unsampled_img_ids = self.oracle_img_ids[unsampled_inds].tolist()
 
         return sampled_img_ids, unsampled_img_ids
 
     def create_jsons(self, sampled_img_ids, unsampled_img_ids, last_labeled_json, out_label_path, out_unlabeled_path):
-        with open(last_labeled_json) as f:
-            last_labeled_data = json.load(f)
-
-        last_labeled_img_ids = [x['id'] for x in last_labeled_data['images']]
+        last_labeled_img_ids = load_coco_index(last_labeled_json).img_ids.tolist()
         all_labeled_img_ids = last_labeled_img_ids + sampled_img_ids
         assert len(set(all_labeled_img_ids)) == len(last_labeled_img_ids) + len(sampled_img_ids)
         assert len(all_labeled_img_ids) + len(unsampled_img_ids) == self.image_pool_size
@@ -125,15 +77,8 @@ class DCUSSampler(BaseALSampler):
         sys_echo('--->>> New uncertainty pool set size: %d (%.2f%%)'%(len(sampled_img_ids),100.*float(len(sampled_img_ids))/self.image_pool_size))
         sys_echo('---------------------------------------------')
 
-        labeled_data = dict(images=[], annotations=[], categories=self.categories)
-        unlabeled_data = dict(images=[], categories=self.categories)
-
-        for img_id in sampled_img_ids:
-            # no annotation here because the annotating happens in the diversity step
-            labeled_data['images'].append(self.oracle_data[img_id]['image'])
-
-        with open(out_label_path, 'w') as f:
-            json.dump(labeled_data, f)
+        # no annotation here because the annotating happens in the diversity step
+        self.oracle_index.dump(out_label_path, self.image_inds(sampled_img_ids), ann_inds=[])
 
         self.latest_labeled = out_label_path
 
@@ -1,22 +1,106 @@
-import json
+import os
+
 import numpy as np
+import torch
 from mmdet.ppal.builder import SAMPLER
+from mmdet.ppal.models.utils import (ImageDistanceCache, get_img_score_distance_columns,
+                                     get_img_score_distance_matrix, load_det_feat_cache, save_det_feat_cache)
 from mmdet.ppal.sampler.al_sampler_base import BaseALSampler
+from mmdet.ppal.utils.coco_index import load_coco_index
+from mmdet.ppal.utils.kmedoids import DenseDistances, clara, farthest_point_seeding, fasterpam
 from mmdet.ppal.utils.running_checks import sys_echo
 
 eps = 1e-10
 
+
+class BlockedImageDistances(object):
+    """Image distance provider (see ``DenseDistances``) computing columns on demand from pool detections."""
+
+    def __init__(self, cache, score_thr, metric, block_memory_mb):
+        self.det_labels = torch.from_numpy(cache['det_labels']).float()
+        self.det_scores = torch.from_numpy(cache['det_scores']).float()
+        self.det_feats = torch.from_numpy(cache['det_feats']).float()
+        self.kwargs = dict(score_thr=score_thr, metric=metric, block_memory_mb=block_memory_mb)
+        self.n = self.det_labels.size(0)
+
+    def columns(self, inds):
+        return get_img_score_distance_columns(
+            self.det_labels, self.det_scores, self.det_feats, inds, **self.kwargs).numpy().astype(np.float64)
+
+    def submatrix(self, inds):
+        inds = torch.as_tensor(inds, dtype=torch.long)
+        return get_img_score_distance_matrix(
+            self.det_labels[inds], self.det_scores[inds], self.det_feats[inds], **self.kwargs).numpy().astype(np.float64)
+
+
 @SAMPLER.register_module()
 class DiversitySampler(BaseALSampler):
-    def __init__(self, n_sample_images, oracle_annotation_path, dataset_type):
+    def __init__(self, n_sample_images, oracle_annotation_path, dataset_type,
+                 score_thr=0.03, distance_metric='cosine', block_memory_mb=256,
+                 clustering='exact', clara_samples=5, clara_sample_size=None, distance_cache=None,
+                 fused_inference=False):
         super(DiversitySampler, self).__init__(
             n_sample_images,
             oracle_annotation_path,
             is_random=False,
             dataset_type=dataset_type)
 
+        # only used when distances are computed from a fused inference cache
+        self.score_thr = score_thr
+        self.distance_metric = distance_metric
+        self.block_memory_mb = block_memory_mb
+        # dict(path=..., policy=...) to reuse pair distances across rounds (see ImageDistanceCache)
+        self.distance_cache = distance_cache
+
+        # 'exact' runs kmeans on the dense distance matrix, 'fasterpam' and 'clara' are swap-based
+        # k-medoids that only read distance columns, so fused inference can skip the dense matrix
+        assert clustering in ('exact', 'fasterpam', 'clara')
+        self.clustering = clustering
+        self.clara_samples = clara_samples
+        self.clara_sample_size = clara_sample_size
+        # set by the AL runners from their fused_inference, the pool detections of the fused cache
+        # then stand in for the dense distance matrix of the swap-based backends
+        self.blockwise = fused_inference and clustering != 'exact'
         self.log_init_info()
 
+    def image_dis_path(self, work_dir):
+        """Image distance file of a round: the dense matrix ``image_dis.npy``, or
+        ``image_dis_cache.npz`` with the pool detections when distances are blockwise."""
+        return os.path.join(work_dir, 'image_dis_cache.npz' if self.blockwise else 'image_dis.npy')
+
+    def image_dis_from_cache(self, feat_cache_path, pool_json, image_dis_path):
+        """Write the image distance file of the uncertainty pool from a fused inference cache.
+
+        With ``clustering='exact'`` the output has the same layout as the file
+        saved by ``RetinaHeadFeat.compute_al``, so :meth:`al_acquisition`
+        reads it unchanged. Otherwise the pool detections are written to
+        ``image_dis_path`` (``image_dis_cache.npz``, see :meth:`image_dis_path`)
+        and distances are computed blockwise during clustering.
+        """
+        pool_img_ids = load_coco_index(pool_json).img_ids.tolist()
+        cache = load_det_feat_cache(feat_cache_path, image_ids=pool_img_ids)
+        sys_echo('>>>> Image distances from cache: %s (%d of %d pool images)' % (
+            feat_cache_path, len(cache['image_ids']), len(pool_img_ids)))
+        if self.blockwise:
+            save_det_feat_cache(image_dis_path, cache['image_ids'], cache['det_labels'],
+                                cache['det_scores'], cache['det_feats'])
+            return
+
+        det_labels = torch.from_numpy(cache['det_labels']).float()
+        det_scores = torch.from_numpy(cache['det_scores']).float()
+        det_feats = torch.from_numpy(cache['det_feats']).float()
+        kwargs = dict(score_thr=self.score_thr, metric=self.distance_metric, block_memory_mb=self.block_memory_mb)
+        if self.distance_cache is not None:
+            img_dis_mat = torch.from_numpy(ImageDistanceCache(**self.distance_cache).distance_matrix(
+                cache['image_ids'],
+                lambda inds: get_img_score_distance_columns(det_labels, det_scores, det_feats, inds, **kwargs)))
+        else:
+            img_dis_mat = get_img_score_distance_matrix(det_labels, det_scores, det_feats, **kwargs)
+
+        with open(image_dis_path, 'wb') as fwb:
+            np.save(fwb, img_dis_mat.numpy())
+            np.save(fwb, cache['image_ids'].reshape(-1, 1))
+
     @staticmethod
     def subtle_difference_metric(image1, image2):
         # Compute pixel-level or small-scale texture differences between two images
@@ -26,19 +110,7 @@ class DiversitySampler(BaseALSampler):
 
     @staticmethod
     def k_centroid_greedy(dis_matrix, K):
-        N = dis_matrix.shape[0]
-        centroids = []
-        c = np.random.randint(0, N, (1,))[0]
-        centroids.append(c)
-        i = 1
-        while i < K:
-            centroids_diss = dis_matrix[:, centroids].copy()
-            centroids_diss = centroids_diss.min(axis=1)
-            centroids_diss[centroids] = -1
-            new_c = np.argmax(centroids_diss)
-            centroids.append(new_c)
-            i += 1
-        return centroids
+        return farthest_point_seeding(DenseDistances(dis_matrix), K)
 
     @staticmethod
     def kmeans(dis_matrix, K, n_iter=200, tolerance=1e-4):
@@ -70,22 +142,31 @@ class DiversitySampler(BaseALSampler):
         return centroids.tolist()
 
     def al_acquisition(self, image_dis_path, last_label_path):
-        with open(image_dis_path, 'rb') as frb:
-            image_dis_matrix = np.load(frb)
-            image_ids = np.load(frb).reshape(-1)
+        if self.blockwise:
+            # pool detections written by image_dis_from_cache
+            cache = load_det_feat_cache(image_dis_path)
+            image_ids = cache['image_ids'].reshape(-1)
+            image_dis_matrix = None
+            dist = BlockedImageDistances(cache, self.score_thr, self.distance_metric, self.block_memory_mb)
+        else:
+            with open(image_dis_path, 'rb') as frb:
+                image_dis_matrix = np.load(frb)
+                image_ids = np.load(frb).reshape(-1)
+            dist = DenseDistances(image_dis_matrix)
 
         # Adjust K to be lower for a single-class dataset
-        centroids = DiversitySampler.kmeans(image_dis_matrix, K=3)
-
-        with open(last_label_path) as f:
-            results = json.load(f)
-
-        last_labeled_img_ids = [x['id'] for x in results['images']]
-        image_hit = {img_id: 0 for img_id in self.oracle_data.keys()}
-        for img_id in last_labeled_img_ids:
-            image_hit[img_id] = 1
-
-        rest_image_ids = [img_id for img_id in self.oracle_data.keys() if image_hit[img_id] == 0]
+        K = 3
+        if self.clustering == 'exact':
+            if image_dis_matrix is None:
+                image_dis_matrix = dist.submatrix(np.arange(dist.n))
+            centroids = DiversitySampler.kmeans(image_dis_matrix, K=K)
+        elif self.clustering == 'fasterpam':
+            centroids, _ = fasterpam(dist, farthest_point_seeding(dist, K))
+        else:
+            centroids, _ = clara(dist, K, n_samples=self.clara_samples, sample_size=self.clara_sample_size)
+
+        last_labeled_img_ids = set(load_coco_index(last_label_path).img_ids.tolist())
+        rest_image_ids = [img_id for img_id in self.oracle_img_ids.tolist() if img_id not in last_labeled_img_ids]
 
         sampled_img_ids = image_ids[centroids].tolist()
 
@@ -130,4 +211,5 @@ class DiversitySampler(BaseALSampler):
         sys_echo('>>>> Oracle annotation path: %s' % self.oracle_path)
         sys_echo('>>>> Image pool size: %d' % self.image_pool_size)
         sys_echo('>>>> Sampled image per round: %d (%.2f%%)' % (self.n_images, 100. * float(self.n_images) / self.image_pool_size))
+        sys_echo('>>>> Clustering: %s' % self.clustering)
         sys_echo('\n')
@@ -0,0 +1,69 @@
+import json
+
+import numpy as np
+
+# columns of an AL result set, one row per detection
+RESULT_COLUMNS = ('image_id', 'bbox', 'score', 'category_id', 'cls_uncertainty', 'box_uncertainty')
+
+
+def empty_al_results():
+    return dict(
+        image_id=np.zeros((0, ), dtype=np.int64),
+        bbox=np.zeros((0, 4), dtype=np.float64),
+        score=np.zeros((0, ), dtype=np.float32),
+        category_id=np.zeros((0, ), dtype=np.int64),
+        cls_uncertainty=np.zeros((0, ), dtype=np.float32),
+        box_uncertainty=np.zeros((0, ), dtype=np.float32))
+
+
+def save_al_results(path, results):
+    """Save columnar results (see ``ALPunctaDataset._det2columns``) as an uncompressed ``.npz``."""
+    with open(path, 'wb') as fwb:
+        np.savez(fwb, **{k: np.asarray(results[k]) for k in RESULT_COLUMNS})
+
+
+def load_al_results(path):
+    """Load AL inference results as a dict of NumPy columns.
+
+    ``.npz`` files are read directly; COCO-style ``.bbox.json`` files are
+    converted, so samplers handle both formats the same way.
+    """
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            return {k: data[k] for k in RESULT_COLUMNS}
+
+    with open(path) as f:
+        json_results = json.load(f)
+    if len(json_results) == 0:
+        return empty_al_results()
+    return dict(
+        image_id=np.array([x['image_id'] for x in json_results], dtype=np.int64),
+        bbox=np.array([x['bbox'] for x in json_results], dtype=np.float64).reshape(-1, 4),
+        score=np.array([x['score'] for x in json_results], dtype=np.float32),
+        category_id=np.array([x['category_id'] for x in json_results], dtype=np.int64),
+        cls_uncertainty=np.array([x.get('cls_uncertainty', 0.) for x in json_results], dtype=np.float32),
+        box_uncertainty=np.array([x.get('box_uncertainty', 0.) for x in json_results], dtype=np.float32))
+
+
+def al_results2json(results):
+    """Convert columnar results to the list of dicts written to ``.bbox.json``."""
+    bboxes = results['bbox'].tolist()
+    json_results = []
+    for i in range(len(results['image_id'])):
+        json_results.append(dict(
+            image_id=int(results['image_id'][i]),
+            bbox=bboxes[i],
+            score=float(results['score'][i]),
+            cls_uncertainty=float(results['cls_uncertainty'][i]),
+            box_uncertainty=float(results['box_uncertainty'][i]),
+            category_id=int(results['category_id'][i])))
+    return json_results
+
+
+def dump_al_results(path, results):
+    """Write columnar results as ``.npz`` or, for any other extension, as json."""
+    if path.endswith('.npz'):
+        save_al_results(path, results)
+    else:
+        with open(path, 'w') as f:
+            json.dump(al_results2json(results), f)
@@ -0,0 +1,321 @@
+import json
+import os
+
+import numpy as np
+
+# the format of the cache files, bumped when the arrays change
+INDEX_VERSION = 1
+
+# annotation files holding a subset of the images of a json, see save_index_subset
+SUBSET_SUFFIX = '.subset.npz'
+
+# indexes already loaded in this process, by absolute path, with the (size, mtime) of the json they were built from
+_LOADED_INDEXES = dict()
+
+
+def _pack_json(items):
+    # each item json encoded as json.dump would write it inside a list, back to back
+    encoded = [json.dumps(item).encode() for item in items]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(x) for x in encoded])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8).copy(), offsets
+
+
+class CocoIndex(object):
+    """Columnar index of a COCO style annotation file.
+
+    Images are rows of the image arrays (``img_ids``, ``img_sizes`` as
+    ``(width, height)``) in json order. The annotations of image ``i`` are
+    rows ``ann_offsets[i]:ann_offsets[i + 1]`` of the annotation arrays
+    (``ann_ids``, ``ann_category_ids``, ``ann_bboxes`` in ``xywh``,
+    ``ann_areas``, ``ann_iscrowd``, ``ann_ignore``), in json order within
+    an image. Annotations of images not in ``images`` are dropped. Every
+    image and annotation is also kept json encoded, so the dicts are only
+    decoded when asked for and subsets are written without re-encoding.
+
+    The json file stays the source of truth: :func:`load_coco_index` caches
+    the index next to it and rebuilds it when the json changes.
+    """
+
+    ARRAYS = ('img_ids', 'img_sizes', 'ann_offsets', 'ann_ids', 'ann_category_ids', 'ann_bboxes', 'ann_areas',
+              'ann_iscrowd', 'ann_ignore', 'img_json', 'img_json_offsets', 'ann_json', 'ann_json_offsets',
+              'categories_json')
+
+    def __init__(self, **arrays):
+        for k in self.ARRAYS:
+            setattr(self, k, arrays[k])
+        # the json the rows come from and the rows there, to write subset files (see dump)
+        self.source = None
+        self.source_img_rows = np.arange(len(self.img_ids))
+        self.source_ann_rows = np.arange(len(self.ann_ids))
+        self.categories = json.loads(self.categories_json.tobytes().decode())
+        self.ann_img_inds = np.repeat(np.arange(len(self.img_ids)), np.diff(self.ann_offsets))
+        self._id_order = np.argsort(self.img_ids, kind='stable')
+        self._id_lut = None
+        if len(self.img_ids) > 0 and self.img_ids.min() >= 0 and self.img_ids.max() < 4 * len(self.img_ids) + 65536:
+            # dense ids (as in COCO style json) are mapped with a lookup table instead of a binary search
+            self._id_lut = np.full(self.img_ids.max() + 1, -1, dtype=np.int64)
+            self._id_lut[self.img_ids] = np.arange(len(self.img_ids))
+
+    @classmethod
+    def from_json(cls, data):
+        """Build the index of a loaded COCO style dict."""
+        images = data['images']
+        img_ids = np.array([img['id'] for img in images], dtype=np.int64)
+        row_of = {img_id: i for i, img_id in enumerate(img_ids.tolist())}
+        anns = [ann for ann in data.get('annotations', []) if ann['image_id'] in row_of]
+        ann_rows = np.array([row_of[ann['image_id']] for ann in anns], dtype=np.int64)
+        # stable, so the annotations of an image stay in json order
+        order = np.argsort(ann_rows, kind='stable')
+        anns = [anns[i] for i in order]
+        ann_offsets = np.zeros(len(images) + 1, dtype=np.int64)
+        ann_offsets[1:] = np.cumsum(np.bincount(ann_rows, minlength=len(images)))
+
+        img_json, img_json_offsets = _pack_json(images)
+        ann_json, ann_json_offsets = _pack_json(anns)
+        return cls(
+            img_ids=img_ids,
+            img_sizes=np.array([(img.get('width', 0), img.get('height', 0)) for img in images], dtype=np.float64).reshape(-1, 2),
+            ann_offsets=ann_offsets,
+            ann_ids=np.array([ann['id'] for ann in anns], dtype=np.int64),
+            ann_category_ids=np.array([ann['category_id'] for ann in anns], dtype=np.int64),
+            ann_bboxes=np.array([ann['bbox'] for ann in anns], dtype=np.float64).reshape(-1, 4),
+            ann_areas=np.array([ann.get('area', 0) for ann in anns], dtype=np.float64),
+            ann_iscrowd=np.array([bool(ann.get('iscrowd', False)) for ann in anns], dtype=bool),
+            ann_ignore=np.array([bool(ann.get('ignore', False)) for ann in anns], dtype=bool),
+            img_json=img_json,
+            img_json_offsets=img_json_offsets,
+            ann_json=ann_json,
+            ann_json_offsets=ann_json_offsets,
+            categories_json=np.frombuffer(json.dumps(data.get('categories', [])).encode(), dtype=np.uint8).copy())
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(**{k: data[k] for k in cls.ARRAYS})
+
+    def save(self, path, source_stamp=(-1, -1)):
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as fwb:
+            np.savez(fwb, version=INDEX_VERSION, source_stamp=np.array(source_stamp, dtype=np.int64),
+                     **{k: getattr(self, k) for k in self.ARRAYS})
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self.img_ids)
+
+    @property
+    def n_anns(self):
+        return len(self.ann_ids)
+
+    def image_inds(self, img_ids):
+        """Rows of ``img_ids``, a KeyError is raised for ids not in the index."""
+        img_ids = np.asarray(img_ids, dtype=np.int64)
+        if self._id_lut is not None:
+            in_range = (img_ids >= 0) & (img_ids < len(self._id_lut))
+            inds = np.where(in_range, self._id_lut[np.where(in_range, img_ids, 0)], -1)
+            known = inds >= 0
+        elif len(self.img_ids) > 0:
+            pos = np.searchsorted(self.img_ids, img_ids, sorter=self._id_order)
+            inds = self._id_order[np.minimum(pos, len(self.img_ids) - 1)]
+            known = self.img_ids[inds] == img_ids
+        else:
+            inds, known = np.full(img_ids.shape, -1, dtype=np.int64), np.zeros(img_ids.shape, dtype=bool)
+        if not known.all():
+            unknown = np.unique(img_ids[~known])
+            raise KeyError('%d image ids are not in the index, e.g. %s' % (len(unknown), unknown[:5].tolist()))
+        return inds
+
+    def ann_inds(self, img_inds, ann_mask=None):
+        """Annotation rows of the images at ``img_inds``, image by image, optionally only where ``ann_mask``."""
+        img_inds = np.asarray(img_inds, dtype=np.int64)
+        starts, counts = self.ann_offsets[img_inds], np.diff(self.ann_offsets)[img_inds]
+        inds = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return inds if ann_mask is None else inds[ann_mask[inds]]
+
+    def cat_ids(self, cat_names):
+        """Ids of the categories named in ``cat_names``, in category order (as ``COCO.get_cat_ids``)."""
+        return [c['id'] for c in self.categories if c['name'] in cat_names]
+
+    @staticmethod
+    def _joined(blob, offsets, inds):
+        return b', '.join(blob[offsets[i]:offsets[i + 1]].tobytes() for i in inds)
+
+    def image_dicts(self, img_inds=None):
+        """Decoded image dicts of ``img_inds`` (all images by default), with one json parse."""
+        img_inds = range(len(self)) if img_inds is None else img_inds
+        return json.loads(b'[' + self._joined(self.img_json, self.img_json_offsets, img_inds) + b']')
+
+    def ann_dicts(self, ann_inds):
+        """Decoded annotation dicts of the annotation rows ``ann_inds``."""
+        return json.loads(b'[' + self._joined(self.ann_json, self.ann_json_offsets, ann_inds) + b']')
+
+    @staticmethod
+    def _sliced(blob, offsets, inds):
+        lengths = offsets[1:][inds] - offsets[:-1][inds]
+        new_offsets = np.zeros(len(inds) + 1, dtype=np.int64)
+        new_offsets[1:] = np.cumsum(lengths)
+        return np.concatenate([blob[:0]] + [blob[offsets[i]:offsets[i + 1]] for i in inds]), new_offsets
+
+    def subset(self, img_inds, ann_inds=None):
+        """Index of the images at ``img_inds`` and annotation rows ``ann_inds`` of these images."""
+        img_inds = np.asarray(img_inds, dtype=np.int64)
+        ann_inds = np.zeros((0, ), dtype=np.int64) if ann_inds is None else np.asarray(ann_inds, dtype=np.int64)
+        new_rows = np.full(len(self), -1, dtype=np.int64)
+        new_rows[img_inds] = np.arange(len(img_inds))
+        ann_rows = new_rows[self.ann_img_inds[ann_inds]]
+        assert (ann_rows >= 0).all(), 'annotations of images not in the subset'
+        ann_inds = ann_inds[np.argsort(ann_rows, kind='stable')]
+        ann_offsets = np.zeros(len(img_inds) + 1, dtype=np.int64)
+        ann_offsets[1:] = np.cumsum(np.bincount(ann_rows, minlength=len(img_inds)))
+        img_json, img_json_offsets = self._sliced(self.img_json, self.img_json_offsets, img_inds)
+        ann_json, ann_json_offsets = self._sliced(self.ann_json, self.ann_json_offsets, ann_inds)
+        subset = CocoIndex(
+            img_ids=self.img_ids[img_inds],
+            img_sizes=self.img_sizes[img_inds],
+            ann_offsets=ann_offsets,
+            ann_ids=self.ann_ids[ann_inds],
+            ann_category_ids=self.ann_category_ids[ann_inds],
+            ann_bboxes=self.ann_bboxes[ann_inds],
+            ann_areas=self.ann_areas[ann_inds],
+            ann_iscrowd=self.ann_iscrowd[ann_inds],
+            ann_ignore=self.ann_ignore[ann_inds],
+            img_json=img_json,
+            img_json_offsets=img_json_offsets,
+            ann_json=ann_json,
+            ann_json_offsets=ann_json_offsets,
+            categories_json=self.categories_json)
+        subset.source = self.source
+        subset.source_img_rows = self.source_img_rows[img_inds]
+        subset.source_ann_rows = self.source_ann_rows[ann_inds]
+        return subset
+
+    def dump(self, path, img_inds, ann_inds=None):
+        """Write the images at ``img_inds`` (and annotation rows ``ann_inds``), as json or as a subset file.
+
+        Paths ending with ``.subset.npz`` get a subset file (see
+        :func:`save_index_subset`), other paths a json (see :meth:`dump_json`).
+        """
+        if path.endswith(SUBSET_SUFFIX):
+            assert self.source is not None, 'subset files are written from indexes of a json file'
+            img_inds = np.asarray(img_inds, dtype=np.int64)
+            save_index_subset(path, self.source, self.source_img_rows[img_inds],
+                              None if ann_inds is None else self.source_ann_rows[np.asarray(ann_inds, dtype=np.int64)])
+        else:
+            self.dump_json(path, img_inds, ann_inds)
+
+    def dump_json(self, path, img_inds, ann_inds=None):
+        """Write the images at ``img_inds`` (and annotation rows ``ann_inds``) as a COCO style json.
+
+        The file is byte for byte what ``json.dump`` writes for a dict of
+        the decoded images, annotations (no key if ``ann_inds`` is None)
+        and categories, without decoding them.
+        """
+        parts = [b'{"images": [', self._joined(self.img_json, self.img_json_offsets, img_inds), b']']
+        if ann_inds is not None:
+            parts += [b', "annotations": [', self._joined(self.ann_json, self.ann_json_offsets, ann_inds), b']']
+        parts += [b', "categories": ', self.categories_json.tobytes(), b'}']
+        with open(path, 'wb') as fwb:
+            fwb.write(b''.join(parts))
+        # what was written is already indexed, the next load_coco_index of the file does not parse it
+        abs_path = os.path.abspath(path)
+        _LOADED_INDEXES[abs_path] = (_source_stamp(abs_path), self.subset(img_inds, ann_inds))
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def save_index_subset(path, source, img_rows, ann_rows=None):
+    """Write a subset file: the images ``img_rows`` of the json ``source``.
+
+    A subset file (``<name>.subset.npz``) stands for the json that
+    :meth:`CocoIndex.dump_json` would write, with images and annotations
+    in the order of ``source``. It only holds the path of ``source`` and
+    bitmaps of the image rows and annotation rows (no annotations key if
+    ``ann_rows`` is None), so an AL round moves images between label sets
+    without copying their annotations. :func:`load_coco_index` reads
+    subset files like json files, :func:`materialize_json` writes the json.
+    """
+    source = os.path.abspath(source)
+    index = load_coco_index(source)
+    img_mask = np.zeros(len(index), dtype=bool)
+    img_mask[img_rows] = True
+    arrays = dict(source=np.array(source), n_images=len(index), img_mask=np.packbits(img_mask))
+    if ann_rows is not None:
+        ann_mask = np.zeros(index.n_anns, dtype=bool)
+        ann_mask[ann_rows] = True
+        arrays.update(n_anns=index.n_anns, ann_mask=np.packbits(ann_mask))
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as fwb:
+        np.savez(fwb, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _load_index_subset(path):
+    with np.load(path) as data:
+        source = str(data['source'])
+        index = load_coco_index(source)
+        assert int(data['n_images']) == len(index), '%s changed since %s was written' % (source, path)
+        img_rows = np.flatnonzero(np.unpackbits(data['img_mask'], count=len(index)))
+        ann_rows = np.flatnonzero(np.unpackbits(data['ann_mask'], count=index.n_anns)) if 'ann_mask' in data else None
+    return index.subset(img_rows, ann_rows), ann_rows is not None
+
+
+def convert_to_subset(ann_file, path, source, with_annotations=True):
+    """Write the images of ``ann_file`` as a subset file of ``source``, with all their annotations there."""
+    index = load_coco_index(source)
+    img_rows = index.image_inds(load_coco_index(ann_file).img_ids)
+    save_index_subset(path, source, img_rows, index.ann_inds(img_rows) if with_annotations else None)
+
+
+def materialize_json(ann_file, json_path):
+    """Write the json of an annotation file, e.g. of a subset file."""
+    if ann_file.endswith(SUBSET_SUFFIX):
+        index, with_annotations = _load_index_subset(ann_file)
+    else:
+        index, with_annotations = load_coco_index(ann_file), True
+    index.dump_json(json_path, np.arange(len(index)), np.arange(index.n_anns) if with_annotations else None)
+
+
+def load_coco_index(ann_file, cache=True):
+    """The :class:`CocoIndex` of ``ann_file``, built once.
+
+    An index is shared by everything in the process reading the same
+    unchanged file. With ``cache=True`` it is also saved next to the json
+    as ``<ann_file>.index.npz`` and loaded from there while the size and
+    modification time of the json match the ones it was built from.
+    ``ann_file`` may also be a subset file (see :func:`save_index_subset`).
+    """
+    path = os.path.abspath(ann_file)
+    stamp = _source_stamp(path)
+    loaded = _LOADED_INDEXES.get(path)
+    if loaded is not None and loaded[0] == stamp:
+        return loaded[1]
+    if path.endswith(SUBSET_SUFFIX):
+        index = _load_index_subset(path)[0]
+        _LOADED_INDEXES[path] = (stamp, index)
+        return index
+
+    index = None
+    cache_path = path + '.index.npz'
+    if cache and os.path.isfile(cache_path):
+        try:
+            with np.load(cache_path) as data:
+                valid = int(data['version']) == INDEX_VERSION and tuple(data['source_stamp'].tolist()) == stamp
+            if valid:
+                index = CocoIndex.load(cache_path)
+        except (OSError, ValueError, KeyError):
+            index = None  # unreadable cache, rebuilt below
+    if index is None:
+        with open(path) as f:
+            index = CocoIndex.from_json(json.load(f))
+        if cache:
+            try:
+                index.save(cache_path, stamp)
+            except OSError:
+                pass  # read-only annotation directory, the index is rebuilt next time
+    index.source = path
+    _LOADED_INDEXES[path] = (stamp, index)
+    return index
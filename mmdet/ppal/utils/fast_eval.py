@@ -0,0 +1,226 @@
+import numpy as np
+
+# thresholds of pycocotools.cocoeval.Params
+COCO_IOU_THRS = np.linspace(.5, 0.95, int(np.round((0.95 - .5) / .05)) + 1, endpoint=True)
+COCO_REC_THRS = np.linspace(.0, 1.00, int(np.round((1.00 - .0) / .01)) + 1, endpoint=True)
+
+
+def _pair_ious(det_bboxes, gt_bboxes, gt_iscrowd):
+    # xywh boxes as pycocotools.mask.iou, crowd regions are divided by the detection area only
+    x1 = np.maximum(det_bboxes[:, 0], gt_bboxes[:, 0])
+    y1 = np.maximum(det_bboxes[:, 1], gt_bboxes[:, 1])
+    x2 = np.minimum(det_bboxes[:, 0] + det_bboxes[:, 2], gt_bboxes[:, 0] + gt_bboxes[:, 2])
+    y2 = np.minimum(det_bboxes[:, 1] + det_bboxes[:, 3], gt_bboxes[:, 1] + gt_bboxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    det_areas = det_bboxes[:, 2] * det_bboxes[:, 3]
+    union = np.where(gt_iscrowd, det_areas, det_areas + gt_bboxes[:, 2] * gt_bboxes[:, 3] - inter)
+    return np.where(union > 0, inter / np.where(union > 0, union, 1), 0)
+
+
+def coco_bbox_ap(det_bboxes, det_scores, det_img_ids, gt_bboxes, gt_ignore, gt_iscrowd, gt_img_ids,
+                 iou_thrs=COCO_IOU_THRS, max_dets=100):
+    """AP of one category at each IoU threshold, as ``COCOeval`` with the area range 'all'.
+
+    The greedy matching of ``COCOeval.evaluateImg`` is run for all images
+    and IoU thresholds at once, one detection rank after the other, on the
+    detection / ground truth pairs of the same image only. Results are the
+    ``precision`` of ``COCOeval.accumulate`` averaged over recall, so
+    ``ap.mean()`` is the COCO mAP and ``ap[0]`` the AP@0.5.
+
+    Args:
+        det_bboxes (ndarray): ``[n, 4]`` xywh detections.
+        det_scores (ndarray): ``[n]`` scores.
+        det_img_ids (ndarray): ``[n]`` image ids of the detections.
+        gt_bboxes (ndarray): ``[m, 4]`` xywh ground truths of the evaluated
+            images, including the ignored ones.
+        gt_ignore (ndarray): ``[m]`` ignored ground truths, which COCOeval
+            sets from ``iscrowd`` only.
+        gt_iscrowd (ndarray): ``[m]`` crowd regions, matched by any number
+            of detections.
+        gt_img_ids (ndarray): ``[m]`` image ids of the ground truths.
+        iou_thrs (Sequence[float]): IoU thresholds.
+        max_dets (int): Detections kept per image, by score.
+
+    Returns:
+        ndarray: ``[len(iou_thrs)]`` AP, -1 if there is no ground truth
+            that is not ignored.
+    """
+    iou_thrs = np.asarray(iou_thrs, dtype=np.float64)
+    det_bboxes = np.asarray(det_bboxes, dtype=np.float64).reshape(-1, 4)
+    det_scores = np.asarray(det_scores, dtype=np.float64)
+    gt_bboxes = np.asarray(gt_bboxes, dtype=np.float64).reshape(-1, 4)
+    gt_ignore = np.asarray(gt_ignore, dtype=bool)
+    gt_iscrowd = np.asarray(gt_iscrowd, dtype=bool)
+    n_pos = int((~gt_ignore).sum())
+    if n_pos == 0:
+        return np.full(len(iou_thrs), -1.)
+
+    img_ids, det_imgs, det_order, det_ranks, gt_imgs, gt_order = _sort_by_image(
+        det_scores, det_img_ids, gt_ignore, gt_img_ids, max_dets)
+    det_bboxes, det_scores = det_bboxes[det_order], det_scores[det_order]
+    gt_bboxes, gt_ignore, gt_iscrowd = gt_bboxes[gt_order], gt_ignore[gt_order], gt_iscrowd[gt_order]
+
+    # all detection / ground truth pairs of the same image
+    gt_counts = np.bincount(gt_imgs, minlength=len(img_ids))
+    gt_starts = np.concatenate([[0], np.cumsum(gt_counts)[:-1]])
+    pair_counts = gt_counts[det_imgs]
+    pair_dets = np.repeat(np.arange(len(det_imgs)), pair_counts)
+    pair_gts = gt_starts[det_imgs][pair_dets] + np.arange(pair_counts.sum()) - \
+        np.repeat(np.cumsum(pair_counts) - pair_counts, pair_counts)
+    pair_ious = _pair_ious(det_bboxes[pair_dets], gt_bboxes[pair_gts], gt_iscrowd[pair_gts])
+    det_gts = _greedy_match(det_ranks, pair_dets, pair_gts, pair_ious, np.minimum(iou_thrs, 1 - 1e-10),
+                            gt_ignore, gt_iscrowd)
+    tps, fps, _ = _accumulate(det_gts, det_scores, gt_ignore)
+    return _interpolated_ap(tps, fps, n_pos)
+
+
+def _sort_by_image(det_scores, det_img_ids, gt_ignore, gt_img_ids, max_dets):
+    # images in id order, detections by score and ground truths not ignored first, both stable
+    img_ids, inv = np.unique(np.concatenate([det_img_ids, gt_img_ids]), return_inverse=True)
+    det_imgs, gt_imgs = inv[:len(det_scores)], inv[len(det_scores):]
+    det_order = np.lexsort((-det_scores, det_imgs))
+    det_starts = np.searchsorted(det_imgs[det_order], np.arange(len(img_ids)))
+    det_ranks = np.arange(len(det_order)) - det_starts[det_imgs[det_order]]
+    det_order, det_ranks = det_order[det_ranks < max_dets], det_ranks[det_ranks < max_dets]
+    gt_order = np.lexsort((gt_ignore, gt_imgs))
+    return img_ids, det_imgs[det_order], det_order, det_ranks, gt_imgs[gt_order], gt_order
+
+
+def _greedy_match(det_ranks, pair_dets, pair_gts, pair_sims, thrs, gt_ignore, gt_iscrowd):
+    """Ground truth matched by each detection at each threshold, -1 if none, as ``COCOeval.evaluateImg``.
+
+    Detections of an image take the most similar ground truth with a
+    similarity in ``[0, 1]`` of at least the threshold, in score order, so
+    the detections of the same rank of all images are matched at once.
+    """
+    # by detection rank, detection and ground truth order
+    pair_order = np.lexsort((pair_gts, pair_dets, det_ranks[pair_dets]))
+    pair_dets, pair_gts, pair_sims = pair_dets[pair_order], pair_gts[pair_order], pair_sims[pair_order]
+    rank_bounds = np.searchsorted(det_ranks[pair_dets], np.arange(det_ranks.max() + 2 if len(det_ranks) else 1))
+
+    thrs = np.asarray(thrs, dtype=np.float64)[:, None]
+    gt_matched = np.zeros((len(thrs), len(gt_ignore)), dtype=bool)
+    det_gts = np.full((len(thrs), len(det_ranks)), -1, dtype=np.int64)
+    for rank in range(len(rank_bounds) - 1):
+        lo, hi = rank_bounds[rank], rank_bounds[rank + 1]
+        if lo == hi:
+            continue
+        dets, gts, sims = pair_dets[lo:hi], pair_gts[lo:hi], pair_sims[lo:hi]
+        eligible = (sims >= thrs) & ~(gt_matched[:, gts] & ~gt_iscrowd[gts])
+        # ground truths that are not ignored first, then the most similar, the last one on ties
+        key = np.where(eligible, sims + 2 * ~gt_ignore[gts], -1)
+        group_starts = np.flatnonzero(np.r_[True, dets[1:] != dets[:-1]])
+        group_max = np.maximum.reduceat(key, group_starts, axis=1)
+        group_of_pair = np.cumsum(np.r_[False, dets[1:] != dets[:-1]])
+        is_max = (key == group_max[:, group_of_pair]) & (key >= 0)
+        best = np.maximum.reduceat(np.where(is_max, np.arange(hi - lo), -1), group_starts, axis=1)
+        thr_inds, group_inds = np.nonzero(best >= 0)
+        matched_gts = gts[best[thr_inds, group_inds]]
+        det_gts[thr_inds, dets[group_starts[group_inds]]] = matched_gts
+        gt_matched[thr_inds, matched_gts] = True
+    return det_gts
+
+
+def _accumulate(det_gts, det_scores, gt_ignore):
+    # cumulative tp / fp over the detections of all images sorted by score (stable), as COCOeval.accumulate
+    order = np.argsort(-det_scores, kind='mergesort')
+    det_gts = det_gts[:, order]
+    det_ignored = (det_gts >= 0) & gt_ignore[np.maximum(det_gts, 0)]
+    tps = np.cumsum((det_gts >= 0) & ~det_ignored, axis=1, dtype=np.float64)
+    fps = np.cumsum((det_gts < 0) & ~det_ignored, axis=1, dtype=np.float64)
+    return tps, fps, det_scores[order]
+
+
+def _interpolated_ap(tps, fps, n_pos):
+    recall = tps / n_pos
+    precision = tps / (fps + tps + np.spacing(1))
+    precision = np.maximum.accumulate(precision[:, ::-1], axis=1)[:, ::-1]
+    ap = np.zeros(len(tps))
+    for t in range(len(tps)):
+        inds = np.searchsorted(recall[t], COCO_REC_THRS, side='left')
+        q = np.zeros(len(COCO_REC_THRS))
+        valid = inds < tps.shape[1]
+        q[valid] = precision[t, inds[valid]]
+        ap[t] = q.mean()
+    return ap
+
+
+def _point_pairs(det_points, det_imgs, gt_points, gt_imgs, radius):
+    # detection / ground truth pairs of the same image within radius, from a grid hash of cells of size radius
+    points = np.concatenate([det_points, gt_points]).reshape(-1, 2)
+    cells = np.floor(points / radius).astype(np.int64)
+    cells -= cells.min(axis=0) - 1 if len(cells) else 0
+    n_x, n_y = cells.max(axis=0) + 2 if len(cells) else (1, 1)
+    det_cells, gt_cells = cells[:len(det_points)], cells[len(det_points):]
+    gt_keys = (gt_imgs * n_y + gt_cells[:, 1]) * n_x + gt_cells[:, 0]
+    gt_order = np.argsort(gt_keys, kind='mergesort')
+    gt_keys = gt_keys[gt_order]
+
+    pair_dets, pair_gts = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            keys = (det_imgs * n_y + det_cells[:, 1] + dy) * n_x + det_cells[:, 0] + dx
+            lo = np.searchsorted(gt_keys, keys, side='left')
+            counts = np.searchsorted(gt_keys, keys, side='right') - lo
+            dets = np.repeat(np.arange(len(keys)), counts)
+            pair_dets.append(dets)
+            pair_gts.append(gt_order[lo[dets] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)])
+    pair_dets, pair_gts = np.concatenate(pair_dets), np.concatenate(pair_gts)
+    dists = np.linalg.norm(det_points[pair_dets] - gt_points[pair_gts], axis=1)
+    keep = dists <= radius
+    return pair_dets[keep], pair_gts[keep], dists[keep]
+
+
+def centroid_match(det_points, det_scores, det_img_ids, gt_points, gt_ignore, gt_img_ids, radius=3., score_thr=0.5,
+                   max_dets=1000):
+    """AP, precision, recall and F1 of one category, matching detections to ground truth points within a radius.
+
+    Detections of each image take the nearest unmatched ground truth point
+    within ``radius`` in score order, as the greedy matching of
+    ``COCOeval`` with the centroid distance instead of the IoU. Candidate
+    pairs come from a grid hash of all images, so the cost grows with the
+    number of points rather than with the number of detection / ground
+    truth pairs of an image. Detections matched to ignored points are
+    neither true nor false positives.
+
+    Args:
+        det_points (ndarray): ``[n, 2]`` xy centres of the detections.
+        det_scores (ndarray): ``[n]`` scores.
+        det_img_ids (ndarray): ``[n]`` image ids of the detections.
+        gt_points (ndarray): ``[m, 2]`` xy ground truth points.
+        gt_ignore (ndarray): ``[m]`` ignored ground truths, which can be
+            matched by any number of detections.
+        gt_img_ids (ndarray): ``[m]`` image ids of the ground truths.
+        radius (float): Largest matching distance in pixels.
+        score_thr (float): Detections kept for precision, recall and F1.
+        max_dets (int): Detections kept per image, by score.
+
+    Returns:
+        dict: ``ap`` (-1 if there is no ground truth that is not ignored),
+            ``precision``, ``recall`` and ``f1``.
+    """
+    assert radius > 0, 'radius must be positive'
+    det_points = np.asarray(det_points, dtype=np.float64).reshape(-1, 2)
+    det_scores = np.asarray(det_scores, dtype=np.float64)
+    gt_points = np.asarray(gt_points, dtype=np.float64).reshape(-1, 2)
+    gt_ignore = np.asarray(gt_ignore, dtype=bool)
+    n_pos = int((~gt_ignore).sum())
+    if n_pos == 0:
+        return dict(ap=-1., precision=0., recall=0., f1=0.)
+
+    _, det_imgs, det_order, det_ranks, gt_imgs, gt_order = _sort_by_image(
+        det_scores, det_img_ids, gt_ignore, gt_img_ids, max_dets)
+    det_points, det_scores = det_points[det_order], det_scores[det_order]
+    gt_points, gt_ignore = gt_points[gt_order], gt_ignore[gt_order]
+
+    pair_dets, pair_gts, dists = _point_pairs(det_points, det_imgs, gt_points, gt_imgs, radius)
+    det_gts = _greedy_match(det_ranks, pair_dets, pair_gts, 1 - dists / radius, [0.],
+                            gt_ignore, gt_ignore)
+    tps, fps, scores = _accumulate(det_gts, det_scores, gt_ignore)
+
+    n_kept = int((scores >= score_thr).sum())
+    tp, fp = (float(tps[0, n_kept - 1]), float(fps[0, n_kept - 1])) if n_kept > 0 else (0., 0.)
+    precision = tp / (tp + fp) if tp + fp > 0 else 0.
+    recall = tp / n_pos
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.
+    return dict(ap=float(_interpolated_ap(tps, fps, n_pos)[0]), precision=precision, recall=recall, f1=f1)
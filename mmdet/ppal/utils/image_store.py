@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+
+
+class PackedImageStore(object):
+    """Decoded images packed in one read-only memory-mapped file.
+
+    A store is two files next to each other: ``<prefix>.bin``, the uint8
+    pixels of all images back to back, and ``<prefix>.idx.npz``, the index
+    (``image_ids``, absolute image ``paths``, ``offsets`` into the ``.bin``
+    file and ``shapes``). Images are addressed by path, since image ids and
+    file names repeat between the annotation files of different splits.
+    The file is mapped lazily, so every DataLoader worker maps the same
+    pages of the page cache and ``get`` returns views without any copy or
+    decoding. Stores are written with :func:`write_image_store`.
+
+    Args:
+        prefix (str): Path of the store without the ``.bin`` / ``.idx.npz``
+            suffix.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        with np.load(prefix + '.idx.npz') as index:
+            self.image_ids = index['image_ids']
+            self.paths = index['paths']
+            self.offsets = index['offsets']
+            self.shapes = index['shapes']
+        self._path_index = {str(path): i for i, path in enumerate(self.paths)}
+        self._data = None
+
+    def __len__(self):
+        return len(self.image_ids)
+
+    @property
+    def data(self):
+        # mapped on first use, i.e. in each worker process after the fork
+        if self._data is None:
+            self._data = np.memmap(self.prefix + '.bin', dtype=np.uint8, mode='r') \
+                if self.offsets[-1] > 0 else np.zeros((0, ), dtype=np.uint8)
+        return self._data
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_data'] = None
+        return state
+
+    def index_of(self, path):
+        """Position of the image at ``path``, None if it is not stored."""
+        return self._path_index.get(os.path.abspath(path))
+
+    def get(self, index):
+        """Read-only ``(H, W[, C])`` uint8 view of the image at ``index``."""
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.data[start:end].reshape(tuple(s for s in self.shapes[index] if s > 0))
+
+
+def write_image_store(prefix, records):
+    """Write a :class:`PackedImageStore` from ``(image_id, path, img)`` records.
+
+    Images are appended to ``<prefix>.bin`` one by one, so the corpus never
+    has to fit in memory. Gray images are kept 2-D (their third shape entry
+    is 0 in the index).
+
+    Returns:
+        int: Number of stored images.
+    """
+    output_dir = os.path.dirname(prefix)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    image_ids, paths, offsets, shapes = [], [], [0], []
+    with open(prefix + '.bin', 'wb') as fwb:
+        for image_id, path, img in records:
+            img = np.ascontiguousarray(img, dtype=np.uint8)
+            assert img.ndim in (2, 3), 'images must be (H, W) or (H, W, C), got %s' % (img.shape, )
+            fwb.write(img.tobytes())
+            image_ids.append(int(image_id))
+            paths.append(os.path.abspath(path))
+            offsets.append(offsets[-1] + img.size)
+            shapes.append(tuple(img.shape) + (0, ) * (3 - img.ndim))
+    assert len(set(paths)) == len(paths), 'image paths of a store must be unique'
+    with open(prefix + '.idx.npz', 'wb') as fwb:
+        np.savez(fwb,
+                 image_ids=np.asarray(image_ids, dtype=np.int64),
+                 paths=np.asarray(paths, dtype=str),
+                 offsets=np.asarray(offsets, dtype=np.int64),
+                 shapes=np.asarray(shapes, dtype=np.int64).reshape(-1, 3))
+    return len(image_ids)
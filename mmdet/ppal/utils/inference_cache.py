@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from mmdet.ppal.utils.al_results import dump_al_results, load_al_results
+from mmdet.ppal.utils.coco_index import load_coco_index
+from mmdet.ppal.utils.running_checks import sys_echo
+
+# per-image columns of each cached record kind, detections are stored without padding
+RESULT_COLUMNS = ('bbox', 'score', 'category_id', 'cls_uncertainty', 'box_uncertainty')
+FEAT_COLUMNS = ('det_labels', 'det_scores', 'det_feats')
+
+# model settings that change between rounds without changing the outputs
+VOLATILE_HEAD_KEYS = ('total_images', 'output_path')
+
+
+class InferenceCache(object):
+    """On-disk cache of per-image AL inference outputs.
+
+    Records are grouped in namespaces keyed by the hash of the checkpoint
+    and of the inference config (model + test pipeline); inside a namespace
+    they are addressed by image id. Each ``put_*`` call appends one chunk,
+    an uncompressed ``.npz`` with the detections of all its images
+    concatenated and a per-image offset column. When the cache grows over
+    ``max_size_mb``, the least recently used namespaces are evicted.
+
+    Two record kinds are kept: ``results`` (the fields of the uncertainty
+    ``.bbox.json`` or ``.bbox.npz``) and ``feats`` (the detections and
+    embeddings written by :func:`mmdet.ppal.models.utils.save_det_feat_cache`).
+
+    Args:
+        root (str): Cache directory, shared by all rounds and runs.
+        max_size_mb (float): Size cap of the whole cache.
+    """
+
+    def __init__(self, root, max_size_mb=8192):
+        self.root = root
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self._checkpoint_hashes = dict()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def config_hash(cfg):
+        model = cfg.model.to_dict() if hasattr(cfg.model, 'to_dict') else dict(cfg.model)
+        head = dict(model.get('bbox_head', dict()))
+        for key in VOLATILE_HEAD_KEYS:
+            head.pop(key, None)
+        model['bbox_head'] = head
+        pipeline = cfg.data.test.pipeline
+        content = json.dumps(dict(model=model, pipeline=pipeline), sort_keys=True, default=str)
+        return hashlib.sha1(content.encode()).hexdigest()[:16]
+
+    def checkpoint_hash(self, checkpoint_path):
+        stat = os.stat(checkpoint_path)
+        memo_key = (os.path.abspath(checkpoint_path), stat.st_size, stat.st_mtime)
+        if memo_key not in self._checkpoint_hashes:
+            sha = hashlib.sha1()
+            with open(checkpoint_path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(block)
+            self._checkpoint_hashes[memo_key] = sha.hexdigest()[:16]
+        return self._checkpoint_hashes[memo_key]
+
+    def make_key(self, checkpoint_path, cfg):
+        return '%s_%s' % (self.checkpoint_hash(checkpoint_path), self.config_hash(cfg))
+
+    def _namespace_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def _load_index(self, key):
+        index_path = os.path.join(self._namespace_dir(key), 'index.json')
+        if not os.path.isfile(index_path):
+            return dict(results=dict(), feats=dict(), n_chunks=0)
+        with open(index_path) as f:
+            return json.load(f)
+
+    def _save_index(self, key, index):
+        index_path = os.path.join(self._namespace_dir(key), 'index.json')
+        with open(index_path + '.tmp', 'w') as f:
+            json.dump(index, f)
+        os.replace(index_path + '.tmp', index_path)
+
+    def _read_lru(self):
+        lru_path = os.path.join(self.root, 'lru.json')
+        if not os.path.isfile(lru_path):
+            return dict()
+        with open(lru_path) as f:
+            return json.load(f)
+
+    def _write_lru(self, lru):
+        lru_path = os.path.join(self.root, 'lru.json')
+        with open(lru_path + '.tmp', 'w') as f:
+            json.dump(lru, f)
+        os.replace(lru_path + '.tmp', lru_path)
+
+    def _touch(self, key):
+        lru = self._read_lru()
+        lru[key] = time.time()
+        self._write_lru(lru)
+
+    def missing_image_ids(self, key, image_ids, kind='results'):
+        index = self._load_index(key)[kind]
+        return [img_id for img_id in image_ids if str(img_id) not in index]
+
+    def _put(self, key, kind, image_ids, columns):
+        """Append one chunk. ``columns`` hold per-image lists of arrays."""
+        namespace_dir = self._namespace_dir(key)
+        os.makedirs(namespace_dir, exist_ok=True)
+        index = self._load_index(key)
+
+        counts = np.array([len(x) for x in columns[next(iter(columns))]], dtype=np.int64)
+        data = dict(image_ids=np.asarray(image_ids, dtype=np.int64),
+                    offsets=np.concatenate(([0], np.cumsum(counts))))
+        for name, per_image in columns.items():
+            data[name] = np.concatenate(per_image, axis=0)
+
+        chunk_name = '%s_%05d.npz' % (kind, index['n_chunks'])
+        np.savez(os.path.join(namespace_dir, chunk_name), **data)
+        index['n_chunks'] += 1
+        for row, img_id in enumerate(image_ids):
+            index[kind][str(img_id)] = [chunk_name, row]
+        self._save_index(key, index)
+        self.evict(keep=key)
+
+    def _get(self, key, kind, image_ids, names):
+        """Return ``{name: [per-image array]}`` in the order of ``image_ids``."""
+        index = self._load_index(key)[kind]
+        by_chunk = dict()
+        for pos, img_id in enumerate(image_ids):
+            chunk_name, row = index[str(img_id)]
+            by_chunk.setdefault(chunk_name, []).append((pos, row))
+
+        out = {name: [None] * len(image_ids) for name in names}
+        for chunk_name, rows in by_chunk.items():
+            with np.load(os.path.join(self._namespace_dir(key), chunk_name)) as chunk:
+                offsets = chunk['offsets']
+                columns = {name: chunk[name] for name in names}
+            for pos, row in rows:
+                for name in names:
+                    out[name][pos] = columns[name][offsets[row]:offsets[row + 1]]
+        self._touch(key)
+        return out
+
+    def put_results(self, key, image_ids, result_path):
+        """Cache a ``.bbox.json``/``.bbox.npz`` written for ``image_ids`` (images without boxes included)."""
+        results = load_al_results(result_path)
+        order = np.argsort(results['image_id'], kind='stable')
+        sorted_ids = results['image_id'][order]
+        starts = np.searchsorted(sorted_ids, image_ids, side='left')
+        ends = np.searchsorted(sorted_ids, image_ids, side='right')
+
+        columns = {name: [] for name in RESULT_COLUMNS}
+        for name in RESULT_COLUMNS:
+            dtype = np.int64 if name == 'category_id' else np.float32
+            sorted_col = results[name][order].astype(dtype)
+            for start, end in zip(starts, ends):
+                columns[name].append(sorted_col[start:end])
+        self._put(key, 'results', list(image_ids), columns)
+
+    def put_feats(self, key, feat_cache_path):
+        """Cache a fused inference feature file, padding rows are dropped."""
+        with np.load(feat_cache_path) as data:
+            cache = {k: data[k] for k in data.files}
+        uniq_ids, first_inds = np.unique(cache['image_ids'], return_index=True)
+        columns = {name: [] for name in FEAT_COLUMNS}
+        for i in first_inds:
+            n_dets = int((cache['det_labels'][i] >= 0).sum())
+            for name in FEAT_COLUMNS:
+                columns[name].append(cache[name][i][:n_dets])
+        self._put(key, 'feats', uniq_ids.tolist(), columns)
+
+    def export_results(self, key, image_ids, result_path):
+        """Write a ``.bbox.json`` or ``.bbox.npz`` for ``image_ids`` from cached results."""
+        records = self._get(key, 'results', image_ids, RESULT_COLUMNS)
+        counts = [len(x) for x in records['score']]
+        results = {name: np.concatenate(records[name], axis=0) for name in RESULT_COLUMNS}
+        results['image_id'] = np.repeat(np.asarray(image_ids, dtype=np.int64), counts)
+        dump_al_results(result_path, results)
+
+    def export_feats(self, key, image_ids, feat_cache_path):
+        """Write a padded feature file (see ``save_det_feat_cache``) for ``image_ids``."""
+        from mmdet.ppal.models.utils import save_det_feat_cache
+        records = self._get(key, 'feats', image_ids, FEAT_COLUMNS)
+        max_det = max([1] + [len(x) for x in records['det_labels']])
+        feat_dim = records['det_feats'][0].shape[-1]
+        det_labels = np.full((len(image_ids), max_det), -1, dtype=np.float32)
+        det_scores = np.zeros((len(image_ids), max_det), dtype=np.float32)
+        det_feats = np.zeros((len(image_ids), max_det, feat_dim), dtype=np.float32)
+        for pos in range(len(image_ids)):
+            n_dets = len(records['det_labels'][pos])
+            det_labels[pos, :n_dets] = records['det_labels'][pos]
+            det_scores[pos, :n_dets] = records['det_scores'][pos]
+            det_feats[pos, :n_dets] = records['det_feats'][pos]
+        save_det_feat_cache(feat_cache_path, np.asarray(image_ids).reshape(-1, 1),
+                            det_labels, det_scores, det_feats)
+
+    def size(self, key=None):
+        target = self.root if key is None else self._namespace_dir(key)
+        total = 0
+        for dirpath, _, filenames in os.walk(target):
+            total += sum(os.path.getsize(os.path.join(dirpath, x)) for x in filenames)
+        return total
+
+    def evict(self, keep=None):
+        if keep is not None:
+            self._touch(keep)
+        lru = self._read_lru()
+        namespaces = [x for x in os.listdir(self.root) if os.path.isdir(self._namespace_dir(x))]
+        sizes = {x: self.size(x) for x in namespaces}
+        total = sum(sizes.values())
+        for key in sorted(namespaces, key=lambda x: lru.get(x, 0.)):
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._namespace_dir(key), ignore_errors=True)
+            total -= sizes[key]
+            lru.pop(key, None)
+            sys_echo('>>>> Inference cache: evicted %s (%.1f MB)' % (key, sizes[key] / 1024. / 1024.))
+        self._write_lru(lru)
+
+
+def run_cached_inference(cache, key, ann_json, jsonfile_prefix, infer_fn, feat_cache_path=None, result_format='json'):
+    """Produce inference outputs for the images of ``ann_json``, reusing the cache.
+
+    Only images missing from the cache are passed to ``infer_fn(ann_file,
+    jsonfile_prefix, feat_cache_path)``, through a temporary annotation file
+    next to ``jsonfile_prefix``. Its outputs are added to the cache and the
+    full ``<jsonfile_prefix>.bbox.json`` (``.bbox.npz`` when ``result_format``
+    is ``'npz'``, and ``feat_cache_path`` if given) is then exported from the
+    cache.
+    """
+    result_suffix = '.bbox.npz' if result_format == 'npz' else '.bbox.json'
+    ann_index = load_coco_index(ann_json)
+    image_ids = ann_index.img_ids.tolist()
+
+    missing = set(cache.missing_image_ids(key, image_ids, 'results'))
+    if feat_cache_path is not None:
+        missing |= set(cache.missing_image_ids(key, image_ids, 'feats'))
+    sys_echo('>>>> Inference cache %s: %d hits, %d misses' % (key, len(image_ids) - len(missing), len(missing)))
+
+    if len(missing) > 0:
+        missing_json = jsonfile_prefix + '.missing.json'
+        missing_prefix = jsonfile_prefix + '.missing'
+        missing_feat_path = missing_prefix + '.feat_cache.npz' if feat_cache_path is not None else None
+        missing_rows = np.flatnonzero(np.isin(ann_index.img_ids, list(missing)))
+        ann_index.dump_json(missing_json, missing_rows, ann_index.ann_inds(missing_rows) if ann_index.n_anns else None)
+
+        infer_fn(missing_json, missing_prefix, missing_feat_path)
+        missing_ids = ann_index.img_ids[missing_rows].tolist()
+        cache.put_results(key, missing_ids, missing_prefix + result_suffix)
+        if missing_feat_path is not None:
+            cache.put_feats(key, missing_feat_path)
+        for path in (missing_json, missing_prefix + result_suffix, missing_feat_path):
+            if path is not None and os.path.isfile(path):
+                os.remove(path)
+
+    cache.export_results(key, image_ids, jsonfile_prefix + result_suffix)
+    if feat_cache_path is not None:
+        cache.export_feats(key, image_ids, feat_cache_path)
@@ -0,0 +1,127 @@
+import numpy as np
+
+
+class DenseDistances(object):
+    """Distance provider over a precomputed (possibly memory-mapped) matrix.
+
+    Providers expose ``n``, ``columns(inds)`` returning the ``[n, len(inds)]``
+    distances of every point to ``inds`` and ``submatrix(inds)``, so that the
+    clustering below never needs more than a few columns of a large pool.
+    """
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.n = matrix.shape[0]
+
+    def columns(self, inds):
+        return np.asarray(self.matrix[:, inds], dtype=np.float64)
+
+    def submatrix(self, inds):
+        return np.asarray(self.matrix[np.ix_(inds, inds)], dtype=np.float64)
+
+
+def farthest_point_seeding(dist, K, first=None):
+    """Greedy k-center seeding with a running min-distance vector.
+
+    Each step reads one column of ``dist`` instead of the distances to all
+    chosen centers. ``first`` defaults to a random point (``np.random``).
+    """
+    K = min(K, dist.n)
+    first = np.random.randint(0, dist.n, (1, ))[0] if first is None else first
+    centroids = [int(first)]
+    min_dis = dist.columns([first])[:, 0]
+    min_dis[centroids] = -1
+    while len(centroids) < K:
+        new_c = int(np.argmax(min_dis))
+        centroids.append(new_c)
+        min_dis = np.minimum(min_dis, dist.columns([new_c])[:, 0])
+        min_dis[centroids] = -1
+    return centroids
+
+
+def _nearest_two(medoid_dis):
+    # index of the nearest medoid, its distance and the distance to the second nearest one
+    near = np.argmin(medoid_dis, axis=1)
+    d_near = medoid_dis[np.arange(len(near)), near]
+    if medoid_dis.shape[1] == 1:
+        return near, d_near, np.full_like(d_near, np.inf)
+    d_second = np.partition(medoid_dis, 1, axis=1)[:, 1]
+    return near, d_near, d_second
+
+
+def assignment_cost(dist, medoids):
+    return dist.columns(list(medoids)).min(axis=1).sum()
+
+
+def fasterpam(dist, medoids, max_iter=100, block_size=256, tolerance=1e-4):
+    """Swap-based k-medoids refinement in the style of FasterPAM.
+
+    Candidates are scanned in blocks of ``block_size`` columns; the best swap
+    of a block is applied as soon as it lowers the total deviation (eager
+    swapping). The swap gains of all (medoid, candidate) pairs of a block
+    come from the nearest / second nearest medoid distances of every point,
+    so memory is ``O(n * block_size)``.
+
+    Returns:
+        tuple: (medoids, total deviation).
+    """
+    medoids = list(medoids)
+    K = len(medoids)
+    n = dist.n
+    medoid_dis = dist.columns(medoids)
+    near, d_near, d_second = _nearest_two(medoid_dis)
+    cost = d_near.sum()
+
+    for _ in range(max_iter):
+        n_swaps = 0
+        for b0 in range(0, n, block_size):
+            cands = np.setdiff1d(np.arange(b0, min(b0 + block_size, n)), medoids)
+            if len(cands) == 0:
+                continue
+            cand_dis = dist.columns(cands)  # [n, n_cands]
+
+            # change of every point's distance if a candidate is added and a medoid other than its nearest removed
+            add_delta = np.minimum(cand_dis - d_near[:, None], 0.)
+            # correction when its nearest medoid is the removed one: it falls back to the candidate or the second nearest
+            remove_delta = np.minimum(cand_dis, d_second[:, None]) - d_near[:, None] - add_delta
+            remove_delta = np.eye(K)[near].T @ remove_delta  # [K, n_cands]
+            delta = remove_delta + add_delta.sum(axis=0)[None, :]
+
+            m, c = np.unravel_index(np.argmin(delta), delta.shape)
+            if delta[m, c] >= -tolerance:
+                continue
+            medoids[m] = int(cands[c])
+            medoid_dis[:, m] = cand_dis[:, c]
+            near, d_near, d_second = _nearest_two(medoid_dis)
+            cost = d_near.sum()
+            n_swaps += 1
+        if n_swaps == 0:
+            break
+    return medoids, cost
+
+
+def clara(dist, K, n_samples=5, sample_size=None, max_iter=100):
+    """CLARA: FasterPAM on random subsets, the medoids with the lowest full cost win.
+
+    Each subset of ``sample_size`` points (default ``max(40 + 2 * K, 200)``)
+    includes the best medoids so far; only ``[sample_size, sample_size]``
+    and ``[n, K]`` distances are ever materialized.
+    """
+    n = dist.n
+    sample_size = min(n, sample_size or max(40 + 2 * K, 200))
+    best_medoids, best_cost = None, np.inf
+    for _ in range(n_samples):
+        sample = np.random.choice(n, sample_size, replace=False)
+        if best_medoids is not None:
+            rest = np.setdiff1d(sample, best_medoids)
+            sample = np.concatenate((best_medoids, rest))[:sample_size]
+        sub_dist = DenseDistances(dist.submatrix(sample))
+        sub_medoids = farthest_point_seeding(sub_dist, K)
+        sub_medoids, _ = fasterpam(sub_dist, sub_medoids, max_iter=max_iter)
+        medoids = sample[sub_medoids]
+        cost = assignment_cost(dist, medoids)
+        if cost < best_cost:
+            best_medoids, best_cost = medoids, cost
+        if sample_size == n:
+            break
+    return best_medoids.tolist(), best_cost
@@ -17,6 +17,12 @@ def command_with_time(command, prefix):
     sys_echo('----> %s time: '%prefix + str(datetime.timedelta(seconds=int(toc-tic))))
 
 
+def get_round_checkpoint(round_work_dir):
+    # best.pth of EarlyStoppingHook if the round kept one, else the last epoch
+    best_path = os.path.join(round_work_dir, 'best.pth')
+    return best_path if os.path.isfile(best_path) else os.path.join(round_work_dir, 'latest.pth')
+
+
 def sys_echo(output_str):
     os.system("echo '%s'"%output_str)
 
@@ -57,3 +63,44 @@ def display_latest_results(output_dir, latest_round, output_txt=None):
     if output_txt is not None:
         with open(output_txt, 'w') as f:
             f.writelines(res_strs)
+
+
+def _time_to_accuracy_records(round_work_dir):
+    path = os.path.join(round_work_dir, 'time_to_accuracy.json')
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        records = [r for r in json.load(f)['records'] if r['metric'] is not None]
+    return records if len(records) > 0 else None
+
+def display_time_to_accuracy(output_dir, latest_round, cold_start_dir=None, output_txt=None):
+    # training time of each round (see TimeToAccuracyHook) and, given the output_dir of a cold start
+    # run with the same labeled sets, how soon the round reaches the final accuracy of the cold start
+    sys_echo('\n')
+    sys_echo('Display time to accuracy:')
+    res_strs = []
+    for i in range(1, latest_round+1):
+        records = _time_to_accuracy_records(os.path.join(output_dir, 'round%d' % i))
+        if records is None:
+            continue
+        best = max(records, key=lambda r: r['metric'])
+        res_str = 'Round %d: %d epochs in %s, final %.4f, best %.4f after %s' % (
+            i, records[-1]['epoch'], str(datetime.timedelta(seconds=int(records[-1]['time']))),
+            records[-1]['metric'], best['metric'], str(datetime.timedelta(seconds=int(best['time']))))
+        cold_records = None if cold_start_dir is None else _time_to_accuracy_records(os.path.join(cold_start_dir, 'round%d' % i))
+        if cold_records is not None:
+            target, cold_time = cold_records[-1]['metric'], cold_records[-1]['time']
+            reached = [r for r in records if r['metric'] >= target]
+            if len(reached) > 0:
+                res_str += ' | cold start %.4f after %s, reached after %s (%.1f%% saved)' % (
+                    target, str(datetime.timedelta(seconds=int(cold_time))),
+                    str(datetime.timedelta(seconds=int(reached[0]['time']))), 100. * (1 - reached[0]['time'] / cold_time))
+            else:
+                res_str += ' | cold start %.4f after %s, not reached' % (target, str(datetime.timedelta(seconds=int(cold_time))))
+        sys_echo(res_str)
+        res_strs.append(res_str + '\n')
+
+    sys_echo('\n')
+    if output_txt is not None:
+        with open(output_txt, 'w') as f:
+            f.writelines(res_strs)
@@ -0,0 +1,54 @@
+import copy
+
+
+def warm_start_config(train_cfg, labeled_file, last_labeled_file, checkpoint, max_epochs=6, lr_step=None,
+                      warmup_iters=0, resume_optimizer=True, resume_ema=True, new_image_repeat=1):
+    """Training config of an AL round warm-started from the previous round.
+
+    The model (and optionally the optimizer state and EMA buffers, see
+    :class:`mmdet.ppal.hooks.WarmStartHook`) starts from ``checkpoint``
+    instead of the pretrained backbone, and trains for ``max_epochs``
+    with ``warmup_iters`` of linear warmup (none if 0).
+
+    Args:
+        train_cfg (mmcv.Config): Cold start training config of the round.
+        labeled_file (str): Labeled set of the round.
+        last_labeled_file (str): Labeled set of the previous round.
+        checkpoint (str): ``latest.pth`` of the previous round.
+        max_epochs (int): Epochs of the round.
+        lr_step (list[int], optional): Epochs of the lr steps, by default
+            the ones of ``train_cfg`` scaled to ``max_epochs``.
+        warmup_iters (int): Linear warmup iterations.
+        resume_optimizer (bool): Carry over the optimizer state.
+        resume_ema (bool): Carry over the EMA buffers of the heads.
+        new_image_repeat (int): Images labeled in this round are repeated
+            this many times per epoch (see ``NewImageRepeatDataset``).
+
+    Returns:
+        mmcv.Config: The warm start config, ``train_cfg`` is not modified.
+    """
+    cfg = copy.deepcopy(train_cfg)
+    cfg.data.train.ann_file = labeled_file
+    if new_image_repeat > 1:
+        cfg.data.train = dict(
+            type='NewImageRepeatDataset', dataset=cfg.data.train, last_ann_file=last_labeled_file,
+            times=new_image_repeat)
+
+    cold_epochs = cfg.runner.max_epochs
+    cfg.runner.max_epochs = max_epochs
+    if cfg.lr_config.get('policy') == 'step':
+        if lr_step is None:
+            steps = cfg.lr_config.step if isinstance(cfg.lr_config.step, (list, tuple)) else [cfg.lr_config.step]
+            lr_step = sorted(set(max(1, step * max_epochs // cold_epochs) for step in steps if step < cold_epochs))
+        cfg.lr_config.step = list(lr_step)
+    if warmup_iters > 0:
+        cfg.lr_config.warmup_iters = warmup_iters
+    else:
+        cfg.lr_config.warmup = None
+
+    cfg.load_from = None
+    cfg.resume_from = None
+    cfg.custom_hooks = list(cfg.get('custom_hooks', [])) + [
+        dict(type='WarmStartHook', checkpoint=checkpoint, resume_optimizer=resume_optimizer, resume_ema=resume_ema,
+             priority='HIGHEST')]
+    return cfg
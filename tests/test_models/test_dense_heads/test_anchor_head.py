@@ -68,3 +68,130 @@ def test_anchor_head_loss():
     onegt_box_loss = sum(one_gt_losses['loss_bbox'])
     assert onegt_cls_loss.item() > 0, 'cls loss should be non-zero'
     assert onegt_box_loss.item() > 0, 'box loss should be non-zero'
+
+
+def test_anchor_head_active_levels():
+    """Tests anchor head only runs on the active levels."""
+    s = 256
+    img_metas = [{
+        'img_shape': (s, s, 3),
+        'scale_factor': 1,
+        'pad_shape': (s, s, 3)
+    }]
+    cfg = mmcv.Config(
+        dict(
+            assigner=dict(
+                type='MaxIoUAssigner',
+                pos_iou_thr=0.5,
+                neg_iou_thr=0.4,
+                min_pos_iou=0,
+                ignore_iof_thr=-1),
+            allowed_border=-1,
+            pos_weight=-1,
+            debug=False))
+    test_cfg = mmcv.Config(
+        dict(
+            nms_pre=1000,
+            min_bbox_size=0,
+            score_thr=0.05,
+            nms=dict(type='nms', iou_threshold=0.5),
+            max_per_img=100))
+    anchor_generator = dict(
+        type='AnchorGenerator',
+        octave_base_scale=3,
+        scales_per_octave=3,
+        ratios=[0.5, 1.0, 2.0],
+        strides=[8, 16, 32, 64, 128])
+    self = AnchorHead(
+        num_classes=4,
+        in_channels=1,
+        anchor_generator=anchor_generator,
+        loss_cls=dict(type='FocalLoss', use_sigmoid=True),
+        train_cfg=cfg,
+        test_cfg=test_cfg,
+        active_levels=[0, 1, 2])
+    assert self.prior_generator.num_levels == 3
+    assert self.prior_generator.strides == [(8, 8), (16, 16), (32, 32)]
+
+    feat = [
+        torch.rand(1, 1, s // 2**(i + 3), s // 2**(i + 3)) for i in range(5)
+    ]
+    # the features of all levels or of the active levels only
+    cls_scores, bbox_preds = self.forward(feat)
+    active_cls_scores, _ = self.forward(feat[:3])
+    assert len(cls_scores) == 3
+    for cls_score, active_cls_score in zip(cls_scores, active_cls_scores):
+        assert torch.equal(cls_score, active_cls_score)
+
+    gt_bboxes = [torch.Tensor([[20., 20., 31., 31.]])]
+    gt_labels = [torch.LongTensor([2])]
+    losses = self.loss(cls_scores, bbox_preds, gt_bboxes, gt_labels,
+                       img_metas)
+    assert len(losses['loss_cls']) == 3
+    assert sum(losses['loss_bbox']).item() > 0
+
+    results = self.get_bboxes(cls_scores, bbox_preds, img_metas)
+    assert len(results) == 1
+
+
+def test_anchor_head_batched_targets():
+    """Tests batched targets are the same as image by image."""
+    s = 128
+    img_metas = [{
+        'img_shape': (s - 8 * i, s, 3),
+        'scale_factor': 1,
+        'pad_shape': (s, s, 3)
+    } for i in range(3)]
+    cfg = mmcv.Config(
+        dict(
+            assigner=dict(
+                type='MaxIoUAssigner',
+                pos_iou_thr=0.5,
+                neg_iou_thr=0.4,
+                min_pos_iou=0,
+                ignore_iof_thr=0.5),
+            allowed_border=0,
+            pos_weight=-1,
+            debug=False))
+    anchor_generator = dict(
+        type='AnchorGenerator',
+        octave_base_scale=3,
+        scales_per_octave=3,
+        ratios=[0.5, 1.0, 2.0],
+        strides=[8, 16, 32])
+    heads = [
+        AnchorHead(
+            num_classes=4,
+            in_channels=1,
+            anchor_generator=anchor_generator,
+            loss_cls=dict(type='FocalLoss', use_sigmoid=True),
+            train_cfg=cfg,
+            batched_targets=batched_targets)
+        for batched_targets in (False, True)
+    ]
+
+    torch.manual_seed(0)
+    featmap_sizes = [(s // stride, s // stride) for stride in (8, 16, 32)]
+    anchor_list, valid_flag_list = heads[0].get_anchors(
+        featmap_sizes, img_metas, device='cpu')
+    gt_bboxes = []
+    for n in (5, 0, 12):
+        xy = torch.rand(n, 2) * (s - 11)
+        gt_bboxes.append(torch.cat([xy, xy + 11], dim=1))
+    gt_labels = [torch.randint(0, 4, (len(bboxes), )) for bboxes in gt_bboxes]
+    gt_bboxes_ignore = [torch.Tensor([[0, 0, 32, 32]]), None, None]
+    targets, batched_targets = [
+        head.get_targets(
+            anchor_list,
+            valid_flag_list,
+            gt_bboxes,
+            img_metas,
+            gt_bboxes_ignore_list=gt_bboxes_ignore,
+            gt_labels_list=gt_labels) for head in heads
+    ]
+    for level_targets, batched_level_targets in zip(targets[:4],
+                                                    batched_targets[:4]):
+        for target, batched_target in zip(level_targets,
+                                          batched_level_targets):
+            assert torch.equal(target, batched_target)
+    assert targets[4:] == batched_targets[4:]
@@ -171,6 +171,48 @@ def test_fpn():
         outs[i].shape[2] == outs[i].shape[3] == s // (2**i)
 
 
+@pytest.mark.parametrize('add_extra_convs',
+                         [False, 'on_input', 'on_lateral', 'on_output'])
+@pytest.mark.parametrize('active_levels', [[0, 1, 2], [1, 3], [4]])
+def test_fpn_active_levels(add_extra_convs, active_levels):
+    """Tests FPN outputs only the active levels, as the full FPN."""
+    s = 64
+    in_channels = [8, 16, 32, 64]
+    feat_sizes = [s // 2**i for i in range(4)]  # [64, 32, 16, 8]
+    feats = [
+        torch.rand(1, in_channels[i], feat_sizes[i], feat_sizes[i])
+        for i in range(len(in_channels))
+    ]
+    cfg = dict(
+        in_channels=in_channels,
+        out_channels=8,
+        start_level=1,
+        add_extra_convs=add_extra_convs,
+        num_outs=5)
+    full_model = FPN(**cfg)
+    fpn_model = FPN(active_levels=active_levels, **cfg)
+    missing, _ = fpn_model.load_state_dict(
+        full_model.state_dict(), strict=False)
+    assert len(missing) == 0
+
+    outs = fpn_model(feats)
+    full_outs = full_model(feats)
+    assert len(outs) == len(active_levels)
+    for out, i in zip(outs, active_levels):
+        assert torch.equal(out, full_outs[i])
+
+    # the convs of the levels below and above the active ones are dropped
+    lowest, highest = active_levels[0], active_levels[-1]
+    for i, lateral_conv in enumerate(fpn_model.lateral_convs[:-1]):
+        assert (lateral_conv is None) == (i < lowest)
+    for i, fpn_conv in enumerate(fpn_model.fpn_convs):
+        if i > highest or (i < 2 and i not in active_levels):
+            assert fpn_conv is None
+
+    with pytest.raises(AssertionError):
+        FPN(active_levels=[5], **cfg)
+
+
 def test_channel_mapper():
     """Tests ChannelMapper."""
     s = 64
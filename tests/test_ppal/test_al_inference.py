@@ -0,0 +1,85 @@
+import os
+from os.path import dirname, join
+
+import mmcv
+import numpy as np
+import pytest
+import torch
+from mmcv.parallel import collate
+
+from mmdet.apis import inference_detector, init_detector
+from mmdet.datasets.pipelines import Compose
+from mmdet.ppal.datasets import *  # noqa: F401,F403
+from mmdet.ppal.models import *  # noqa: F401,F403
+from mmdet.ppal.models.utils import unpack_det_info
+
+CONFIG_DIR = join(dirname(__file__), '..', '..', 'configs', 'coco_active_learning')
+AL_INFERENCE_CONFIGS = sorted(
+    join('al_inference', name) for name in os.listdir(join(CONFIG_DIR, 'al_inference')) if name.endswith('.py'))
+
+
+def tiny_al_detector(config='al_inference/retinanet_uncertainty.py'):
+    """An untrained ResNet-18 / 32 channel detector of an AL config, on the cpu."""
+    cfg = mmcv.Config.fromfile(join(CONFIG_DIR, config))
+    cfg.model.backbone.update(depth=18, init_cfg=None)
+    cfg.model.neck.update(in_channels=[64, 128, 256, 512], out_channels=32)
+    cfg.model.bbox_head.update(in_channels=32, feat_channels=32)
+    # keep the low scores of the untrained head
+    cfg.model.test_cfg.score_thr = 0.
+    return init_detector(cfg, device='cpu')
+
+
+def test_al_test_pipeline_img_id():
+    cfg = mmcv.Config.fromfile(join(CONFIG_DIR, 'al_inference/retinanet_uncertainty.py'))
+    assert 'img_id' not in cfg.test_pipeline[1]['transforms'][-1].get('meta_keys', ())
+    pipeline = cfg.data.test.pipeline
+    pipeline[0] = dict(type='LoadImageFromWebcam')
+    data = Compose(pipeline)(dict(img=np.zeros((128, 128, 3), dtype=np.uint8)))
+    # images without a dataset get the default id
+    assert data['img_metas'][0].data['img_id'] == -1
+    data = Compose(pipeline)(dict(img=np.zeros((128, 128, 3), dtype=np.uint8), img_id=12))
+    assert data['img_metas'][0].data['img_id'] == 12
+
+
+@pytest.mark.parametrize('n_images', [1, 3])
+def test_inference_detector_al_config(n_images):
+    model = tiny_al_detector()
+    rng = np.random.RandomState(0)
+    imgs = [rng.randint(0, 256, (128, 128, 3)).astype(np.uint8) for _ in range(n_images)]
+    results = inference_detector(model, imgs if n_images > 1 else imgs[0])
+    if n_images == 1:
+        results = [results]
+    assert len(results) == n_images
+    for result in results:
+        assert len(result) == model.bbox_head.num_classes
+        # boxes, scores, then the class and box uncertainties of ALRetinaNet
+        assert all(len(dets) > 0 and dets.shape[1] == 7 for dets in result)
+
+
+@pytest.mark.parametrize('config', AL_INFERENCE_CONFIGS)
+def test_al_inference_configs_keep_img_id(config):
+    pipeline = mmcv.Config.fromfile(join(CONFIG_DIR, config)).data.test.pipeline
+    assert 'DefaultImageId' in [step['type'] for step in pipeline]
+    assert 'img_id' in pipeline[-1]['transforms'][-1]['meta_keys']
+
+
+def test_puncta_center_fused_img_id():
+    cfg = mmcv.Config.fromfile(join(CONFIG_DIR, 'al_inference/puncta_center_fused.py'))
+    cfg.model.backbone.update(depth=18, init_cfg=None)
+    cfg.model.neck.update(in_channels=[64, 128, 256, 512], out_channels=32)
+    cfg.model.bbox_head.update(in_channel=32, feat_channel=8, feat_dim=32)
+    cfg.model.test_cfg.score_thr = 0.
+    model = init_detector(cfg, device='cpu')
+
+    pipeline = cfg.data.test.pipeline
+    pipeline[0] = dict(type='LoadImageFromWebcam')
+    img = np.random.RandomState(0).randint(0, 256, (128, 128, 3)).astype(np.uint8)
+    # ALPunctaDataset.pre_pipeline sets the id, as for 228.bmp with id 1
+    data = collate([Compose(pipeline)(dict(img=img, img_id=1))], samples_per_gpu=1)
+    data['img_metas'] = [img_metas.data[0] for img_metas in data['img_metas']]
+    data['img'] = [img.data[0] for img in data['img']]
+    with torch.no_grad():
+        model(return_loss=False, rescale=True, **data)
+    head = model.bbox_head
+    image_ids = unpack_det_info(torch.stack(head.det_info), head.max_det, head.feat_dim)[0]
+    assert image_ids.reshape(-1).tolist() == [1]
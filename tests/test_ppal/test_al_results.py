@@ -0,0 +1,142 @@
+import json
+import os
+
+import numpy as np
+
+from mmdet.ppal.datasets import ALPunctaDataset
+from mmdet.ppal.models.utils import save_det_feat_cache
+from mmdet.ppal.sampler import DCUSSampler, DiversitySampler
+from mmdet.ppal.sampler.al_sampler_base import BaseALSampler
+from mmdet.ppal.utils.al_results import (al_results2json, dump_al_results,
+                                         load_al_results)
+
+
+def _fake_dataset(n_images):
+    dataset = object.__new__(ALPunctaDataset)
+    dataset.data_infos = [dict(id=i) for i in range(n_images)]
+    dataset.img_ids = [10 + i for i in range(n_images)]
+    dataset.cat_ids = [1]
+    return dataset
+
+
+def _fake_results(n_images, seed=0):
+    rng = np.random.RandomState(seed)
+    results = []
+    for i in range(n_images):
+        n = 0 if i == 1 else rng.randint(1, 20)
+        xy = rng.uniform(0, 200, (n, 2))
+        wh = rng.uniform(1, 60, (n, 2))
+        dets = np.concatenate((xy, xy + wh, rng.uniform(0, 1, (n, 3))), axis=1)
+        results.append([dets.astype(np.float32)])
+    return results
+
+
+def test_det2columns_matches_det2json():
+    dataset = _fake_dataset(5)
+    results = _fake_results(5)
+    columns = dataset._det2columns(results)
+    assert al_results2json(columns) == dataset._det2json(results)
+
+
+def test_al_results_json_npz_round_trip(tmpdir):
+    dataset = _fake_dataset(5)
+    columns = dataset._det2columns(_fake_results(5))
+    json_path = os.path.join(str(tmpdir), 'res.bbox.json')
+    npz_path = os.path.join(str(tmpdir), 'res.bbox.npz')
+    dump_al_results(json_path, columns)
+    dump_al_results(npz_path, columns)
+    from_json = load_al_results(json_path)
+    from_npz = load_al_results(npz_path)
+    for name, col in columns.items():
+        np.testing.assert_array_equal(from_npz[name], col)
+        np.testing.assert_array_equal(from_json[name], col)
+
+    dump_al_results(json_path, dataset._det2columns([[np.zeros((0, 7))]] * 5))
+    assert len(load_al_results(json_path)['image_id']) == 0
+
+
+def test_dcus_sampler_json_and_npz_agree(tmpdir):
+    n_images = 30
+    dataset = _fake_dataset(n_images)
+    columns = dataset._det2columns(_fake_results(n_images, seed=1))
+
+    oracle = dict(
+        images=[
+            dict(id=10 + i, file_name='%d.bmp' % i, width=256, height=256)
+            for i in range(n_images)
+        ],
+        annotations=[
+            dict(id=1, image_id=10, category_id=1, bbox=[0, 0, 20, 20])
+        ],
+        categories=[dict(id=1, name='puncta')])
+    labeled = dict(images=oracle['images'][:5], annotations=[])
+    paths = {
+        name: os.path.join(str(tmpdir), name)
+        for name in ('oracle.json', 'labeled.json', 'res.bbox.json',
+                     'res.bbox.npz')
+    }
+    with open(paths['oracle.json'], 'w') as f:
+        json.dump(oracle, f)
+    with open(paths['labeled.json'], 'w') as f:
+        json.dump(labeled, f)
+    dump_al_results(paths['res.bbox.json'], columns)
+    dump_al_results(paths['res.bbox.npz'], columns)
+
+    sampler = DCUSSampler(
+        8,
+        paths['oracle.json'],
+        score_thr=0.1,
+        class_weight_ub=0.2,
+        class_weight_alpha=0.3,
+        dataset_type='coco')
+    sampled_json, rest_json = sampler.al_acquisition(paths['res.bbox.json'],
+                                                     paths['labeled.json'])
+    sampled_npz, rest_npz = sampler.al_acquisition(paths['res.bbox.npz'],
+                                                   paths['labeled.json'])
+    assert sampled_json == sampled_npz and rest_json == rest_npz
+    assert len(sampled_json) == 8
+    assert len(sampled_json) + len(rest_json) == n_images - 5
+    assert not set(sampled_json) & {x['id'] for x in labeled['images']}
+
+
+def test_top_k_images_matches_stable_sort():
+    sampler = object.__new__(BaseALSampler)
+    rng = np.random.RandomState(2)
+    # many ties, as for images without any valid detection
+    image_scores = rng.randint(0, 5, 200).astype(np.float64)
+    candidates = np.sort(rng.choice(200, 150, replace=False))
+    for k in (0, 1, 40, 150, 300):
+        top, rest = sampler.top_k_images(image_scores, candidates, k)
+        order = np.argsort(-image_scores[candidates], kind='stable')
+        np.testing.assert_array_equal(top, candidates[order[:k]])
+        np.testing.assert_array_equal(rest, np.sort(candidates[order[k:]]))
+
+
+def test_diversity_sampler_blockwise_cache(tmpdir):
+    n_images, max_det, feat_dim = 30, 6, 4
+    rng = np.random.RandomState(0)
+    oracle = dict(
+        images=[dict(id=10 + i, width=128, height=128) for i in range(n_images)],
+        annotations=[dict(id=i + 1, image_id=10 + i, category_id=1, bbox=[0, 0, 11, 11], area=121, iscrowd=0)
+                     for i in range(n_images)],
+        categories=[dict(id=1, name='puncta')])
+    paths = {name: os.path.join(str(tmpdir), name) for name in ('oracle.json', 'labeled.json', 'feats.npz')}
+    with open(paths['oracle.json'], 'w') as f:
+        json.dump(oracle, f)
+    with open(paths['labeled.json'], 'w') as f:
+        json.dump(dict(images=oracle['images'][:5], annotations=[]), f)
+    # inference runs on the unlabeled pool only
+    n_pool = n_images - 5
+    save_det_feat_cache(paths['feats.npz'], np.arange(15, 10 + n_images), np.zeros((n_pool, max_det)),
+                        rng.uniform(0.1, 1, (n_pool, max_det)), rng.randn(n_pool, max_det, feat_dim))
+
+    for fused_inference in (False, True):
+        sampler = DiversitySampler(3, paths['oracle.json'], 'coco', clustering='fasterpam',
+                                   fused_inference=fused_inference)
+        image_dis_path = sampler.image_dis_path(str(tmpdir))
+        # the dense matrix, or the pool detections when distances are computed blockwise
+        assert os.path.basename(image_dis_path) == ('image_dis_cache.npz' if fused_inference else 'image_dis.npy')
+        sampler.image_dis_from_cache(paths['feats.npz'], paths['oracle.json'], image_dis_path)
+        sampled, rest = sampler.al_acquisition(image_dis_path, paths['labeled.json'])
+        assert 0 < len(sampled) <= 3 and len(sampled) + len(rest) == n_pool
+        assert not set(sampled) & set(range(10, 15))
@@ -0,0 +1,102 @@
+import os
+
+import cv2
+import mmcv
+import numpy as np
+import pytest
+import torch
+
+from mmdet.ppal.models import BatchAugment
+
+NO_NORM = dict(mean=[0., 0., 0.], std=[1., 1., 1.], to_rgb=False)
+
+
+def _inputs(n_images=2, h=96, w=128):
+    rng = np.random.RandomState(0)
+    imgs = rng.randint(0, 256, (n_images, h, w, 3)).astype(np.uint8)
+    # smooth images, so bilinear sampling differences stay small
+    imgs = np.stack([cv2.GaussianBlur(img, (5, 5), 2) for img in imgs])
+    img_metas = [dict(img_shape=(h, w, 3)) for _ in range(n_images)]
+    gt_bboxes = [
+        torch.tensor([[10., 20., 40., 50.], [60., 5., 90., 30.]]),
+        torch.tensor([[5., 6., 70., 80.]])
+    ][:n_images]
+    return imgs, torch.from_numpy(imgs).permute(0, 3, 1, 2).contiguous(), img_metas, gt_bboxes
+
+
+def _to_numpy(img):
+    return img.permute(0, 2, 3, 1).numpy()
+
+
+def _rotate_bboxes(bboxes, M):
+    corners = bboxes[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+    rotated = np.stack([cv2.transform(c[None], M)[0] for c in corners])
+    return np.concatenate([rotated.min(1), rotated.max(1)], axis=1)
+
+
+def test_batch_augment_flip_rotate():
+    imgs, img, img_metas, gt_bboxes = _inputs()
+    aug = BatchAugment(NO_NORM)
+    flip, angle = torch.tensor([True, True]), torch.tensor([0., 12.5])
+    out, img_metas, out_bboxes = aug.transform(img, img_metas, gt_bboxes, flip, angle)
+    out = _to_numpy(out)
+
+    # flip alone moves whole pixels
+    np.testing.assert_allclose(out[0], imgs[0, :, ::-1], atol=1e-3)
+    np.testing.assert_allclose(out_bboxes[0].numpy(), [[88., 20., 118., 50.], [38., 5., 68., 30.]])
+    assert img_metas[0]['flip'] and img_metas[0]['flip_direction'] == 'horizontal'
+
+    # flip then rotate, as RandomFlip and RandomRotate in the pipeline
+    M = cv2.getRotationMatrix2D((128 / 2, 96 / 2), 12.5, 1)
+    ref = cv2.warpAffine(np.ascontiguousarray(imgs[1, :, ::-1]).astype(np.float32), M, (128, 96))
+    np.testing.assert_allclose(out[1], ref, atol=1e-2)
+    flipped = gt_bboxes[1].numpy().copy()
+    flipped[:, [0, 2]] = 128 - flipped[:, [2, 0]]
+    np.testing.assert_allclose(out_bboxes[1].numpy(), _rotate_bboxes(flipped, M), atol=1e-3)
+
+
+@pytest.mark.parametrize('params', [dict(), dict(brightness=0., contrast=0.5, saturation=1.5, hue=0.4)])
+def test_batch_augment_color_jitter(params):
+    imgs, img, img_metas, gt_bboxes = _inputs()
+    aug = BatchAugment(NO_NORM, color_jitter=params)
+    out, _, out_bboxes = aug.transform(img, img_metas, gt_bboxes, torch.tensor([False, False]), torch.zeros(2))
+    assert out_bboxes is gt_bboxes
+
+    cfg = aug.color_jitter
+    for img_out, img_in in zip(_to_numpy(out), imgs):
+        h, s, v = cv2.split(cv2.cvtColor(img_in, cv2.COLOR_BGR2HSV))
+        v = cv2.multiply(cv2.add(v, int(cfg['brightness'] * 255)), 1 + cfg['contrast'])
+        s = cv2.multiply(s, 1 + cfg['saturation'])
+        h = (h + int(cfg['hue'] * 180)) % 180
+        ref = cv2.cvtColor(cv2.merge([h, s, v]), cv2.COLOR_HSV2BGR).astype(np.float32)
+        # cv2 quantizes HSV to uint8 (hue in steps of 2 degrees)
+        diff = np.abs(img_out - ref)
+        assert diff.max() < 8 and diff.mean() < 1
+
+
+def test_batch_augment_normalize_padding():
+    imgs, img, img_metas, gt_bboxes = _inputs()
+    img_metas[1]['img_shape'] = (64, 100, 3)
+    img_norm_cfg = dict(mean=[123.675, 116.28, 103.53], std=[58.395, 57.12, 57.375], to_rgb=True)
+    out, img_metas, _ = BatchAugment(img_norm_cfg).transform(
+        img, img_metas, gt_bboxes, torch.tensor([False, False]), torch.zeros(2))
+    out = _to_numpy(out)
+
+    ref = (imgs[..., ::-1] - np.array(img_norm_cfg['mean'])) / np.array(img_norm_cfg['std'])
+    np.testing.assert_allclose(out[0], ref[0], atol=1e-4)
+    np.testing.assert_allclose(out[1, :64, :100], ref[1, :64, :100], atol=1e-4)
+    assert (out[1, 64:] == 0).all() and (out[1, :, 100:] == 0).all()
+    assert img_metas[1]['img_norm_cfg']['to_rgb'] and not img_metas[1]['flip']
+
+
+def test_batch_aug_config():
+    config_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'configs', 'coco_active_learning')
+    cfg = mmcv.Config.fromfile(os.path.join(config_dir, 'al_train/retinanet_26e_batch_aug.py'))
+    assert cfg.model.type == 'BatchAugRetinaNet'
+    assert cfg.model.batch_augments.img_norm_cfg == cfg.img_norm_cfg
+    train_steps = [step['type'] for step in cfg.data.train.pipeline]
+    assert 'Normalize' not in train_steps and 'RandomFlip' not in train_steps
+    # the other configs on the same base stay per-image
+    for config in ('al_train/retinanet_26e.py', 'al_inference/retinanet_fused.py'):
+        cfg = mmcv.Config.fromfile(os.path.join(config_dir, config))
+        assert 'batch_augments' not in cfg.model
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+import torch
+from mmcv import ConfigDict
+
+from mmdet.ppal.models import (RetinaHeadFeat, RetinaHeadUncertainty,
+                               RetinaHeadUncertaintyFeat)
+
+TEST_CFG = ConfigDict(
+    nms_pre=1000,
+    min_bbox_size=0,
+    score_thr=0.05,
+    nms=dict(type='nms', iou_threshold=0.5),
+    max_per_img=50)
+
+
+def _inputs(n_images, in_channels=8, img_size=128):
+    torch.manual_seed(0)
+    feats = [
+        torch.randn(n_images, in_channels, img_size // s, img_size // s)
+        for s in (8, 16, 32, 64, 128)
+    ]
+    img_metas = [
+        dict(
+            img_id=100 + i,
+            img_shape=(img_size, img_size, 3),
+            scale_factor=np.array([0.5, 0.5, 0.5, 0.5], dtype=np.float32))
+        for i in range(n_images)
+    ]
+    return feats, img_metas
+
+
+def _assert_close(per_image, batched):
+    # equal up to float rounding, the batched NMS works on offset coordinates
+    assert len(per_image) == len(batched)
+    for res_a, res_b in zip(per_image, batched):
+        for a, b in zip(res_a, res_b):
+            assert a.shape == b.shape and torch.allclose(a.float(), b.float(), rtol=1e-5, atol=1e-4)
+
+
+def test_uncertainty_head_batched_test():
+    head = RetinaHeadUncertainty(
+        num_classes=2,
+        in_channels=8,
+        feat_channels=8,
+        stacked_convs=1,
+        test_cfg=TEST_CFG)
+    head.init_weights()
+    feats, img_metas = _inputs(6)
+    with torch.no_grad():
+        head.batched_test = False
+        per_image = head.simple_test(feats, img_metas, rescale=True)
+        head.batched_test = True
+        batched = head.simple_test(feats, img_metas, rescale=True)
+    _assert_close(per_image, batched)
+
+
+@pytest.mark.parametrize('head_type',
+                         [RetinaHeadFeat, RetinaHeadUncertaintyFeat])
+def test_feat_heads_batched_test(head_type, tmpdir):
+    n_images = 6
+    head = head_type(
+        total_images=2 * n_images,  # the pool is not complete after a batch
+        max_det=20,
+        feat_dim=8,
+        output_path=str(tmpdir.join('dis.npy')),
+        num_classes=1,
+        in_channels=8,
+        feat_channels=8,
+        stacked_convs=1,
+        test_cfg=TEST_CFG)
+    head.init_weights()
+    feats, img_metas = _inputs(n_images)
+    outputs, queues = [], []
+    with torch.no_grad():
+        for batched_test in (False, True):
+            head.batched_test = batched_test
+            head.reset_queue(2 * n_images)
+            outputs.append(head.simple_test_bboxes(feats, img_metas, rescale=True))
+            queues.append([
+                head.image_id_queue.clone(), head.det_label_queue.clone(),
+                head.det_score_queue.clone(), head.det_feat_queue.clone()
+            ])
+    _assert_close(*outputs)
+    for a, b in zip(*queues):
+        assert a.shape == b.shape and torch.allclose(a.float(), b.float(), rtol=1e-5, atol=1e-4)
+    assert queues[1][0][:n_images].reshape(-1).tolist() == list(range(100, 106))
+
+
+def test_image_id_needs_al_test_pipeline():
+    # file names of the puncta sets are not the image ids
+    assert RetinaHeadFeat._image_id(dict(img_id=1, filename='train/228.bmp')) == 1
+    with pytest.raises(KeyError, match='al_test_pipeline'):
+        RetinaHeadFeat._image_id(dict(filename='train/228.bmp'))
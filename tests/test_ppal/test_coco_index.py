@@ -0,0 +1,177 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from mmdet.ppal.datasets import ALPunctaDataset
+from mmdet.ppal.utils.coco_index import (CocoIndex, convert_to_subset,
+                                         load_coco_index, materialize_json)
+
+
+def _coco_data():
+    images = [
+        dict(id=7 + 3 * i, file_name='%d.bmp' % i, width=128, height=96, license=1)
+        for i in range(6)
+    ]
+    annotations = [
+        dict(id=1, image_id=10, category_id=1, bbox=[0, 0, 20, 20], area=400, iscrowd=0,
+             segmentation=[[0, 0, 20, 0, 20, 20]]),
+        dict(id=2, image_id=7, category_id=1, bbox=[5.5, 6, 10, 0.5], area=5, iscrowd=0),
+        dict(id=3, image_id=10, category_id=2, bbox=[30, 30, 10, 10], area=100, iscrowd=0),
+        dict(id=4, image_id=7, category_id=1, bbox=[120, 90, 30, 30], area=900, iscrowd=1),
+        dict(id=5, image_id=10, category_id=1, bbox=[200, 0, 10, 10], area=100, iscrowd=0),
+        dict(id=6, image_id=19, category_id=1, bbox=[1, 2, 3, 4], area=12, iscrowd=0, ignore=True),
+        dict(id=7, image_id=7, category_id=1, bbox=[40, 50, 8, 9], area=72, iscrowd=0),
+        dict(id=8, image_id=99, category_id=1, bbox=[0, 0, 1, 1], area=1, iscrowd=0),
+    ]
+    categories = [dict(id=1, name='puncta'), dict(id=2, name='other')]
+    return dict(images=images, annotations=annotations, categories=categories)
+
+
+def test_coco_index_columns_and_cache(tmpdir):
+    data = _coco_data()
+    ann_file = os.path.join(str(tmpdir), 'oracle.json')
+    with open(ann_file, 'w') as f:
+        json.dump(data, f)
+
+    index = load_coco_index(ann_file)
+    assert load_coco_index(ann_file) is index
+    assert os.path.isfile(ann_file + '.index.npz')
+    # annotations grouped by image in json order, the one of an unknown image dropped
+    assert index.img_ids.tolist() == [7, 10, 13, 16, 19, 22]
+    assert index.ann_offsets.tolist() == [0, 3, 6, 6, 6, 7, 7]
+    assert index.ann_ids.tolist() == [2, 4, 7, 1, 3, 5, 6]
+    assert index.ann_iscrowd.tolist() == [False, True, False] + [False] * 4
+    assert index.ann_ignore.tolist() == [False] * 6 + [True]
+    assert index.image_inds([22, 10]).tolist() == [5, 1]
+    assert index.ann_inds([4, 1]).tolist() == [6, 3, 4, 5]
+    assert index.image_dicts([1]) == [data['images'][1]]
+    assert index.ann_dicts([3]) == [data['annotations'][0]]
+    assert index.cat_ids(('puncta', )) == [1]
+
+    cached = CocoIndex.load(ann_file + '.index.npz')
+    for k in CocoIndex.ARRAYS:
+        np.testing.assert_array_equal(getattr(cached, k), getattr(index, k))
+
+    # the json stays the source of truth
+    data['images'] = data['images'][:2]
+    with open(ann_file, 'w') as f:
+        json.dump(data, f)
+    os.utime(ann_file, ns=(0, 0))
+    assert load_coco_index(ann_file).img_ids.tolist() == [7, 10]
+
+
+
+@pytest.mark.parametrize('img_ids', [[7, 10, 13], [7, 10 ** 9, 13]])
+def test_image_inds_unknown_ids(img_ids):
+    # dense ids use the lookup table, sparse ones the binary search
+    index = CocoIndex.from_json(dict(images=[dict(id=i) for i in img_ids]))
+    assert index.image_inds(img_ids[::-1]).tolist() == [2, 1, 0]
+    assert index.image_inds(13) == 2
+    for unknown in ([8], [7, 14], [-1], [10 ** 10], [0]):
+        with pytest.raises(KeyError):
+            index.image_inds(unknown)
+
+def test_coco_index_dump_json(tmpdir):
+    data = _coco_data()
+    index = CocoIndex.from_json(data)
+    img_inds = index.image_inds([19, 10, 13])
+    ann_inds = index.ann_inds(img_inds, index.ann_category_ids == 1)
+    out_path = os.path.join(str(tmpdir), 'labeled.json')
+    index.dump_json(out_path, img_inds, ann_inds)
+
+    by_id = {img['id']: img for img in data['images']}
+    expected = dict(
+        images=[by_id[i] for i in (19, 10, 13)],
+        annotations=[data['annotations'][i] for i in (5, 0, 4)],
+        categories=data['categories'])
+    with open(out_path) as f:
+        assert f.read() == json.dumps(expected)
+    # the written file is already indexed
+    written = load_coco_index(out_path)
+    assert written.img_ids.tolist() == [19, 10, 13]
+    assert written.ann_ids.tolist() == [6, 1, 5]
+    assert written.ann_dicts(range(3)) == expected['annotations']
+
+    index.dump_json(out_path, img_inds[:1])
+    with open(out_path) as f:
+        assert json.load(f) == dict(images=[by_id[19]], categories=data['categories'])
+
+
+def test_coco_index_subset_files(tmpdir):
+    data = _coco_data()
+    oracle = os.path.join(str(tmpdir), 'oracle.json')
+    with open(oracle, 'w') as f:
+        json.dump(data, f)
+    index = load_coco_index(oracle)
+    img_inds = index.image_inds([10, 19])
+
+    for with_annotations in (True, False):
+        ann_inds = index.ann_inds(img_inds) if with_annotations else None
+        subset_path = os.path.join(str(tmpdir), 'labeled_%d.subset.npz' % with_annotations)
+        json_path = os.path.join(str(tmpdir), 'labeled_%d.json' % with_annotations)
+        index.dump(subset_path, img_inds, ann_inds)
+        index.dump(json_path, img_inds, ann_inds)
+
+        subset = load_coco_index(subset_path)
+        assert subset.img_ids.tolist() == [10, 19]
+        assert subset.ann_ids.tolist() == ([1, 3, 5, 6] if with_annotations else [])
+        # a subset of a subset file is written against the oracle json
+        assert subset.source == os.path.abspath(oracle)
+        assert subset.source_img_rows.tolist() == img_inds.tolist()
+
+        materialized = os.path.join(str(tmpdir), 'materialized.json')
+        materialize_json(subset_path, materialized)
+        with open(materialized) as f, open(json_path) as g:
+            assert f.read() == g.read()
+
+        convert_to_subset(json_path, subset_path + '.converted.subset.npz', oracle, with_annotations)
+        with np.load(subset_path) as a, np.load(subset_path + '.converted.subset.npz') as b:
+            assert sorted(a.keys()) == sorted(b.keys())
+            for k in a.keys():
+                np.testing.assert_array_equal(a[k], b[k])
+
+
+def test_dataset_ann_info_from_index(tmpdir):
+    data = _coco_data()
+    ann_file = os.path.join(str(tmpdir), 'train.json')
+    with open(ann_file, 'w') as f:
+        json.dump(data, f)
+
+    dataset = object.__new__(ALPunctaDataset)
+    dataset.ann_file = ann_file
+    dataset.labeled_mask = None
+    dataset.data_infos = dataset.load_annotations(ann_file)
+    assert dataset.img_ids == [img['id'] for img in data['images']]
+    assert dataset.data_infos[0]['filename'] == '0.bmp'
+
+    index = dataset.coco_index
+    for idx, img_info in enumerate(dataset.data_infos):
+        rows = range(index.ann_offsets[idx], index.ann_offsets[idx + 1])
+        expected = dataset._parse_ann_info(img_info, index.ann_dicts(rows))
+        ann = dataset.get_ann_info(idx)
+        assert sorted(ann.keys()) == sorted(expected.keys())
+        for k in ('bboxes', 'labels', 'bboxes_ignore'):
+            assert ann[k].dtype == expected[k].dtype
+            np.testing.assert_array_equal(ann[k], expected[k])
+        assert ann['masks'] == expected['masks'] and ann['seg_map'] == expected['seg_map']
+        assert dataset.get_cat_ids(idx) == [index.ann_category_ids[i] for i in rows]
+
+    dataset.filter_empty_gt = True
+    assert dataset._filter_imgs() == [0, 1, 4]
+    assert dataset.img_ids == [7, 10, 19]
+
+
+def test_dataset_labeled_mask(tmpdir):
+    data = _coco_data()
+    ann_file = os.path.join(str(tmpdir), 'oracle.json')
+    with open(ann_file, 'w') as f:
+        json.dump(data, f)
+
+    dataset = object.__new__(ALPunctaDataset)
+    dataset.labeled_mask = np.array([False, True, False, False, True, False])
+    dataset.data_infos = dataset.load_annotations(ann_file)
+    assert dataset.img_ids == [10, 19]
+    assert dataset.get_ann_info(0)['bboxes'].shape == (1, 4)
+    assert dataset.coco.getAnnIds(imgIds=[10]) == [1, 3, 5]
@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+import pytest
+
+from mmdet.ppal.datasets import ColorJitter, RandomRotate
+
+
+def _rotate_bboxes_loop(bboxes, M):
+    new_bboxes = []
+    for bbox in bboxes:
+        points = np.array([
+            [bbox[0], bbox[1]],
+            [bbox[2], bbox[1]],
+            [bbox[2], bbox[3]],
+            [bbox[0], bbox[3]],
+        ])
+        rotated_points = cv2.transform(np.array([points]), M)[0]
+        new_bboxes.append([
+            np.min(rotated_points[:, 0]),
+            np.min(rotated_points[:, 1]),
+            np.max(rotated_points[:, 0]),
+            np.max(rotated_points[:, 1])
+        ])
+    return np.array(new_bboxes, dtype=np.float32)
+
+
+def _color_jitter_split(img, brightness, contrast, saturation, hue):
+    h, s, v = cv2.split(cv2.cvtColor(img, cv2.COLOR_BGR2HSV))
+    v = cv2.multiply(cv2.add(v, int(brightness * 255)), 1 + contrast)
+    s = cv2.multiply(s, 1 + saturation)
+    h = (h + int(hue * 180)) % 180
+    return cv2.cvtColor(cv2.merge([h, s, v]), cv2.COLOR_HSV2BGR)
+
+
+def test_random_rotate_bboxes():
+    rng = np.random.RandomState(0)
+    img = rng.randint(0, 256, (120, 160, 3)).astype(np.uint8)
+    bboxes = rng.uniform(0, 100, (13, 4)).astype(np.float32)
+    bboxes[:, 2:] += bboxes[:, :2]
+
+    np.random.seed(1)
+    results = RandomRotate(level=30, prob=1.)(dict(img=img, gt_bboxes=bboxes))
+    np.random.seed(1)
+    np.random.rand()
+    angle = np.random.uniform(-30, 30)
+    M = cv2.getRotationMatrix2D((160 / 2, 120 / 2), angle, 1)
+
+    assert results['gt_bboxes'].dtype == np.float32
+    # cv2.transform rounds through float32, so only the last bit may differ
+    np.testing.assert_allclose(results['gt_bboxes'], _rotate_bboxes_loop(bboxes, M), rtol=0, atol=1e-3)
+    np.testing.assert_array_equal(results['img'], cv2.warpAffine(img, M, (160, 120)))
+
+    results = RandomRotate(prob=1.)(dict(img=img, gt_bboxes=np.zeros((0, 4), dtype=np.float32)))
+    assert results['gt_bboxes'].shape == (0, 4)
+
+
+@pytest.mark.parametrize('params', [(0.2, 0.2, 0.2, 0.2), (0., 0.5, 1.5, 0.9), (0.7, 0., 0., 0.)])
+def test_color_jitter_lut(params):
+    rng = np.random.RandomState(0)
+    img = rng.randint(0, 256, (64, 96, 3)).astype(np.uint8)
+    ref = _color_jitter_split(img, *params)
+    out = ColorJitter(*params)(dict(img=img.copy()))['img']
+    assert out.dtype == np.uint8
+    np.testing.assert_array_equal(out, ref)
+
+    img = img.astype(np.float32) / 255
+    out = ColorJitter(*params)(dict(img=img.copy()))['img']
+    np.testing.assert_array_equal(out, _color_jitter_split(img, *params))
@@ -0,0 +1,166 @@
+import contextlib
+import io
+import json
+import os
+
+import numpy as np
+import pytest
+from pycocotools.coco import COCO
+from pycocotools.cocoeval import COCOeval
+
+from mmdet.ppal.datasets import ALPunctaDataset
+from mmdet.ppal.utils.fast_eval import centroid_match, coco_bbox_ap
+
+
+def _random_coco(seed, n_images=8):
+    rng = np.random.RandomState(seed)
+    images = [dict(id=3 * i + 1, file_name='%d.bmp' % i, width=128, height=128) for i in range(n_images)]
+    annotations, dets = [], []
+    for img in images:
+        gts = []
+        for _ in range(rng.randint(0, 8)):
+            x, y = rng.uniform(0, 117, 2)
+            ann = dict(id=len(annotations) + 1, image_id=img['id'], category_id=1, bbox=[x, y, 11., 11.], area=121.,
+                       iscrowd=int(rng.rand() < 0.1))
+            if rng.rand() < 0.1:
+                ann['ignore'] = 1
+            annotations.append(ann)
+            gts.append(ann)
+        for _ in range(rng.randint(0, 15)):
+            if gts and rng.rand() < 0.7:
+                x, y = np.array(gts[rng.randint(len(gts))]['bbox'][:2]) + rng.normal(0, 2, 2)
+            else:
+                x, y = rng.uniform(0, 117, 2)
+            # repeated scores exercise the tie order of COCOeval
+            score = float(np.float32(rng.choice([0.5, 0.7, rng.rand()])))
+            dets.append(dict(image_id=img['id'], category_id=1, bbox=[x, y, 11 + rng.normal(0, 1), 11.], score=score))
+    return dict(images=images, annotations=annotations, categories=[dict(id=1, name='puncta')]), dets
+
+
+def _cocoeval_precision(data, dets, max_dets):
+    coco_gt = COCO()
+    coco_gt.dataset = data
+    with contextlib.redirect_stdout(io.StringIO()):
+        coco_gt.createIndex()
+        coco_eval = COCOeval(coco_gt, coco_gt.loadRes(dets), 'bbox')
+        coco_eval.params.maxDets = [1, 2, max_dets]
+        coco_eval.evaluate()
+        coco_eval.accumulate()
+    return coco_eval.eval['precision'][:, :, 0, 0, -1]
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('max_dets', [3, 100])
+def test_coco_bbox_ap_matches_cocoeval(seed, max_dets):
+    data, dets = _random_coco(seed)
+    anns = data['annotations']
+    ap = coco_bbox_ap(
+        np.array([d['bbox'] for d in dets]),
+        np.array([d['score'] for d in dets]),
+        np.array([d['image_id'] for d in dets]),
+        np.array([a['bbox'] for a in anns]),
+        # COCOeval only ignores crowd regions, not the `ignore` flag of the annotations
+        np.array([bool(a['iscrowd']) for a in anns]),
+        np.array([bool(a['iscrowd']) for a in anns]),
+        np.array([a['image_id'] for a in anns]),
+        max_dets=max_dets)
+    np.testing.assert_allclose(ap, _cocoeval_precision(data, dets, max_dets).mean(axis=1))
+
+
+def test_coco_bbox_ap_edge_cases():
+    gt = np.array([[0., 0., 10., 10.]])
+    no_dets = np.zeros((0, 4)), np.zeros(0), np.zeros(0, dtype=np.int64)
+    assert (coco_bbox_ap(*no_dets, gt, [False], [False], [1]) == 0).all()
+    assert (coco_bbox_ap(*no_dets, gt, [True], [True], [1]) == -1).all()
+    ap = coco_bbox_ap(gt, [0.9], [1], gt, [False], [False], [1])
+    np.testing.assert_allclose(ap, 1)
+
+
+def _centroid_match_reference(dets, gts, radius, score_thr, max_dets):
+    # per image greedy matching in score order, then tp / fp in score order over all images
+    matched = []
+    for img_id in sorted(set(d[3] for d in dets) | set(g[2] for g in gts)):
+        img_dets = sorted([d for d in dets if d[3] == img_id], key=lambda d: -d[2])[:max_dets]
+        img_gts = [g for g in gts if g[2] == img_id]
+        img_gts = [g for g in img_gts if not g[1]] + [g for g in img_gts if g[1]]
+        taken = [False] * len(img_gts)
+        for det in img_dets:
+            best, best_dist = -1, None
+            for j, gt in enumerate(img_gts):
+                dist = np.hypot(*(np.array(det[:2]) - gt[0]))
+                if dist > radius or (taken[j] and not gt[1]):
+                    continue
+                if best >= 0 and not img_gts[best][1] and gt[1]:
+                    break
+                if best_dist is None or dist <= best_dist:
+                    best, best_dist = j, dist
+            if best >= 0:
+                taken[best] = True
+            matched.append((det[2], None if best < 0 else bool(img_gts[best][1])))
+    matched = [m for m in sorted(matched, key=lambda m: -m[0]) if m[1] is not True]
+    n_pos = sum(not g[1] for g in gts)
+    tp = sum(m[1] is False for m in matched if m[0] >= score_thr)
+    fp = sum(m[1] is None for m in matched if m[0] >= score_thr)
+    return tp, fp, n_pos
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_centroid_match_matches_reference(seed):
+    rng = np.random.RandomState(seed)
+    gts = [(rng.uniform(-5, 60, 2), rng.rand() < 0.1, rng.randint(4)) for _ in range(40)]
+    dets = []
+    for _ in range(80):
+        x, y = gts[rng.randint(len(gts))][0] + rng.normal(0, 2, 2) if rng.rand() < 0.7 else rng.uniform(-5, 60, 2)
+        dets.append((x, y, float(rng.choice([0.5, rng.rand()])), rng.randint(5)))
+    out = centroid_match(
+        np.array([d[:2] for d in dets]), np.array([d[2] for d in dets]), np.array([d[3] for d in dets]),
+        np.array([g[0] for g in gts]), np.array([g[1] for g in gts]), np.array([g[2] for g in gts]),
+        radius=3., score_thr=0.4, max_dets=15)
+    tp, fp, n_pos = _centroid_match_reference(dets, gts, 3., 0.4, 15)
+    assert out['recall'] == pytest.approx(tp / n_pos)
+    assert out['precision'] == pytest.approx(tp / (tp + fp))
+
+
+def test_centroid_match_edge_cases():
+    gt = np.array([[10., 10.]])
+    assert centroid_match(np.zeros((0, 2)), [], [], gt, [False], [1])['ap'] == 0
+    assert centroid_match(np.zeros((0, 2)), [], [], gt, [True], [1])['ap'] == -1
+    # a point on the radius matches, one on another image or just beyond it does not
+    out = centroid_match([[13., 10.], [10., 10.], [10., 13.01]], [0.9, 0.8, 0.7], [1, 2, 1], gt, [False], [1])
+    assert out == dict(ap=pytest.approx(1), precision=pytest.approx(1 / 3), recall=1., f1=pytest.approx(0.5))
+
+
+def test_dataset_bbox_fast(tmpdir):
+    data, dets = _random_coco(0)
+    ann_file = os.path.join(str(tmpdir), 'val.json')
+    with open(ann_file, 'w') as f:
+        json.dump(data, f)
+    dataset = ALPunctaDataset(ann_file=ann_file, pipeline=[], test_mode=True)
+    results = []
+    for img_id in dataset.img_ids:
+        bboxes = [d['bbox'] + [d['score']] for d in dets if d['image_id'] == img_id]
+        bboxes = np.array(bboxes, dtype=np.float32).reshape(-1, 5)
+        bboxes[:, 2:4] += bboxes[:, :2]
+        results.append([bboxes])
+
+    fast = dataset.evaluate(results, metric='bbox_fast')
+    full = dataset.evaluate(results, metric='bbox')
+    assert fast == dict(bbox_mAP=full['bbox_mAP'], bbox_mAP_50=full['bbox_mAP_50'])
+
+
+def test_dataset_point(tmpdir):
+    data, dets = _random_coco(1)
+    ann_file = os.path.join(str(tmpdir), 'val.json')
+    with open(ann_file, 'w') as f:
+        json.dump(data, f)
+    dataset = ALPunctaDataset(ann_file=ann_file, pipeline=[], test_mode=True)
+    results = []
+    for img_id in dataset.img_ids:
+        bboxes = [d['bbox'] + [d['score']] for d in dets if d['image_id'] == img_id]
+        bboxes = np.array(bboxes, dtype=np.float32).reshape(-1, 5)
+        bboxes[:, 2:4] += bboxes[:, :2]
+        results.append([bboxes])
+
+    eval_results = dataset.evaluate(results, metric=['bbox_fast', 'point'], radius=4., score_thr=0.3)
+    assert list(eval_results) == ['bbox_mAP', 'bbox_mAP_50', 'point_AP', 'point_precision', 'point_recall', 'point_F1']
+    assert 0 < eval_results['point_F1'] <= 1
@@ -0,0 +1,210 @@
+import numpy as np
+import pytest
+import torch
+
+from mmdet.ppal.models.utils import (DetFeatStream, ImageDistanceCache,
+                                     get_img_score_distance_columns,
+                                     get_img_score_distance_cross,
+                                     get_img_score_distance_matrix,
+                                     get_img_score_distance_matrix_slow,
+                                     get_img_score_distance_matrix_tiled,
+                                     load_det_feat_cache, pack_det_info,
+                                     save_det_feat_cache, unpack_det_info)
+
+
+def _random_pool(n_images=40, max_det=12, feat_dim=16):
+    torch.manual_seed(0)
+    labels = torch.randint(0, 3, (n_images, max_det)).float()
+    scores = torch.rand((n_images, max_det))
+    feats = torch.randn((n_images, max_det, feat_dim))
+    return labels, scores, feats
+
+
+@pytest.mark.parametrize('same_label', [True, False])
+@pytest.mark.parametrize('block_memory_mb', [0.01, 1, 256])
+def test_tiled_distance_matches_slow_cosine(same_label, block_memory_mb):
+    labels, scores, feats = _random_pool()
+    slow = get_img_score_distance_matrix_slow(
+        labels, scores, feats, score_thr=0.3, same_label=same_label)
+    tiled = get_img_score_distance_matrix_tiled(
+        labels,
+        scores,
+        feats,
+        score_thr=0.3,
+        same_label=same_label,
+        block_memory_mb=block_memory_mb)
+    assert torch.allclose(slow, tiled, atol=1e-6)
+
+
+def test_tiled_distance_matches_slow_sorted_prefix():
+    # NMS-sorted detections: trailing slots are never above the threshold
+    labels, scores, feats = _random_pool()
+    scores = scores.sort(dim=1, descending=True)[0]
+    scores[:, 8:] = 0.
+    slow = get_img_score_distance_matrix_slow(
+        labels, scores, feats, score_thr=0.3)
+    tiled = get_img_score_distance_matrix_tiled(
+        labels, scores, feats, score_thr=0.3, block_memory_mb=0.01)
+    assert torch.allclose(slow, tiled, atol=1e-6)
+
+
+def test_tiled_distance_matches_slow_kl():
+    labels, scores, feats = _random_pool()
+    feats = feats.softmax(dim=-1)
+    slow = get_img_score_distance_matrix_slow(
+        labels, scores, feats, score_thr=0.3, same_label=False, metric='kl')
+    tiled = get_img_score_distance_matrix_tiled(
+        labels,
+        scores,
+        feats,
+        score_thr=0.3,
+        same_label=False,
+        metric='kl',
+        block_memory_mb=0.05)
+    assert torch.allclose(slow, tiled, atol=1e-6)
+
+
+def test_tiled_distance_l2():
+    labels, scores, feats = _random_pool()
+    dis = get_img_score_distance_matrix(
+        labels, scores, feats, score_thr=0.3, metric='l2')
+    assert dis.shape == (40, 40)
+    assert torch.allclose(dis, dis.t())
+    assert (dis >= 0).all() and (dis <= 2).all()
+
+    with pytest.raises(NotImplementedError):
+        get_img_score_distance_matrix(labels, scores, feats, engine='unknown')
+
+
+@pytest.mark.parametrize('metric', ['cosine', 'l2', 'kl'])
+def test_distance_columns_match_tiled(metric):
+    labels, scores, feats = _random_pool()
+    same_label = metric != 'kl'
+    if metric == 'kl':
+        feats = feats.softmax(dim=-1)
+    kwargs = dict(score_thr=0.3, same_label=same_label, metric=metric)
+    tiled = get_img_score_distance_matrix_tiled(labels, scores, feats,
+                                                **kwargs)
+    col_inds = [5, 0, 39, 12]
+    columns = get_img_score_distance_columns(
+        labels, scores, feats, col_inds, block_memory_mb=0.01, **kwargs)
+    assert torch.equal(tiled[:, col_inds], columns)
+
+
+def test_det_feat_cache(tmp_path):
+    labels, scores, feats = _random_pool(n_images=6)
+    # the last image is a repeat added by distributed padding
+    image_ids = np.array([[7], [3], [9], [1], [4], [7]])
+    path = str(tmp_path / 'cache' / 'feat_cache.npz')
+    save_det_feat_cache(path, image_ids, labels.numpy(), scores.numpy(),
+                        feats.numpy())
+
+    cache = load_det_feat_cache(path)
+    assert cache['image_ids'].tolist() == [7, 3, 9, 1, 4, 7]
+    np.testing.assert_array_equal(cache['det_feats'], feats.numpy())
+
+    cache = load_det_feat_cache(path, image_ids=[4, 7, 3, 100])
+    assert cache['image_ids'].tolist() == [3, 4, 7]
+    np.testing.assert_array_equal(cache['det_scores'],
+                                  scores.numpy()[[1, 4, 0]])
+
+
+@pytest.mark.parametrize('use_memmap', [False, True])
+def test_det_feat_stream_matches_dense(tmp_path, use_memmap):
+    labels, scores, feats = _random_pool(n_images=30)
+    # NMS output is sorted, and the stream stores fp16 embeddings
+    scores = scores.sort(dim=1, descending=True)[0]
+    feats = feats.half().float()
+    memmap_path = str(tmp_path / 'stream.mmap') if use_memmap else None
+    stream = DetFeatStream(
+        16, score_thr=0.3, capacity=30 * 12 if use_memmap else 8,
+        memmap_path=memmap_path)
+    for i in range(20):
+        stream.append(i, labels[i], scores[i], feats[i])
+    other = DetFeatStream(16, score_thr=0.3)
+    # image 0 again, as padded by a distributed sampler
+    for i in list(range(20, 30)) + [0]:
+        other.append(i, labels[i], scores[i], feats[i])
+    other.save(str(tmp_path / 'part.npz'))
+    stream.extend(str(tmp_path / 'part.npz'))
+    assert stream.n_rows == int((scores > 0.3).sum() + (scores[0] > 0.3).sum())
+
+    positions = stream.first_occurrences()
+    np.testing.assert_array_equal(
+        np.asarray(stream.image_ids)[positions], np.arange(30))
+    dense = get_img_score_distance_matrix_tiled(
+        labels, scores, feats, score_thr=0.3)
+    chunked = torch.zeros_like(dense)
+    for r0 in range(0, 30, 7):
+        rows = stream.padded(positions[r0:r0 + 7])
+        for c0 in range(r0, 30, 7):
+            cols = stream.padded(positions[c0:c0 + 7])
+            dis = get_img_score_distance_cross(*rows, *cols, score_thr=0.3)
+            chunked[r0:r0 + 7, c0:c0 + 7] = dis
+            chunked[c0:c0 + 7, r0:r0 + 7] = dis.t()
+    assert torch.allclose(dense, chunked, atol=1e-6)
+
+
+def test_image_distance_cache_reuses_pairs(tmp_path):
+    labels, scores, feats = _random_pool(n_images=40)
+    full = get_img_score_distance_matrix_tiled(
+        labels, scores, feats, score_thr=0.3).numpy()
+    image_ids = np.arange(40) + 100
+    path = str(tmp_path / 'dis_cache.npz')
+    computed = []
+
+    def distances(pool, policy='frozen', max_images=20000):
+
+        def columns_fn(inds):
+            computed.append(len(inds))
+            return get_img_score_distance_columns(
+                labels[pool], scores[pool], feats[pool], inds,
+                score_thr=0.3)
+
+        cache = ImageDistanceCache(path, policy=policy, max_images=max_images)
+        return cache.distance_matrix(image_ids[pool], columns_fn)
+
+    # round 1, then a pool with 10 old and 5 new images in another order
+    pool = np.arange(25)
+    np.testing.assert_allclose(distances(pool), full[np.ix_(pool, pool)])
+    pool = np.concatenate((np.arange(30, 35), np.arange(15, 25)[::-1]))
+    np.testing.assert_allclose(distances(pool), full[np.ix_(pool, pool)])
+    assert computed == [25, 5]
+
+    # pairs between two images first seen in different rounds are computed
+    pool = np.array([0, 1, 32, 33])
+    np.testing.assert_allclose(distances(pool), full[np.ix_(pool, pool)])
+    assert computed[-1] == 2
+
+    pool = np.arange(10)
+    distances(pool, policy='recompute')
+    assert computed[-1] == 10
+
+    # only the most recently pooled images are kept
+    distances(np.arange(35, 40), max_images=15)
+    cache = ImageDistanceCache(path)
+    assert sorted(cache.image_ids.tolist()) == (image_ids[np.r_[0:10, 35:40]]).tolist()
+    assert cache.n_updates == 5
+
+
+def test_pack_det_info_round_trip():
+    labels, scores, feats = _random_pool(n_images=3, max_det=12, feat_dim=16)
+    # fewer detections than max_det, none, and more (only the top 10 kept)
+    n_dets = [5, 0, 12]
+    image_ids = [3, 2 ** 16 + 7, 40000000]
+    packed = torch.stack([
+        pack_det_info(image_id, labels[i, :n], scores[i, :n], feats[i, :n],
+                      max_det=10)
+        for i, (image_id, n) in enumerate(zip(image_ids, n_dets))
+    ])
+    out_ids, out_labels, out_scores, out_feats = unpack_det_info(
+        packed, max_det=10, feat_dim=16)
+    assert out_ids.dtype == torch.int32
+    assert out_ids.reshape(-1).tolist() == image_ids
+    for i, n in enumerate(n_dets):
+        n = min(n, 10)
+        assert torch.equal(out_labels[i, :n], labels[i, :n])
+        assert torch.equal(out_scores[i, :n], scores[i, :n])
+        assert torch.equal(out_feats[i, :n], feats[i, :n])
+        assert (out_labels[i, n:] == -1).all()
+        assert (out_scores[i, n:] == 0).all() and (out_feats[i, n:] == 0).all()
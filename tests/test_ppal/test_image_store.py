@@ -0,0 +1,36 @@
+import os
+import pickle
+
+import numpy as np
+
+from mmdet.ppal.utils.image_store import PackedImageStore, write_image_store
+
+
+def test_packed_image_store(tmpdir):
+    rng = np.random.RandomState(0)
+    images = [
+        rng.randint(0, 256, (128, 128, 3)).astype(np.uint8),
+        rng.randint(0, 256, (64, 96, 3)).astype(np.uint8),
+        rng.randint(0, 256, (32, 48)).astype(np.uint8),
+    ]
+    # the same file name in two splits
+    paths = [os.path.join(str(tmpdir), split, name) for split, name in
+             (('train', '1.bmp'), ('val', '1.bmp'), ('train', '2.bmp'))]
+    prefix = os.path.join(str(tmpdir), 'store', 'train_store')
+    n = write_image_store(prefix, zip([1, 1, 2], paths, images))
+    assert n == 3
+
+    store = PackedImageStore(prefix)
+    assert len(store) == 3
+    for path, img in zip(paths, images):
+        # relative and absolute paths of an image are the same entry
+        index = store.index_of(os.path.relpath(path))
+        out = store.get(index)
+        assert not out.flags.writeable
+        np.testing.assert_array_equal(out, img)
+    assert store.index_of(os.path.join(str(tmpdir), 'val', '2.bmp')) is None
+
+    # workers receive the store unmapped and map it on first use
+    store = pickle.loads(pickle.dumps(store))
+    assert store._data is None
+    np.testing.assert_array_equal(store.get(2), images[2])
@@ -0,0 +1,92 @@
+import json
+import os
+
+import numpy as np
+
+from mmdet.ppal.models.utils import load_det_feat_cache, save_det_feat_cache
+from mmdet.ppal.utils.inference_cache import (InferenceCache,
+                                              run_cached_inference)
+
+
+def _write_ann(path, image_ids):
+    with open(path, 'w') as f:
+        json.dump(dict(images=[dict(id=i) for i in image_ids], categories=[]),
+                  f)
+
+
+def _fake_infer(calls):
+
+    def infer(ann_file, jsonfile_prefix, feat_cache_path=None):
+        with open(ann_file) as f:
+            image_ids = [x['id'] for x in json.load(f)['images']]
+        calls.append(image_ids)
+        # image 2 has no detection
+        results = [
+            dict(
+                image_id=i,
+                bbox=[1.5, 2., 11., 11.],
+                score=0.5 + 0.01 * i,
+                category_id=1,
+                cls_uncertainty=0.25,
+                box_uncertainty=0.) for i in image_ids if i != 2
+        ]
+        with open(jsonfile_prefix + '.bbox.json', 'w') as f:
+            json.dump(results, f)
+        if feat_cache_path is not None:
+            n = len(image_ids)
+            labels = np.full((n, 4), -1, dtype=np.float32)
+            labels[:, :2] = 0
+            scores = np.zeros((n, 4), dtype=np.float32)
+            scores[:, :2] = 0.9
+            feats = np.arange(n * 4 * 3, dtype=np.float32).reshape(n, 4, 3)
+            save_det_feat_cache(feat_cache_path, np.array(image_ids), labels,
+                                scores, feats)
+
+    return infer
+
+
+def test_run_cached_inference(tmp_path):
+    cache = InferenceCache(str(tmp_path / 'cache'))
+    ann_json = str(tmp_path / 'unlabeled.json')
+    prefix = str(tmp_path / 'unlabeled_inference_result')
+    feat_path = str(tmp_path / 'feat_cache.npz')
+    calls = []
+    infer = _fake_infer(calls)
+
+    _write_ann(ann_json, [1, 2, 3])
+    run_cached_inference(cache, 'key', ann_json, prefix, infer, feat_path)
+    with open(prefix + '.bbox.json') as f:
+        first = json.load(f)
+    assert calls == [[1, 2, 3]]
+    assert [x['image_id'] for x in first] == [1, 3]
+    assert first[0]['bbox'] == [1.5, 2., 11., 11.]
+
+    # a rerun with one more image only infers the new one
+    _write_ann(ann_json, [1, 2, 3, 4])
+    run_cached_inference(cache, 'key', ann_json, prefix, infer, feat_path)
+    assert calls == [[1, 2, 3], [4]]
+    with open(prefix + '.bbox.json') as f:
+        second = json.load(f)
+    assert second[:2] == first
+    feats = load_det_feat_cache(feat_path)
+    assert feats['image_ids'].tolist() == [1, 2, 3, 4]
+    # padding rows are not cached
+    assert feats['det_feats'].shape == (4, 2, 3)
+
+    # another checkpoint / config gets its own namespace
+    run_cached_inference(cache, 'other', ann_json, prefix, infer)
+    assert calls[-1] == [1, 2, 3, 4]
+    assert not os.path.exists(prefix + '.missing.json')
+
+
+def test_inference_cache_eviction(tmp_path):
+    cache = InferenceCache(str(tmp_path / 'cache'), max_size_mb=0.003)
+    ann_json = str(tmp_path / 'unlabeled.json')
+    prefix = str(tmp_path / 'unlabeled_inference_result')
+    _write_ann(ann_json, [1, 2, 3])
+    infer = _fake_infer([])
+
+    run_cached_inference(cache, 'old', ann_json, prefix, infer)
+    run_cached_inference(cache, 'new', ann_json, prefix, infer)
+    assert os.path.isdir(str(tmp_path / 'cache' / 'new'))
+    assert not os.path.isdir(str(tmp_path / 'cache' / 'old'))
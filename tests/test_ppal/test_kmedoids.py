@@ -0,0 +1,53 @@
+import itertools
+
+import numpy as np
+
+from mmdet.ppal.utils.kmedoids import (DenseDistances, assignment_cost, clara,
+                                       farthest_point_seeding, fasterpam)
+
+
+def _blobs(n_per_blob=30, n_blobs=4, seed=0):
+    rng = np.random.RandomState(seed)
+    centers = rng.uniform(-20, 20, (n_blobs, 2))
+    points = np.concatenate(
+        [c + rng.randn(n_per_blob, 2) for c in centers], axis=0)
+    return np.linalg.norm(points[:, None] - points[None], axis=-1)
+
+
+def test_farthest_point_seeding_matches_greedy():
+    dis_matrix = _blobs()
+    seeds = farthest_point_seeding(DenseDistances(dis_matrix), 6, first=7)
+
+    # reference: distances to all chosen centers at every step
+    centroids = [7]
+    while len(centroids) < 6:
+        centroids_diss = dis_matrix[:, centroids].min(axis=1)
+        centroids_diss[centroids] = -1
+        centroids.append(int(np.argmax(centroids_diss)))
+    assert seeds == centroids
+
+
+def test_fasterpam_reaches_optimum_on_small_pool():
+    rng = np.random.RandomState(1)
+    points = rng.randn(14, 3)
+    dis_matrix = np.linalg.norm(points[:, None] - points[None], axis=-1)
+    dist = DenseDistances(dis_matrix)
+    best = min(
+        dis_matrix[:, list(m)].min(axis=1).sum()
+        for m in itertools.combinations(range(14), 3))
+
+    medoids, cost = fasterpam(dist, [0, 1, 2], block_size=4)
+    assert len(set(medoids)) == 3
+    np.testing.assert_allclose(cost, assignment_cost(dist, medoids))
+    # swap-based local search on such a small pool finds the optimum
+    np.testing.assert_allclose(cost, best)
+
+
+def test_clara_close_to_full_fasterpam():
+    np.random.seed(0)
+    dist = DenseDistances(_blobs(n_per_blob=100))
+    _, full_cost = fasterpam(dist, farthest_point_seeding(dist, 4))
+    medoids, cost = clara(dist, 4, n_samples=3, sample_size=60)
+    assert len(set(medoids)) == 4
+    np.testing.assert_allclose(cost, assignment_cost(dist, medoids))
+    assert cost <= 1.05 * full_cost
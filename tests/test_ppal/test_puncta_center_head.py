@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+import torch
+from mmcv import ConfigDict
+
+from mmdet.models.dense_heads import CenterNetHead
+from mmdet.ppal.models import (PunctaCenterHead, PunctaCenterHeadUncertainty,
+                               PunctaCenterHeadUncertaintyFeat)
+from mmdet.ppal.models.utils import load_det_feat_cache
+
+TEST_CFG = ConfigDict(topk=20, local_maximum_kernel=3, score_thr=0., max_per_img=20)
+
+
+def _gts(seed, n_images=3, num_classes=2):
+    torch.manual_seed(seed)
+    gt_bboxes, gt_labels = [], []
+    for _ in range(n_images):
+        n = int(torch.randint(0, 12, (1, )))
+        xy = torch.rand(n, 2) * 116
+        wh = torch.rand(n, 2) * 30 + 1 if seed % 2 else torch.full((n, 2), 11.)
+        bboxes = torch.cat([xy, (xy + wh).clamp(max=127.9)], dim=1)
+        if n > 1:
+            bboxes[1] = bboxes[0]  # same centre cell
+        gt_bboxes.append(bboxes)
+        gt_labels.append(torch.randint(0, num_classes, (n, )))
+    return gt_bboxes, gt_labels
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_get_targets_matches_centernet(seed):
+    head = PunctaCenterHead(in_channel=8, feat_channel=8, num_classes=2)
+    ref = CenterNetHead(in_channel=8, feat_channel=8, num_classes=2)
+    gt_bboxes, gt_labels = _gts(seed)
+    targets, avg_factor = head.get_targets(gt_bboxes, gt_labels, (3, 2, 32, 32), (128, 128))
+    ref_targets, ref_avg_factor = ref.get_targets(gt_bboxes, gt_labels, (3, 2, 32, 32), (128, 128))
+    assert int(avg_factor) == int(ref_avg_factor)
+    for key in ref_targets:
+        assert torch.equal(targets[key], ref_targets[key])
+
+
+def _inputs(n_images, in_channels=8, img_size=128):
+    torch.manual_seed(0)
+    feats = [torch.randn(n_images, in_channels, img_size // s, img_size // s) for s in (4, 8, 16, 32)]
+    img_metas = [
+        dict(
+            img_id=100 + i,
+            img_shape=(img_size, img_size, 3),
+            batch_input_shape=(img_size, img_size),
+            scale_factor=np.array([0.5, 0.5, 0.5, 0.5], dtype=np.float32)) for i in range(n_images)
+    ]
+    return feats, img_metas
+
+
+def test_single_level_and_batched_decode():
+    head = PunctaCenterHead(in_channel=8, feat_channel=8, num_classes=1, test_cfg=TEST_CFG)
+    ref = CenterNetHead(in_channel=8, feat_channel=8, num_classes=1, test_cfg=TEST_CFG)
+    ref.load_state_dict(head.state_dict())
+    feats, img_metas = _inputs(4)
+    with torch.no_grad():
+        outs = head(feats)
+        assert [len(out) for out in outs] == [1, 1, 1]
+        assert outs[0][0].shape == (4, 1, 32, 32)
+        results = head.get_bboxes(*outs, img_metas=img_metas, rescale=True)
+        for img_meta in img_metas:
+            img_meta['border'] = (0, 0, 0, 0)
+        ref_results = ref.get_bboxes(*outs, img_metas=img_metas, rescale=True)
+    for (bboxes, labels), (ref_bboxes, ref_labels) in zip(results, ref_results):
+        assert torch.allclose(bboxes, ref_bboxes)
+        assert torch.equal(labels, ref_labels)
+
+
+def test_uncertainty_heads(tmpdir):
+    feats, img_metas = _inputs(4)
+    head = PunctaCenterHeadUncertainty(in_channel=8, feat_channel=8, num_classes=1, test_cfg=TEST_CFG)
+    output_path = str(tmpdir.join('feat_cache.npz'))
+    feat_head = PunctaCenterHeadUncertaintyFeat(
+        total_images=8, max_det=5, feat_dim=8, output_path=output_path, in_channel=8, feat_channel=8,
+        num_classes=1, test_cfg=TEST_CFG)
+    feat_head.load_state_dict(head.state_dict())
+    with torch.no_grad():
+        results = head.simple_test(feats, img_metas, rescale=True)
+        feat_results = feat_head.simple_test(feats, img_metas, rescale=True)
+        for img_meta in img_metas:
+            img_meta['img_id'] += 4
+        feat_head.simple_test(feats, img_metas, rescale=True)
+
+    for (bboxes, labels, cls_unc, box_unc), feat_result in zip(results, feat_results):
+        assert len(bboxes) == len(labels) == len(cls_unc) == len(box_unc) == TEST_CFG.topk
+        assert (cls_unc > 0).all() and (box_unc == 0).all()
+        for a, b in zip((bboxes, labels, cls_unc, box_unc), feat_result):
+            assert torch.equal(a, b)
+
+    cache = load_det_feat_cache(output_path)
+    assert sorted(cache['image_ids'].tolist()) == list(range(100, 108))
+    assert cache['det_feats'].shape == (8, 5, 8)
+    np.testing.assert_allclose(cache['det_scores'][:4], np.stack([r[0][:5, 4].numpy() for r in results]))
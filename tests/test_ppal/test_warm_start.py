@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+import torch.nn as nn
+from mmcv import Config
+from mmcv.runner import save_checkpoint
+
+from mmdet.ppal.datasets import NewImageRepeatDataset
+from mmdet.ppal.hooks import WarmStartHook
+from mmdet.ppal.utils.running_checks import display_time_to_accuracy
+from mmdet.ppal.utils.warm_start import warm_start_config
+
+
+def test_warm_start_config():
+    train_cfg = Config(dict(
+        data=dict(train=dict(type='ALPunctaDataset', ann_file='train.json')),
+        runner=dict(type='EpochBasedRunner', max_epochs=20),
+        lr_config=dict(policy='step', warmup='linear', warmup_iters=1000, warmup_ratio=0.001, step=[8, 12]),
+        custom_hooks=[dict(type='NumClassCheckHook')]))
+    cfg = warm_start_config(train_cfg, 'labeled.json', 'last_labeled.json', 'latest.pth', max_epochs=5,
+                            resume_ema=False, new_image_repeat=3)
+    assert cfg.runner.max_epochs == 5
+    assert cfg.lr_config.step == [2, 3]
+    assert cfg.lr_config.warmup is None
+    assert cfg.data.train.type == 'NewImageRepeatDataset' and cfg.data.train.times == 3
+    assert cfg.data.train.dataset.ann_file == 'labeled.json'
+    assert cfg.custom_hooks[-1] == dict(type='WarmStartHook', checkpoint='latest.pth', resume_optimizer=True,
+                                        resume_ema=False, priority='HIGHEST')
+    # the cold start config is untouched
+    assert train_cfg.runner.max_epochs == 20 and len(train_cfg.custom_hooks) == 1
+
+    cfg = warm_start_config(train_cfg, 'labeled.json', 'last_labeled.json', 'latest.pth', lr_step=[4], warmup_iters=50)
+    assert cfg.lr_config.step == [4] and cfg.lr_config.warmup_iters == 50
+    assert cfg.data.train.ann_file == 'labeled.json'
+
+
+def test_new_image_repeat_dataset(tmpdir):
+    last_ann_file = os.path.join(str(tmpdir), 'last_labeled.json')
+    with open(last_ann_file, 'w') as f:
+        json.dump(dict(images=[dict(id=3), dict(id=5)], annotations=[], categories=[]), f)
+    dataset = _ListDataset([3, 4, 5, 6], flag=np.array([0, 1, 0, 1], dtype=np.uint8))
+    wrapped = NewImageRepeatDataset(dataset, last_ann_file, times=2)
+    assert len(wrapped) == 6 and wrapped.n_new == 2
+    assert [wrapped[i] for i in range(len(wrapped))] == [3, 4, 4, 5, 6, 6]
+    assert wrapped.flag.tolist() == [0, 1, 1, 0, 1, 1]
+
+
+class _ListDataset(object):
+
+    CLASSES = ('puncta', )
+
+    def __init__(self, img_ids, flag):
+        self.img_ids = img_ids
+        self.flag = flag
+
+    def __len__(self):
+        return len(self.img_ids)
+
+    def __getitem__(self, idx):
+        return self.img_ids[idx]
+
+
+class _EMAModel(nn.Module):
+
+    def __init__(self):
+        super(_EMAModel, self).__init__()
+        self.fc = nn.Linear(4, 2)
+        self.register_buffer('class_quality', torch.zeros(2))
+
+
+def test_warm_start_hook(tmpdir):
+    model = _EMAModel()
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1, momentum=0.9)
+    model.fc(torch.ones(1, 4)).sum().backward()
+    optimizer.step()
+    model.class_quality.fill_(0.5)
+    checkpoint = os.path.join(str(tmpdir), 'latest.pth')
+    save_checkpoint(model, checkpoint, optimizer=optimizer)
+
+    for resume_optimizer, resume_ema in ((True, True), (False, False)):
+        new_model = _EMAModel()
+        new_optimizer = torch.optim.SGD(new_model.parameters(), lr=0.1, momentum=0.9)
+        runner = SimpleNamespace(model=new_model, optimizer=new_optimizer, logger=logging.getLogger())
+        WarmStartHook(checkpoint, resume_optimizer=resume_optimizer, resume_ema=resume_ema).before_run(runner)
+        assert torch.equal(new_model.fc.weight, model.fc.weight)
+        assert new_model.class_quality.tolist() == ([0.5, 0.5] if resume_ema else [0., 0.])
+        assert (len(new_optimizer.state) > 0) == resume_optimizer
+
+
+def test_display_time_to_accuracy(tmpdir):
+    def write(output_dir, records):
+        round_dir = os.path.join(output_dir, 'round1')
+        os.makedirs(round_dir)
+        with open(os.path.join(round_dir, 'time_to_accuracy.json'), 'w') as f:
+            json.dump(dict(metric='bbox_mAP', records=[
+                dict(epoch=i + 1, iter=10 * (i + 1), time=t, metric=m) for i, (t, m) in enumerate(records)]), f)
+
+    cold_dir, warm_dir = str(tmpdir.join('cold')), str(tmpdir.join('warm'))
+    write(cold_dir, [(100., 0.2), (200., 0.3), (400., 0.4)])
+    write(warm_dir, [(50., 0.41), (100., 0.42)])
+    out_txt = str(tmpdir.join('time_to_accuracy.txt'))
+    display_time_to_accuracy(warm_dir, 1, cold_dir, out_txt)
+    with open(out_txt) as f:
+        line = f.read()
+    assert line.startswith('Round 1: 2 epochs in 0:01:40, final 0.4200')
+    assert 'reached after 0:00:50 (87.5% saved)' in line
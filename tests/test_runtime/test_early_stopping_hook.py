@@ -0,0 +1,84 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import os.path as osp
+import tempfile
+from collections import OrderedDict
+from unittest.mock import MagicMock, patch
+
+import pytest
+import torch
+import torch.nn as nn
+from mmcv.runner import EpochBasedRunner, build_optimizer
+from mmcv.utils import get_logger
+from torch.utils.data import DataLoader, Dataset
+
+from mmdet.core import EarlyStoppingHook, EvalHook
+
+
+class EvalDataset(Dataset):
+
+    def __init__(self, eval_result):
+        self.index = 0
+        self.eval_result = eval_result
+
+    def __getitem__(self, idx):
+        return dict(imgs=torch.tensor([1]))
+
+    def __len__(self):
+        return 1
+
+    def evaluate(self, results, logger=None):
+        output = OrderedDict(bbox_mAP=self.eval_result[self.index])
+        self.index += 1
+        return output
+
+
+class ExampleModel(nn.Module):
+
+    def __init__(self):
+        super().__init__()
+        self.conv = nn.Linear(1, 1)
+        self.test_cfg = None
+
+    def forward(self, imgs, rescale=False, return_loss=False):
+        return imgs
+
+    def train_step(self, data_batch, optimizer, **kwargs):
+        return {'loss': 0.5, 'log_vars': {'accuracy': 0.98}, 'num_samples': 1}
+
+
+def _run(eval_result, max_epochs=8, **hook_kwargs):
+    data_loader = DataLoader(EvalDataset(eval_result))
+    model = ExampleModel()
+    optimizer = build_optimizer(model, dict(type='SGD', lr=0.01))
+    work_dir = tempfile.mkdtemp()
+    runner = EpochBasedRunner(
+        model=model, optimizer=optimizer, work_dir=work_dir, logger=get_logger('test_early_stopping'))
+    runner.register_checkpoint_hook(dict(interval=100))
+    runner.register_hook(EvalHook(data_loader), priority='LOW')
+    hook = EarlyStoppingHook(**hook_kwargs)
+    runner.register_hook(hook, priority=80)
+    runner.run([data_loader], [('train', 1)], max_epochs)
+    return runner, hook
+
+
+@patch('mmdet.apis.single_gpu_test', MagicMock)
+def test_early_stopping_hook():
+    with pytest.raises(AssertionError):
+        EarlyStoppingHook(rule='max')
+
+    runner, hook = _run([0.1, 0.4, 0.3, 0.35, 0.5, 0.6, 0.7, 0.8], patience=2)
+    assert runner.epoch == 4
+    assert hook.best_score == 0.4 and hook.best_epoch == 2
+    assert osp.isfile(osp.join(runner.work_dir, 'best.pth'))
+    # the stopped epoch is saved as the last one
+    assert osp.isfile(osp.join(runner.work_dir, 'epoch_4.pth'))
+    assert osp.exists(osp.join(runner.work_dir, 'latest.pth'))
+    assert torch.load(osp.join(runner.work_dir, 'best.pth'))['meta']['epoch'] == 2
+
+    # no stop before `start`, improvements below min_delta do not count
+    runner, hook = _run([0.1, 0.4, 0.3, 0.35, 0.41, 0.43, 0.7, 0.8], patience=2, start=6, min_delta=0.05)
+    assert runner.epoch == 6
+    assert hook.best_epoch == 2
+
+    runner, hook = _run([0.5, 0.4, 0.3, 0.2, 0.1, 0.05, 0.04, 0.03], rule='less', patience=1)
+    assert runner.epoch == 8 and hook.best_epoch == 8
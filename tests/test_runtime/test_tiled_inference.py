@@ -0,0 +1,113 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+from os.path import dirname, join
+
+import mmcv
+import numpy as np
+import pytest
+
+from mmdet.apis import inference_detector_tiled, init_detector, iter_tiles
+from mmdet.apis import tiled_inference
+from mmdet.apis.tiled_inference import tile_grid
+from mmdet.ppal.datasets import *  # noqa: F401,F403
+from mmdet.ppal.models import *  # noqa: F401,F403
+
+
+def test_tile_grid():
+    starts, owned_lo, owned_hi = tile_grid(300, 128, 32)
+    assert starts.tolist() == [0, 96, 172]
+    assert owned_lo[0] == -np.inf and owned_hi[-1] == np.inf
+    assert (owned_lo[1:] == owned_hi[:-1]).all()
+    # every tile owns a range inside itself
+    assert (owned_lo[1:] >= starts[1:]).all()
+    assert (owned_hi[:-1] <= starts[:-1] + 128).all()
+
+    starts, _, _ = tile_grid(100, 128, 32)
+    assert starts.tolist() == [0]
+    starts, _, _ = tile_grid(224, 128, 32)
+    assert starts.tolist() == [0, 96]
+
+
+def test_iter_tiles_are_views():
+    img = np.arange(300 * 200 * 3, dtype=np.uint8).reshape(300, 200, 3)
+    tiles = list(iter_tiles(img, tile_size=(128, 128), overlap=(32, 32)))
+    assert len(tiles) == 3 * 2
+    covered = np.zeros(img.shape[:2], dtype=int)
+    for tile, (x, y), _ in tiles:
+        assert tile.shape == (128, 128, 3)
+        assert np.shares_memory(tile, img)
+        covered[y:y + 128, x:x + 128] += 1
+    assert (covered > 0).all()
+
+
+def _spot_detector(model, tiles):
+    # one 11x11 box per bright pixel of the tile, cut at the tile border
+    results = []
+    for tile in tiles:
+        ys, xs = np.nonzero(tile[..., 0] == 255)
+        h, w = tile.shape[:2]
+        dets = np.stack([
+            np.clip(xs - 5, 0, w),
+            np.clip(ys - 5, 0, h),
+            np.clip(xs + 6, 0, w),
+            np.clip(ys + 6, 0, h),
+            np.full(len(xs), 0.9)
+        ], axis=1).astype(np.float32).reshape(-1, 5)
+        results.append([dets])
+    return results
+
+
+@pytest.mark.parametrize('merge', ['nms', 'centroid'])
+def test_inference_detector_tiled(monkeypatch, tmpdir, merge):
+    monkeypatch.setattr(tiled_inference, 'inference_detector', _spot_detector)
+    img = np.zeros((300, 260, 3), dtype=np.uint8)
+    spots = [(20, 20), (110, 50), (100, 100), (150, 200), (250, 120)]
+    for x, y in spots:
+        img[y, x] = 255
+    path = str(tmpdir.join('img.npy'))
+    np.save(path, img)
+
+    result = inference_detector_tiled(
+        None,
+        np.load(path, mmap_mode='r'),
+        tile_size=(128, 128),
+        overlap=(32, 32),
+        batch_size=4,
+        merge=merge,
+        nms_cfg=dict(type='nms', iou_threshold=0.3))
+    assert len(result) == 1
+    dets = result[0][np.lexsort((result[0][:, 1], result[0][:, 0]))]
+    expected = np.array([[x - 5, y - 5, x + 6, y + 6]
+                         for x, y in sorted(spots)])
+    np.testing.assert_allclose(dets[:, :4], expected)
+
+
+@pytest.mark.parametrize('config,head_channels,n_columns', [
+    ('al_inference/retinanet_uncertainty.py',
+     dict(in_channels=32, feat_channels=32), 7),
+    # PunctaCenterHead has no nms in its test_cfg
+    ('al_train/puncta_center_26e.py', dict(in_channel=32, feat_channel=8), 5),
+])
+def test_inference_detector_tiled_al_detector(config, head_channels,
+                                              n_columns):
+    cfg = mmcv.Config.fromfile(
+        join(dirname(__file__), '..', '..', 'configs', 'coco_active_learning',
+             config))
+    # an untrained ResNet-18 detector, with the low scores kept
+    cfg.model.backbone.update(depth=18, init_cfg=None)
+    cfg.model.neck.update(in_channels=[64, 128, 256, 512], out_channels=32)
+    cfg.model.bbox_head.update(head_channels)
+    cfg.model.test_cfg.score_thr = 0.
+    model = init_detector(cfg, device='cpu')
+
+    img = np.random.RandomState(0).randint(0, 256, (300, 260, 3)).astype(
+        np.uint8)
+    result = inference_detector_tiled(
+        model, img, tile_size=(128, 128), overlap=(32, 32), batch_size=4)
+    assert len(result) == model.bbox_head.num_classes
+    dets = result[0]
+    assert len(dets) > 0 and dets.shape[1] == n_columns
+    # boxes of the 3 x 3 tiles are in image coordinates
+    cx = (dets[:, 0] + dets[:, 2]) / 2
+    cy = (dets[:, 1] + dets[:, 3]) / 2
+    assert (cx >= -1).all() and (cx <= 261).all() and cx.max() > 128
+    assert (cy >= -1).all() and (cy <= 301).all() and cy.max() > 128
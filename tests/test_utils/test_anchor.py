@@ -284,6 +284,49 @@ def test_standard_anchor_generator():
     assert anchor_generator is not None
 
 
+def test_anchor_generator_cache():
+    from mmdet.core.anchor import build_anchor_generator
+    anchor_generator_cfg = dict(
+        type='AnchorGenerator',
+        octave_base_scale=3,
+        scales_per_octave=3,
+        ratios=[0.5, 1.0, 2.0],
+        strides=[8, 16, 32])
+    anchor_generator = build_anchor_generator(anchor_generator_cfg)
+    cached_generator = build_anchor_generator(
+        dict(cache_size=2, **anchor_generator_cfg))
+    featmap_sizes = [(16, 16), (8, 8), (4, 4)]
+
+    priors = cached_generator.grid_priors(featmap_sizes, device='cpu')
+    cached_priors = cached_generator.grid_priors(featmap_sizes, device='cpu')
+    expected = anchor_generator.grid_priors(featmap_sizes, device='cpu')
+    for prior, cached_prior, expected_prior in zip(priors, cached_priors,
+                                                   expected):
+        assert cached_prior is prior
+        assert torch.equal(prior, expected_prior)
+    flags = cached_generator.valid_flags(featmap_sizes, (100, 128), 'cpu')
+    cached_generator.valid_flags(featmap_sizes, (100, 128, 3), 'cpu')
+    expected = anchor_generator.valid_flags(featmap_sizes, (100, 128), 'cpu')
+    for flag, expected_flag in zip(flags, expected):
+        assert torch.equal(flag, expected_flag)
+    assert cached_generator.cache_info() == dict(
+        hits=2, misses=2, size=2, maxsize=2)
+
+    # the least recently used entry, the priors, is evicted
+    cached_generator.grid_priors(
+        featmap_sizes, dtype=torch.float16, device='cpu')
+    cached_generator.valid_flags(featmap_sizes, (100, 128), 'cpu')
+    cached_generator.grid_priors(featmap_sizes, device='cpu')
+    assert cached_generator.cache_info() == dict(
+        hits=3, misses=4, size=2, maxsize=2)
+
+    cached_generator.clear_cache()
+    assert cached_generator.cache_info() == dict(
+        hits=0, misses=0, size=0, maxsize=2)
+    assert anchor_generator.cache_info() == dict(
+        hits=0, misses=0, size=0, maxsize=0)
+
+
 def test_strides():
     from mmdet.core import AnchorGenerator
     # Square strides
@@ -154,6 +154,64 @@ def test_max_iou_assigner_with_empty_boxes_and_gt():
     assert len(assign_result.gt_inds) == 0
 
 
+@pytest.mark.parametrize('gt_max_assign_all', [True, False])
+@pytest.mark.parametrize('ignore_wrt_candidates', [True, False])
+def test_max_iou_assigner_batched(gt_max_assign_all, ignore_wrt_candidates):
+    self = MaxIoUAssigner(
+        pos_iou_thr=0.5,
+        neg_iou_thr=0.4,
+        min_pos_iou=0,
+        gt_max_assign_all=gt_max_assign_all,
+        ignore_iof_thr=0.5,
+        ignore_wrt_candidates=ignore_wrt_candidates)
+    torch.manual_seed(0)
+    xy = torch.rand(3, 50, 2) * 100
+    bboxes = torch.cat([xy, xy + 16], dim=-1)
+    # two identical bboxes, so that gts tie
+    bboxes[:, 1] = bboxes[:, 0]
+    bbox_valid = torch.rand(3, 50) > 0.2
+    gts = [torch.rand(n, 2) * 100 for n in (4, 0, 7)]
+    gt_bboxes_list = [torch.cat([gt, gt + 12], dim=1) for gt in gts]
+    # a gt of each image with the same box as the next
+    gt_bboxes_list[2][3] = gt_bboxes_list[2][2]
+    gt_labels_list = [torch.randint(0, 3, (len(gt), )) for gt in gts]
+    gt_bboxes_ignore_list = [
+        torch.Tensor([[0, 0, 50, 50]]),
+        torch.empty((0, 4)),
+        torch.empty((0, 4))
+    ]
+
+    gt_bboxes = torch.zeros(3, 7, 4)
+    gt_labels = torch.zeros(3, 7, dtype=torch.long)
+    gt_valid = torch.zeros(3, 7, dtype=torch.bool)
+    for i, (gt, labels) in enumerate(zip(gt_bboxes_list, gt_labels_list)):
+        gt_bboxes[i, :len(gt)] = gt
+        gt_labels[i, :len(gt)] = labels
+        gt_valid[i, :len(gt)] = True
+    gt_bboxes_ignore = torch.Tensor([[[0, 0, 50, 50]], [[0, 0, 0, 0]],
+                                     [[0, 0, 0, 0]]])
+    ignore_valid = torch.BoolTensor([[True], [False], [False]])
+    gt_inds, max_overlaps, labels = self.assign_batched(
+        bboxes,
+        gt_bboxes,
+        gt_valid,
+        bbox_valid=bbox_valid,
+        gt_bboxes_ignore=gt_bboxes_ignore,
+        ignore_valid=ignore_valid,
+        gt_labels=gt_labels)
+
+    for i in range(3):
+        assign_result = self.assign(bboxes[i][bbox_valid[i]],
+                                    gt_bboxes_list[i],
+                                    gt_bboxes_ignore_list[i],
+                                    gt_labels_list[i])
+        assert torch.equal(gt_inds[i][bbox_valid[i]], assign_result.gt_inds)
+        assert torch.equal(max_overlaps[i][bbox_valid[i]],
+                           assign_result.max_overlaps)
+        assert torch.equal(labels[i][bbox_valid[i]], assign_result.labels)
+        assert (gt_inds[i][~bbox_valid[i]] == -1).all()
+
+
 def test_point_assigner():
     self = PointAssigner()
     points = torch.FloatTensor([  # [x, y, stride]
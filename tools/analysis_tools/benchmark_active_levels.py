@@ -0,0 +1,169 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import argparse
+import time
+
+import numpy as np
+import torch
+from mmcv import Config
+
+from mmdet.models import build_detector
+from mmdet.ppal.models import *  # noqa: F401,F403
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Time per training iteration and per test batch of the '
+        'RetinaNet model with all FPN levels against the active levels of '
+        'its config')
+    parser.add_argument(
+        '--config',
+        default='configs/coco_active_learning/al_train/retinanet_26e.py',
+        help='training config with `active_levels` on the neck and head')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument(
+        '--n-batches', type=int, default=20, help='batches per measurement')
+    parser.add_argument(
+        '--n-puncta', type=int, default=30, help='puncta per image')
+    parser.add_argument(
+        '--img-size', type=int, default=128, help='square image size')
+    parser.add_argument('--device', default='cuda:0')
+    return parser.parse_args()
+
+
+def make_batch(batch_size, img_size, n_puncta, device):
+    img = torch.randn((batch_size, 3, img_size, img_size), device=device)
+    shape = (img_size, img_size, 3)
+    img_metas = [
+        dict(
+            img_shape=shape,
+            ori_shape=shape,
+            pad_shape=shape,
+            batch_input_shape=(img_size, img_size),
+            scale_factor=np.ones(4, dtype=np.float32),
+            flip=False) for _ in range(batch_size)
+    ]
+    # fixed 11x11 puncta boxes, as bbox_creation.py draws them
+    gt_bboxes = []
+    for _ in range(batch_size):
+        xy = torch.rand((n_puncta, 2), device=device) * (img_size - 11)
+        gt_bboxes.append(torch.cat([xy, xy + 11], dim=1))
+    gt_labels = [
+        torch.zeros(n_puncta, dtype=torch.long, device=device)
+        for _ in range(batch_size)
+    ]
+    return img, img_metas, gt_bboxes, gt_labels
+
+
+def synchronize(device):
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+
+
+class StageTimer:
+    """Accumulates the time of named stages, synchronized with the device."""
+
+    def __init__(self, device):
+        self.device = device
+        self.times = dict()
+
+    def start(self):
+        synchronize(self.device)
+        self.tic = time.perf_counter()
+
+    def stop(self, stage):
+        synchronize(self.device)
+        toc = time.perf_counter()
+        self.times.setdefault(stage, []).append(toc - self.tic)
+        self.tic = toc
+
+    def mean_ms(self):
+        # the first step warms up
+        return {
+            stage: 1000 * np.mean(times[1:])
+            for stage, times in self.times.items()
+        }
+
+
+def time_train(model, batch, n_batches, device):
+    img, img_metas, gt_bboxes, gt_labels = batch
+    model.train()
+    optimizer = torch.optim.SGD(model.parameters(), lr=1e-4)
+    timer = StageTimer(device)
+    for _ in range(n_batches + 1):
+        timer.start()
+        feats = model.extract_feat(img)
+        outs = model.bbox_head(feats)
+        timer.stop('train forward')
+        losses = model.bbox_head.loss(*outs, gt_bboxes, gt_labels, img_metas)
+        loss, _ = model._parse_losses(losses)
+        timer.stop('targets + loss')
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        timer.stop('backward + step')
+    return timer.mean_ms()
+
+
+def time_test(model, batch, n_batches, device):
+    img, img_metas = batch[:2]
+    model.eval()
+    timer = StageTimer(device)
+    with torch.no_grad():
+        for _ in range(n_batches + 1):
+            timer.start()
+            outs = model.bbox_head(model.extract_feat(img))
+            timer.stop('test forward')
+            model.bbox_head.get_bboxes(
+                *outs, img_metas=img_metas, rescale=True)
+            timer.stop('get_bboxes')
+    return timer.mean_ms()
+
+
+def main():
+    args = parse_args()
+    torch.manual_seed(0)
+    batch = make_batch(args.batch_size, args.img_size, args.n_puncta,
+                       args.device)
+    featmap_size = args.img_size // 8
+
+    results = dict()
+    for name in ('all levels', 'active levels'):
+        cfg = Config.fromfile(args.config)
+        cfg.model.backbone.init_cfg = None
+        if name == 'all levels':
+            cfg.model.neck.active_levels = None
+            cfg.model.bbox_head.active_levels = None
+        model = build_detector(cfg.model)
+        model.init_weights()
+        model = model.to(args.device)
+        prior_generator = model.bbox_head.prior_generator
+        featmap_sizes = [
+            (-(-featmap_size // 2**i), ) * 2
+            for i in range(prior_generator.num_levels)
+        ]
+        n_anchors = sum(
+            len(priors) for priors in prior_generator.grid_priors(
+                featmap_sizes, device=args.device))
+        times = time_train(model, batch, args.n_batches, args.device)
+        times.update(time_test(model, batch, args.n_batches, args.device))
+        results[name] = (prior_generator.num_levels, n_anchors, times)
+
+    (all_levels, all_anchors, all_times), (levels, anchors, times) = \
+        results['all levels'], results['active levels']
+    print(f'levels: {all_levels} -> {levels}, '
+          f'anchors per image: {all_anchors} -> {anchors}')
+    print(f'{"ms per batch":>16} {"all levels":>11} {"active":>9} '
+          f'{"saved":>7}')
+    for stage in all_times:
+        saved = 1 - times[stage] / all_times[stage]
+        print(f'{stage:>16} {all_times[stage]:>11.2f} {times[stage]:>9.2f} '
+              f'{saved:>7.1%}')
+    train_stages = ('train forward', 'targets + loss', 'backward + step')
+    all_iter = sum(all_times[stage] for stage in train_stages)
+    active_iter = sum(times[stage] for stage in train_stages)
+    print(f'{"train iteration":>16} {all_iter:>11.2f} {active_iter:>9.2f} '
+          f'{1 - active_iter / all_iter:>7.1%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from mmdet.ppal.datasets import ColorJitter, RandomRotate
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Per-transform time of the AL training augmentations '
+        'against the per-box / per-channel reference implementations')
+    parser.add_argument(
+        '--img-size', type=int, default=512, help='square image size')
+    parser.add_argument(
+        '--n-boxes', type=int, default=13, help='gt boxes per image')
+    parser.add_argument(
+        '--repeat', type=int, default=500, help='calls per measurement')
+    return parser.parse_args()
+
+
+def rotate_reference(results, level=10):
+    angle = np.random.uniform(-level, level)
+    img = results['img']
+    h, w = img.shape[:2]
+    M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1)
+    results['img'] = cv2.warpAffine(img, M, (w, h))
+    new_bboxes = []
+    for bbox in results['gt_bboxes']:
+        points = np.array([[bbox[0], bbox[1]], [bbox[2], bbox[1]],
+                           [bbox[2], bbox[3]], [bbox[0], bbox[3]]])
+        rotated_points = cv2.transform(np.array([points]), M)[0]
+        new_bboxes.append([
+            np.min(rotated_points[:, 0]),
+            np.min(rotated_points[:, 1]),
+            np.max(rotated_points[:, 0]),
+            np.max(rotated_points[:, 1])
+        ])
+    results['gt_bboxes'] = np.array(new_bboxes, dtype=np.float32)
+    return results
+
+
+def color_jitter_reference(results, brightness=0.2, contrast=0.2,
+                           saturation=0.2, hue=0.2):
+    h, s, v = cv2.split(cv2.cvtColor(results['img'], cv2.COLOR_BGR2HSV))
+    v = cv2.multiply(cv2.add(v, int(brightness * 255)), 1 + contrast)
+    s = cv2.multiply(s, 1 + saturation)
+    h = (h + int(hue * 180)) % 180
+    results['img'] = cv2.cvtColor(cv2.merge([h, s, v]), cv2.COLOR_HSV2BGR)
+    return results
+
+
+def timeit(transform, make_results, repeat):
+    inputs = [make_results() for _ in range(repeat)]
+    tic = time.perf_counter()
+    for results in inputs:
+        transform(results)
+    return (time.perf_counter() - tic) / repeat * 1e6
+
+
+def main():
+    args = parse_args()
+    rng = np.random.RandomState(0)
+    img = rng.randint(0, 256, (args.img_size, args.img_size, 3)).astype(
+        np.uint8)
+    bboxes = rng.uniform(0, args.img_size * 0.9,
+                         (args.n_boxes, 4)).astype(np.float32)
+    bboxes[:, 2:] = bboxes[:, :2] + rng.uniform(
+        2, args.img_size * 0.1, (args.n_boxes, 2))
+
+    def make_results():
+        return dict(img=img.copy(), gt_bboxes=bboxes.copy())
+
+    def boxes_only(rotate):
+        # the image warp is shared, time the box transform on its own
+        def transform(results):
+            results['img'] = img[:1, :1]
+            return rotate(results)
+        return transform
+
+    benchmarks = [
+        ('RandomRotate', rotate_reference, RandomRotate(prob=1.)),
+        ('RandomRotate (boxes)', boxes_only(rotate_reference),
+         boxes_only(RandomRotate(prob=1.))),
+        ('ColorJitter', color_jitter_reference, ColorJitter()),
+    ]
+    print(f'{"transform":<22} {"reference us":>13} {"vectorized us":>14} '
+          f'{"speedup":>8}')
+    for name, reference, vectorized in benchmarks:
+        ref_us = timeit(reference, make_results, args.repeat)
+        vec_us = timeit(vectorized, make_results, args.repeat)
+        print(f'{name:<22} {ref_us:>13.1f} {vec_us:>14.1f} '
+              f'{ref_us / vec_us:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import argparse
+import time
+
+import numpy as np
+import torch
+from mmcv import Config
+
+from mmdet.models import build_detector
+from mmdet.ppal.models import *  # noqa: F401,F403
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Images/s of AL uncertainty inference against the test '
+        'batch size, with per-image and batched post-processing')
+    parser.add_argument(
+        '--config',
+        default='configs/coco_active_learning/al_inference/'
+        'retinanet_uncertainty.py',
+        help='inference config with a RetinaHeadUncertainty head')
+    parser.add_argument(
+        '--batch-sizes',
+        type=int,
+        nargs='+',
+        default=[1, 2, 4, 8, 16, 32],
+        help='images per forward pass')
+    parser.add_argument(
+        '--n-images', type=int, default=128, help='images per measurement')
+    parser.add_argument(
+        '--img-size', type=int, default=128, help='square image size')
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument(
+        '--threads', type=int, default=None, help='torch CPU threads')
+    return parser.parse_args()
+
+
+def make_batch(batch_size, img_size, device):
+    img = torch.randn((batch_size, 3, img_size, img_size), device=device)
+    shape = (img_size, img_size, 3)
+    img_metas = [
+        dict(
+            img_shape=shape,
+            ori_shape=shape,
+            pad_shape=shape,
+            batch_input_shape=(img_size, img_size),
+            scale_factor=np.ones(4, dtype=np.float32),
+            flip=False) for _ in range(batch_size)
+    ]
+    return img, img_metas
+
+
+def run(model, batch_size, n_images, img_size, device):
+    img, img_metas = make_batch(batch_size, img_size, device)
+    n_batches = max(1, n_images // batch_size)
+    with torch.no_grad():
+        model.simple_test(img, img_metas, rescale=True)  # warm up
+        tic = time.perf_counter()
+        for _ in range(n_batches):
+            results = model.simple_test(img, img_metas, rescale=True)
+        elapsed = time.perf_counter() - tic
+    return n_batches * batch_size / elapsed, results
+
+
+def main():
+    args = parse_args()
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    cfg = Config.fromfile(args.config)
+    cfg.model.pretrained = None
+    cfg.model.train_cfg = None
+    model = build_detector(cfg.model, test_cfg=cfg.get('test_cfg'))
+    model.init_weights()
+    model = model.to(args.device).eval()
+    torch.manual_seed(0)
+
+    print(f'{"batch":>6} {"per-image img/s":>16} {"batched img/s":>14} '
+          f'{"same results":>13}')
+    for batch_size in args.batch_sizes:
+        model.bbox_head.batched_test = False
+        loop_ips, loop_results = run(model, batch_size, args.n_images,
+                                     args.img_size, args.device)
+        model.bbox_head.batched_test = True
+        batched_ips, batched_results = run(model, batch_size, args.n_images,
+                                           args.img_size, args.device)
+        same = all(
+            np.array_equal(a, b)
+            for loop_res, batched_res in zip(loop_results, batched_results)
+            for a, b in zip(loop_res, batched_res))
+        print(f'{batch_size:>6} {loop_ips:>16.1f} {batched_ips:>14.1f} '
+              f'{str(same):>13}')
+
+
+if __name__ == '__main__':
+    main()
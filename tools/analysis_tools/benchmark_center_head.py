@@ -0,0 +1,153 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import argparse
+import time
+
+import numpy as np
+import torch
+from mmcv import Config
+from mmcv.parallel import MMDataParallel
+from mmcv.runner import load_checkpoint
+
+from mmdet.apis import single_gpu_test
+from mmdet.datasets import build_dataloader, build_dataset
+from mmdet.models import build_detector
+from mmdet.ppal.datasets import *  # noqa: F401,F403
+from mmdet.ppal.models import *  # noqa: F401,F403
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Training and inference images/s of the centre heatmap '
+        'head against the RetinaNet head, and their validation accuracy '
+        'when checkpoints are given')
+    parser.add_argument(
+        '--configs',
+        nargs='+',
+        default=[
+            'configs/coco_active_learning/al_train/retinanet_26e.py',
+            'configs/coco_active_learning/al_train/puncta_center_26e.py'
+        ],
+        help='training configs to compare')
+    parser.add_argument(
+        '--checkpoints',
+        nargs='+',
+        default=None,
+        help='one checkpoint per config, evaluated on data.val')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument(
+        '--n-batches', type=int, default=20, help='batches per measurement')
+    parser.add_argument(
+        '--n-puncta', type=int, default=30, help='puncta per image')
+    parser.add_argument(
+        '--img-size', type=int, default=128, help='square image size')
+    parser.add_argument('--device', default='cuda:0')
+    return parser.parse_args()
+
+
+def make_batch(batch_size, img_size, n_puncta, device):
+    img = torch.randn((batch_size, 3, img_size, img_size), device=device)
+    shape = (img_size, img_size, 3)
+    img_metas = [
+        dict(
+            img_shape=shape,
+            ori_shape=shape,
+            pad_shape=shape,
+            batch_input_shape=(img_size, img_size),
+            scale_factor=np.ones(4, dtype=np.float32),
+            flip=False) for _ in range(batch_size)
+    ]
+    # fixed 11x11 puncta boxes, as bbox_creation.py draws them
+    gt_bboxes = []
+    for _ in range(batch_size):
+        xy = torch.rand((n_puncta, 2), device=device) * (img_size - 11)
+        gt_bboxes.append(torch.cat([xy, xy + 11], dim=1))
+    gt_labels = [
+        torch.zeros(n_puncta, dtype=torch.long, device=device)
+        for _ in range(batch_size)
+    ]
+    return img, img_metas, gt_bboxes, gt_labels
+
+
+def synchronize(device):
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+
+
+def time_train(model, batch, n_batches, device):
+    img, img_metas, gt_bboxes, gt_labels = batch
+    model.train()
+    optimizer = torch.optim.SGD(model.parameters(), lr=1e-4)
+    times = []
+    for i in range(n_batches + 1):
+        synchronize(device)
+        tic = time.perf_counter()
+        losses = model.forward_train(img, img_metas, gt_bboxes, gt_labels)
+        loss, _ = model._parse_losses(losses)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        synchronize(device)
+        if i > 0:  # the first step warms up
+            times.append(time.perf_counter() - tic)
+    return len(img) / np.mean(times)
+
+
+def time_test(model, batch, n_batches, device):
+    img, img_metas = batch[:2]
+    model.eval()
+    times = []
+    with torch.no_grad():
+        for i in range(n_batches + 1):
+            synchronize(device)
+            tic = time.perf_counter()
+            model.simple_test(img, img_metas, rescale=True)
+            synchronize(device)
+            if i > 0:
+                times.append(time.perf_counter() - tic)
+    return len(img) / np.mean(times)
+
+
+def evaluate(model, cfg, checkpoint):
+    load_checkpoint(model, checkpoint, map_location='cpu')
+    cfg.data.val.test_mode = True
+    dataset = build_dataset(cfg.data.val)
+    data_loader = build_dataloader(
+        dataset,
+        samples_per_gpu=1,
+        workers_per_gpu=cfg.data.workers_per_gpu,
+        dist=False,
+        shuffle=False)
+    model = MMDataParallel(model.eval(), device_ids=[0])
+    outputs = single_gpu_test(model, data_loader)
+    return dataset.evaluate(
+        outputs, metric=['bbox_fast', 'point'], logger='silent')
+
+
+def main():
+    args = parse_args()
+    assert args.checkpoints is None or \
+        len(args.checkpoints) == len(args.configs)
+    torch.manual_seed(0)
+    batch = make_batch(args.batch_size, args.img_size, args.n_puncta,
+                       args.device)
+
+    print(f'{"head":>28} {"train img/s":>12} {"test img/s":>11} '
+          f'{"bbox_mAP":>9} {"point_F1":>9}')
+    for i, config in enumerate(args.configs):
+        cfg = Config.fromfile(config)
+        cfg.model.backbone.init_cfg = None
+        model = build_detector(cfg.model)
+        model.init_weights()
+        model = model.to(args.device)
+        train_ips = time_train(model, batch, args.n_batches, args.device)
+        test_ips = time_test(model, batch, args.n_batches, args.device)
+        metrics = dict()
+        if args.checkpoints is not None:
+            metrics = evaluate(model, cfg, args.checkpoints[i])
+        print(f'{cfg.model.bbox_head.type:>28} {train_ips:>12.1f} '
+              f'{test_ips:>11.1f} {metrics.get("bbox_mAP", np.nan):>9.3f} '
+              f'{metrics.get("point_F1", np.nan):>9.3f}')
+
+
+if __name__ == '__main__':
+    main()
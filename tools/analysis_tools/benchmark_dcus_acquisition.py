@@ -0,0 +1,146 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import argparse
+import json
+import os.path as osp
+import tempfile
+import time
+
+import numpy as np
+
+from mmdet.ppal.sampler import DCUSSampler
+from mmdet.ppal.utils.al_results import (al_results2json, load_al_results,
+                                         save_al_results)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Time the vectorized DCUSSampler acquisition on a '
+        'synthetic result set')
+    parser.add_argument(
+        '--n-images', type=int, default=100000, help='image pool size')
+    parser.add_argument(
+        '--n-boxes', type=int, default=10000000, help='number of detections')
+    parser.add_argument(
+        '--n-sample', type=int, default=1000, help='images to select')
+    parser.add_argument(
+        '--labeled-ratio',
+        type=float,
+        default=0.1,
+        help='fraction of the pool already labeled')
+    parser.add_argument(
+        '--loop-boxes',
+        type=int,
+        default=200000,
+        help='detections timed with the per-box loop, extrapolated to '
+        '--n-boxes; 0 to skip')
+    return parser.parse_args()
+
+
+def make_pool(tmp_dir, n_images, n_boxes, labeled_ratio, rng):
+    img_ids = rng.permutation(n_images) + 1
+    sizes = rng.randint(256, 1024, (n_images, 2))
+    oracle = dict(
+        images=[
+            dict(id=int(i), width=int(w), height=int(h))
+            for i, (w, h) in zip(img_ids, sizes)
+        ],
+        annotations=[
+            dict(id=1, image_id=int(img_ids[0]), category_id=1,
+                 bbox=[0, 0, 1, 1])
+        ],
+        categories=[dict(id=1, name='puncta')])
+    n_labeled = int(n_images * labeled_ratio)
+    labeled = dict(images=oracle['images'][:n_labeled])
+
+    det_img_ids = rng.choice(img_ids[n_labeled:], n_boxes)
+    xy = rng.uniform(0, 1024, (n_boxes, 2))
+    wh = rng.uniform(4, 64, (n_boxes, 2))
+    results = dict(
+        image_id=det_img_ids.astype(np.int64),
+        bbox=np.concatenate((xy, wh), axis=1),
+        score=rng.uniform(0, 1, n_boxes).astype(np.float32),
+        category_id=np.ones(n_boxes, dtype=np.int64),
+        cls_uncertainty=rng.uniform(0, 1, n_boxes).astype(np.float32),
+        box_uncertainty=np.zeros(n_boxes, dtype=np.float32))
+
+    paths = dict(
+        oracle=osp.join(tmp_dir, 'oracle.json'),
+        labeled=osp.join(tmp_dir, 'labeled.json'),
+        results=osp.join(tmp_dir, 'results.bbox.npz'))
+    with open(paths['oracle'], 'w') as f:
+        json.dump(oracle, f)
+    with open(paths['labeled'], 'w') as f:
+        json.dump(labeled, f)
+    save_al_results(paths['results'], results)
+    return paths, results
+
+
+def loop_image_uncertainty(sampler, json_results, class_weights):
+    """Per-box reference, as the acquisition was written before."""
+    image_uncertainties = dict()
+    for res in json_results:
+        img_id = res['image_id']
+        img_size = sampler.oracle_img_sizes[sampler.image_inds([img_id])[0]]
+        if not sampler.is_box_valid(res['bbox'], tuple(img_size)):
+            continue
+        if res['score'] < sampler.score_thr:
+            continue
+        label = res['category_id']
+        if label not in class_weights:
+            continue
+        image_uncertainties.setdefault(img_id, [0.]).append(
+            float(res['cls_uncertainty']) * class_weights[label])
+    return {k: np.array(v).sum() for k, v in image_uncertainties.items()}
+
+
+def main():
+    args = parse_args()
+    rng = np.random.RandomState(0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths, results = make_pool(tmp_dir, args.n_images, args.n_boxes,
+                                   args.labeled_ratio, rng)
+        sampler = DCUSSampler(
+            args.n_sample,
+            paths['oracle'],
+            score_thr=0.3,
+            class_weight_ub=0.2,
+            class_weight_alpha=0.3,
+            dataset_type='coco')
+        class_weights = sampler._get_classwise_weight(paths['results'])
+
+        tic = time.perf_counter()
+        load_al_results(paths['results'])
+        load_time = time.perf_counter() - tic
+        tic = time.perf_counter()
+        sampler.image_uncertainty(results, class_weights)
+        reduce_time = time.perf_counter() - tic
+        tic = time.perf_counter()
+        sampler.al_acquisition(paths['results'], paths['labeled'])
+        total_time = time.perf_counter() - tic
+
+        print(f'images: {args.n_images}, boxes: {args.n_boxes}')
+        print(f'load npz:           {load_time:8.3f} s')
+        print(f'validate + reduce:  {reduce_time:8.3f} s')
+        print(f'full acquisition:   {total_time:8.3f} s')
+
+        n_loop = min(args.loop_boxes, args.n_boxes)
+        if n_loop > 0:
+            prefix = {k: v[:n_loop] for k, v in results.items()}
+            json_results = al_results2json(prefix)
+            tic = time.perf_counter()
+            loop_image_uncertainty(sampler, json_results, class_weights)
+            loop_time = (time.perf_counter() - tic) * args.n_boxes / n_loop
+            vec = sampler.image_uncertainty(prefix, class_weights)
+            ref = loop_image_uncertainty(sampler, json_results,
+                                         class_weights)
+            ref_ids = np.array(list(ref.keys()), dtype=np.int64)
+            close = np.allclose(vec[sampler.image_inds(ref_ids)],
+                                list(ref.values()))
+            print(f'per-box loop:       {loop_time:8.3f} s '
+                  f'(extrapolated from {n_loop} boxes)')
+            print(f'speedup (reduce):   {loop_time / reduce_time:8.1f}x, '
+                  f'matches loop: {close}')
+
+
+if __name__ == '__main__':
+    main()
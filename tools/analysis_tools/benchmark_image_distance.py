@@ -0,0 +1,92 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import argparse
+import time
+
+import torch
+
+from mmdet.ppal.models.utils import (get_img_score_distance_matrix_slow,
+                                     get_img_score_distance_matrix_tiled)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Compare the per-image and tiled image distance engines')
+    parser.add_argument(
+        '--pool-sizes',
+        type=int,
+        nargs='+',
+        default=[100, 200, 400, 800],
+        help='number of images in the synthetic diversity pool')
+    parser.add_argument(
+        '--max-det', type=int, default=100, help='detections per image')
+    parser.add_argument(
+        '--feat-dim', type=int, default=256, help='embedding dimension')
+    parser.add_argument(
+        '--valid-ratio',
+        type=float,
+        default=0.15,
+        help='average fraction of detections above the score threshold')
+    parser.add_argument(
+        '--metric', default='cosine', choices=['cosine', 'kl'])
+    parser.add_argument(
+        '--block-memory-mb',
+        type=float,
+        default=256,
+        help='memory budget of one tile of the tiled engine')
+    parser.add_argument(
+        '--skip-slow',
+        action='store_true',
+        help='only time the tiled engine, e.g. for very large pools')
+    return parser.parse_args()
+
+
+def make_pool(n_images, max_det, feat_dim, valid_ratio, metric):
+    labels = torch.zeros((n_images, max_det))
+    # NMS output is sorted by score, so valid detections form a prefix
+    # whose length varies from image to image
+    scores = torch.rand((n_images, max_det)) * 0.5
+    n_valid = torch.randint(1, int(2 * valid_ratio * max_det) + 1,
+                            (n_images, 1))
+    scores += 0.5 * (torch.arange(max_det)[None, :] < n_valid)
+    scores = scores.sort(dim=1, descending=True)[0]
+    feats = torch.randn((n_images, max_det, feat_dim))
+    if metric == 'kl':
+        feats = feats.softmax(dim=-1)
+    return labels, scores, feats
+
+
+def main():
+    args = parse_args()
+    torch.manual_seed(0)
+    same_label = args.metric != 'kl'
+    print(f'{"images":>8} {"slow (s)":>10} {"tiled (s)":>10} '
+          f'{"speedup":>8} {"equal":>6}')
+    for n_images in args.pool_sizes:
+        labels, scores, feats = make_pool(n_images, args.max_det,
+                                          args.feat_dim, args.valid_ratio,
+                                          args.metric)
+        kwargs = dict(
+            score_thr=0.5, same_label=same_label,
+            metric=args.metric)
+
+        tic = time.perf_counter()
+        tiled = get_img_score_distance_matrix_tiled(
+            labels, scores, feats, block_memory_mb=args.block_memory_mb,
+            **kwargs)
+        tiled_time = time.perf_counter() - tic
+
+        if args.skip_slow:
+            print(f'{n_images:>8} {"-":>10} {tiled_time:>10.3f} '
+                  f'{"-":>8} {"-":>6}')
+            continue
+        tic = time.perf_counter()
+        slow = get_img_score_distance_matrix_slow(labels, scores, feats,
+                                                  **kwargs)
+        slow_time = time.perf_counter() - tic
+        print(f'{n_images:>8} {slow_time:>10.3f} {tiled_time:>10.3f} '
+              f'{slow_time / tiled_time:>8.2f} '
+              f'{str(torch.equal(slow, tiled)):>6}')
+
+
+if __name__ == '__main__':
+    main()
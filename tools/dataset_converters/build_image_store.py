@@ -0,0 +1,45 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import argparse
+import os.path as osp
+
+import mmcv
+
+from mmdet.ppal.utils.image_store import PackedImageStore, write_image_store
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Decode the images of a COCO annotation file into a '
+        'packed image store for LoadImageFromStore')
+    parser.add_argument('ann_file', help='COCO annotation json')
+    parser.add_argument('img_prefix', help='directory of the images')
+    parser.add_argument(
+        'out', help='store prefix, writes <out>.bin and <out>.idx.npz')
+    parser.add_argument(
+        '--color-type',
+        default='color',
+        help='flag of mmcv.imfrombytes, must match the color_type of the '
+        'loading stage')
+    return parser.parse_args()
+
+
+def iter_images(images, img_prefix, color_type):
+    file_client = mmcv.FileClient(backend='disk')
+    for info in mmcv.track_iter_progress(images):
+        path = osp.join(img_prefix, info['file_name'])
+        img = mmcv.imfrombytes(file_client.get(path), flag=color_type)
+        yield info['id'], path, img
+
+
+def main():
+    args = parse_args()
+    images = mmcv.load(args.ann_file)['images']
+    n_images = write_image_store(
+        args.out, iter_images(images, args.img_prefix, args.color_type))
+    store = PackedImageStore(args.out)
+    print(f'\n{n_images} images, {store.offsets[-1] / 1024 ** 2:.1f} MB '
+          f'written to {args.out}.bin')
+
+
+if __name__ == '__main__':
+    main()
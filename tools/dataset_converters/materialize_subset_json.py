@@ -0,0 +1,22 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import argparse
+
+from mmdet.ppal.utils.coco_index import materialize_json
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Write the COCO json of an AL label set kept as a '
+        'subset file (annotation_format = \'subset\')')
+    parser.add_argument('ann_file', help='<name>.subset.npz (or a json)')
+    parser.add_argument('out', help='output json')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    materialize_json(args.ann_file, args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,8 +4,14 @@ from mmcv import Config
 
 from mmdet.ppal.sampler import  *
 from mmdet.ppal.builder import builder_al_sampler
+from mmdet.ppal.utils.al_results import dump_al_results, load_al_results
+from mmdet.ppal.utils.coco_index import SUBSET_SUFFIX, convert_to_subset, load_coco_index
+from mmdet.ppal.utils.inference_cache import InferenceCache, run_cached_inference
+from mmdet.ppal.utils.warm_start import warm_start_config
 from mmdet.ppal.utils.running_checks import (
     display_latest_results,
+    display_time_to_accuracy,
+    get_round_checkpoint,
     command_with_time,
     sys_echo
 )
@@ -15,6 +21,7 @@ parser = argparse.ArgumentParser(description='Active learning arguments')
 parser.add_argument('--config', required=True, type=str, help='active learning config')
 parser.add_argument('--resume', required=False, type=bool, default=False, help='whether to resume training')
 parser.add_argument('--model', required=True, type=str, help='running model')
+parser.add_argument('--in-process', action='store_true', help='run every stage in this process (mmdet.ppal.apis.ALRunner)')
 args = parser.parse_args()
 
 cfg = Config.fromfile(args.config)
@@ -26,6 +33,8 @@ sys_echo('\n')
 print(f"Output directory is set to: {cfg.get('output_dir')}")
 
 PYTHON = cfg.get('python_path', 'python')
+# 'subset' keeps the label sets of the rounds as image bitmaps over the oracle json (see save_index_subset)
+ANN_SUFFIX = SUBSET_SUFFIX if cfg.get('annotation_format', 'json') == 'subset' else '.json'
 
 def get_start_round():
     start_round = 0
@@ -36,16 +45,13 @@ def get_start_round():
             k = 0
             while k < cfg.get('round_num'):
                 round_work_dir = os.path.join(cfg.get('output_dir'), 'round%d' % (k + 1))
-                if os.path.isfile(os.path.join(round_work_dir, 'annotations', 'new_labeled.json')):
+                if os.path.isfile(os.path.join(round_work_dir, 'annotations', 'new_labeled' + ANN_SUFFIX)):
                     k += 1
                 else:
                     break
             start_round = k
     return start_round
 
-uncertainty_sampler = builder_al_sampler(cfg.uncertainty_sampler_config)
-diversity_sampler = builder_al_sampler(cfg.diversity_sampler_config)
-
 def run(round, run_al):
     last_round_work_dir                     = os.path.join(cfg.get('output_dir'), 'round%d'%(round-1))
     round_work_dir                          = os.path.join(cfg.get('output_dir'), 'round%d'%round)
@@ -53,87 +59,130 @@ def run(round, run_al):
     print(f"Last round work dir: {last_round_work_dir}")
     print(f"Current round work dir: {round_work_dir}")
 
-    round_labeled_json                      = os.path.join(round_work_dir, 'annotations', 'labeled.json')
-    round_unlabeled_json                    = os.path.join(round_work_dir, 'annotations', 'unlabeled.json')
+    round_labeled_json                      = os.path.join(round_work_dir, 'annotations', 'labeled' + ANN_SUFFIX)
+    round_unlabeled_json                    = os.path.join(round_work_dir, 'annotations', 'unlabeled' + ANN_SUFFIX)
     round_eval_log                          = os.path.join(round_work_dir, 'eval.txt')
 
     print(f"Round labeled JSON: {round_labeled_json}")
     print(f"Round unlabeled JSON: {round_unlabeled_json}")
     print(f"Evaluation log path: {round_eval_log}")
 
+    # 'npz' writes columnar AL results (.bbox.npz) instead of the COCO .bbox.json
+    result_format                           = cfg.get('result_format', 'json')
+    result_suffix                           = '.bbox.npz' if result_format == 'npz' else '.bbox.json'
+
     round_uncertainty_inference_json_prefix = os.path.join(round_work_dir, 'unlabeled_inference_result')
-    round_uncertainty_inference_json        = os.path.join(round_work_dir, 'unlabeled_inference_result.bbox.json')
-    round_uncertainty_new_labeled_json      = os.path.join(round_work_dir, 'annotations', 'uncertainty_new_labeled.json')
-    round_uncertainty_new_unlabeled_json    = os.path.join(round_work_dir, 'annotations', 'uncertainty_new_unlabeled.json')
+    round_uncertainty_inference_json        = os.path.join(round_work_dir, 'unlabeled_inference_result' + result_suffix)
+    round_uncertainty_new_labeled_json      = os.path.join(round_work_dir, 'annotations', 'uncertainty_new_labeled' + ANN_SUFFIX)
+    round_uncertainty_new_unlabeled_json    = os.path.join(round_work_dir, 'annotations', 'uncertainty_new_unlabeled' + ANN_SUFFIX)
 
-    round_diversity_image_dis_npy           = os.path.join(round_work_dir, 'image_dis.npy')
+    round_diversity_image_dis               = diversity_sampler.image_dis_path(round_work_dir)
     round_diversity_inference_json_prefix   = os.path.join(round_work_dir, 'diversity_inference_result')
-    round_diversity_inference_json          = os.path.join(round_work_dir, 'diversity_inference_result.bbox.json')
-    round_diversity_new_labeled_json        = os.path.join(round_work_dir, 'annotations', 'new_labeled.json')
-    round_diversity_new_unlabeled_json      = os.path.join(round_work_dir, 'annotations', 'new_unlabeled.json')
+    round_diversity_inference_json          = os.path.join(round_work_dir, 'diversity_inference_result' + result_suffix)
+    round_diversity_new_labeled_json        = os.path.join(round_work_dir, 'annotations', 'new_labeled' + ANN_SUFFIX)
+    round_diversity_new_unlabeled_json      = os.path.join(round_work_dir, 'annotations', 'new_unlabeled' + ANN_SUFFIX)
+
+    round_fused_feat_cache                  = os.path.join(round_work_dir, 'unlabeled_feat_cache.npz')
+    fused_inference                         = cfg.get('fused_inference', False)
+
+    # the fused config yields uncertainties and diversity embeddings in one pass over the unlabeled set
+    unlabeled_infer_config = cfg.get('fused_infer_config') if fused_inference else cfg.get('uncertainty_infer_config')
+
+    # rounds after the first continue from the previous round with their own config, see warm_start_config
+    warm_start                              = round > 1 and cfg.get('warm_start', None) is not None
+    round_train_config                      = os.path.join(round_work_dir, 'warm_start_config.py') if warm_start else cfg.get('train_config')
 
     train_command = '%s -m torch.distributed.launch '%PYTHON + \
                     ' --nproc_per_node=%d ' % int(cfg.get('gpus')) + \
                     ' --master_port=%d ' % int(cfg.get('port')) + \
                     ' tools/train.py ' + \
-                    ' %s ' % cfg.get('train_config') + \
+                    ' %s ' % round_train_config + \
                     ' --work-dir %s ' % round_work_dir + \
                     ' --launcher pytorch ' + \
-                    ' --cfg-options labeled_data=%s unlabeled_data=%s data.train.ann_file=%s' % (round_labeled_json, round_unlabeled_json, round_labeled_json)
-
-    eval_command = '%s -m torch.distributed.launch '%PYTHON + \
-                   ' --nproc_per_node=%d ' % int(cfg.get('gpus')) + \
-                   ' --master_port=%d ' % int(cfg.get('port')) + \
-                   ' tools/test.py ' + \
-                   ' %s ' % cfg.get('train_config') + \
-                   ' %s ' % os.path.join(round_work_dir, 'latest.pth') + \
-                   ' --work-dir %s ' % round_work_dir + \
-                   ' --launcher pytorch ' + \
-                   ' --eval bbox --eval-option \"classwise=True\" ' + \
-                   ' > %s' % round_eval_log
-
-    unlabeled_infer_command = '%s -m torch.distributed.launch '%PYTHON + \
-                              ' --nproc_per_node=%d ' % int(cfg.get('gpus')) + \
-                              ' --master_port=%d ' % int(cfg.get('port')) + \
-                              ' tools/test.py ' + \
-                              ' %s ' % cfg.get('uncertainty_infer_config') + \
-                              ' %s ' % os.path.join(round_work_dir, 'latest.pth') + \
-                              ' --work-dir %s ' % round_work_dir + \
-                              ' --launcher pytorch ' + \
-                              ' --format-only ' + \
-                              ' --eval-options \"jsonfile_prefix=%s\"' % round_uncertainty_inference_json_prefix +\
-                              ' --cfg-options unlabeled_data=%s data.test.ann_file=%s' % (round_unlabeled_json, round_unlabeled_json)
+                    ' --cfg-options labeled_data=%s unlabeled_data=%s' % (round_labeled_json, round_unlabeled_json) + \
+                    ('' if warm_start else ' data.train.ann_file=%s' % round_labeled_json)
 
     if args.model == 'fasterrcnn':
         head = 'roi_head'
     else:
         head = 'bbox_head'
 
+    def unlabeled_infer(ann_file, jsonfile_prefix, feat_cache_path=None):
+        unlabeled_infer_command = '%s -m torch.distributed.launch '%PYTHON + \
+                                  ' --nproc_per_node=%d ' % int(cfg.get('gpus')) + \
+                                  ' --master_port=%d ' % int(cfg.get('port')) + \
+                                  ' tools/test.py ' + \
+                                  ' %s ' % unlabeled_infer_config + \
+                                  ' %s ' % round_checkpoint + \
+                                  ' --work-dir %s ' % round_work_dir + \
+                                  ' --launcher pytorch ' + \
+                                  ' --format-only ' + \
+                                  ' --eval-options \"jsonfile_prefix=%s\" result_format=%s' % (jsonfile_prefix, result_format) +\
+                                  ' --cfg-options unlabeled_data=%s data.test.ann_file=%s' % (ann_file, ann_file)
+        if feat_cache_path is not None:
+            n_unlabeled = len(load_coco_index(ann_file))
+            n_gpus = int(cfg.get('gpus'))
+            # the distributed test sampler pads the dataset to a multiple of the GPU count
+            unlabeled_infer_command += ' model.%s.total_images=%d ' % (head, (n_unlabeled + n_gpus - 1) // n_gpus * n_gpus) + \
+                                       ' model.%s.output_path=\"%s\" ' % (head, feat_cache_path)
+        command_with_time(unlabeled_infer_command, 'Inference on unlabeled data')
+
     os.system('mkdir -p %s' % os.path.join(round_work_dir, 'annotations'))
     if round == 1:
-        os.system('cp %s %s' % (cfg.get('init_label_json'), round_labeled_json))
-        os.system('cp %s %s' % (cfg.get('init_unlabeled_json'), round_unlabeled_json))
+        if ANN_SUFFIX == SUBSET_SUFFIX:
+            convert_to_subset(cfg.get('init_label_json'), round_labeled_json, cfg.get('oracle_path'))
+            convert_to_subset(cfg.get('init_unlabeled_json'), round_unlabeled_json, cfg.get('oracle_path'), with_annotations=False)
+        else:
+            os.system('cp %s %s' % (cfg.get('init_label_json'), round_labeled_json))
+            os.system('cp %s %s' % (cfg.get('init_unlabeled_json'), round_unlabeled_json))
         if cfg.get('init_model', None) is not None:
             os.system('cp %s %s'%(cfg.get('init_model'),os.path.join(round_work_dir, 'latest.pth')))
         else:
             command_with_time(train_command, 'Training')
         if cfg.get('init_inference_results', None) is not None:
-            os.system('cp %s %s'%(cfg.get('init_inference_results'), round_uncertainty_inference_json))
+            dump_al_results(round_uncertainty_inference_json, load_al_results(cfg.get('init_inference_results')))
     else:
         if args.resume and os.path.isfile(os.path.join(round_work_dir, 'latest.pth')) :
             pass
         else:
-            os.system('cp %s %s' % (os.path.join(last_round_work_dir, 'annotations', 'new_labeled.json'), round_labeled_json))
-            os.system('cp %s %s' % (os.path.join(last_round_work_dir, 'annotations', 'new_unlabeled.json'), round_unlabeled_json))
+            os.system('cp %s %s' % (os.path.join(last_round_work_dir, 'annotations', 'new_labeled' + ANN_SUFFIX), round_labeled_json))
+            os.system('cp %s %s' % (os.path.join(last_round_work_dir, 'annotations', 'new_unlabeled' + ANN_SUFFIX), round_unlabeled_json))
+            if warm_start:
+                warm_start_config(Config.fromfile(cfg.get('train_config')), round_labeled_json,
+                                  os.path.join(last_round_work_dir, 'annotations', 'labeled' + ANN_SUFFIX),
+                                  get_round_checkpoint(last_round_work_dir), **cfg.warm_start).dump(round_train_config)
             command_with_time(train_command, 'Training')
 
+    # best.pth if EarlyStoppingHook kept one, for evaluation and both inference passes
+    round_checkpoint = get_round_checkpoint(round_work_dir)
+    eval_command = '%s -m torch.distributed.launch '%PYTHON + \
+                   ' --nproc_per_node=%d ' % int(cfg.get('gpus')) + \
+                   ' --master_port=%d ' % int(cfg.get('port')) + \
+                   ' tools/test.py ' + \
+                   ' %s ' % cfg.get('train_config') + \
+                   ' %s ' % round_checkpoint + \
+                   ' --work-dir %s ' % round_work_dir + \
+                   ' --launcher pytorch ' + \
+                   ' --eval bbox --eval-option \"classwise=True\" ' + \
+                   ' > %s' % round_eval_log
+
     if not (os.path.isfile(round_eval_log) and args.resume):
         command_with_time(eval_command, 'Evaluation round %d'%round)
     display_latest_results(cfg.get('output_dir'), round, os.path.join(cfg.get('output_dir'), 'eval_results.txt'))
+    display_time_to_accuracy(cfg.get('output_dir'), round, cfg.get('cold_start_dir', None), os.path.join(cfg.get('output_dir'), 'time_to_accuracy.txt'))
 
     if run_al:
-        if not (os.path.isfile(round_uncertainty_inference_json) and args.resume):
-            command_with_time(unlabeled_infer_command, 'Inference on unlabeled data')
+        unlabeled_infer_done = os.path.isfile(round_uncertainty_inference_json) and \
+                               (os.path.isfile(round_fused_feat_cache) or not fused_inference)
+        if not (unlabeled_infer_done and args.resume):
+            feat_cache_path = round_fused_feat_cache if fused_inference else None
+            if inference_cache is not None:
+                # only images missing from the cache of this checkpoint and config are inferred
+                cache_key = inference_cache.make_key(round_checkpoint, Config.fromfile(unlabeled_infer_config))
+                run_cached_inference(inference_cache, cache_key, round_unlabeled_json, round_uncertainty_inference_json_prefix,
+                                     unlabeled_infer, feat_cache_path, result_format)
+            else:
+                unlabeled_infer(round_unlabeled_json, round_uncertainty_inference_json_prefix, feat_cache_path)
         if not (os.path.isfile(round_uncertainty_new_labeled_json) and args.resume):
             uncertainty_sampler.al_round(round_uncertainty_inference_json, round_labeled_json, round_uncertainty_new_labeled_json, round_uncertainty_new_unlabeled_json)
 
@@ -147,27 +196,42 @@ def run(round, run_al):
                                   ' --master_port=%d ' % int(cfg.get('port')) + \
                                   ' tools/test.py ' + \
                                   ' %s ' % cfg.get('diversity_infer_config') + \
-                                  ' %s ' % os.path.join(round_work_dir, 'latest.pth') + \
+                                  ' %s ' % round_checkpoint + \
                                   ' --work-dir %s ' % round_work_dir + \
                                   ' --launcher pytorch ' + \
                                   ' --format-only ' + \
-                                  ' --eval-options \"jsonfile_prefix=%s\"' % round_diversity_inference_json_prefix + \
+                                  ' --eval-options \"jsonfile_prefix=%s\" result_format=%s' % (round_diversity_inference_json_prefix, result_format) + \
                                   ' --cfg-options unlabeled_data=%s data.test.ann_file=%s' % (round_uncertainty_new_labeled_json, round_uncertainty_new_labeled_json) + \
                                   ' model.%s.total_images=%d ' % (head, pool_size_round) + \
-                                  ' model.%s.output_path=\"%s\" ' % (head, round_diversity_image_dis_npy)
-
-        if not (os.path.isfile(round_diversity_image_dis_npy) and args.resume):
-            command_with_time(diversity_infer_command, 'Inference on diversity data')
+                                  ' model.%s.output_path=\"%s\" ' % (head, round_diversity_image_dis)
+        distance_cache = cfg.get('distance_cache', None)
+        if distance_cache is not None:
+            diversity_infer_command += ''.join(' model.%s.distance_cache.%s=%s ' % (head, k, v) for k, v in distance_cache.items())
+
+        if not (os.path.isfile(round_diversity_image_dis) and args.resume):
+            if fused_inference:
+                diversity_sampler.image_dis_from_cache(round_fused_feat_cache, round_uncertainty_new_labeled_json, round_diversity_image_dis)
+            else:
+                command_with_time(diversity_infer_command, 'Inference on diversity data')
         if not (os.path.isfile(round_diversity_new_labeled_json) and args.resume):
-            diversity_sampler.al_round(round_uncertainty_inference_json, round_diversity_image_dis_npy, round_labeled_json, round_diversity_new_labeled_json, round_diversity_new_unlabeled_json)
+            diversity_sampler.al_round(round_uncertainty_inference_json, round_diversity_image_dis, round_labeled_json, round_diversity_new_labeled_json, round_diversity_new_unlabeled_json)
 
-        # delete inference results because they are too large
+        # delete inference results because they are too large, reruns are served by inference_cache if configured
         os.system('rm -f %s' % round_uncertainty_inference_json)
         os.system('rm -f %s' % round_diversity_inference_json)
-        os.system('rm -f %s' % round_diversity_image_dis_npy)
+        os.system('rm -f %s' % round_diversity_image_dis)
+        os.system('rm -f %s' % round_fused_feat_cache)
 
 
 if __name__ == '__main__':
+    if args.in_process:
+        from mmdet.ppal.apis import ALRunner
+        ALRunner(args.config, model_type=args.model, resume=args.resume).run()
+        sys.exit(0)
+
+    uncertainty_sampler = builder_al_sampler(cfg.uncertainty_sampler_config)
+    diversity_sampler = builder_al_sampler(cfg.diversity_sampler_config, dict(fused_inference=cfg.get('fused_inference', False)))
+    inference_cache = InferenceCache(**cfg.inference_cache) if cfg.get('inference_cache', None) else None
     start_round = get_start_round()
     os.system('mkdir -p %s' % cfg.get('output_dir'))
     os.system('cp %s %s' % (args.config, os.path.join(cfg.get('output_dir'), os.path.split(args.config)[-1])))
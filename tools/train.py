@@ -20,6 +20,7 @@ from mmdet.models import build_detector
 from mmdet.utils import collect_env, get_root_logger
 
 from mmdet.ppal.datasets import *
+from mmdet.ppal.hooks import *
 from mmdet.ppal.models import *
 
 def parse_args():